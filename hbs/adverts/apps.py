@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AdvertsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'adverts'
+
+    def ready(self):
+        import adverts.signals  # Connect the version signals
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adverts', '0002_initial'),
+        ('userManager', '0002_organization_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='advert',
+            index=models.Index(fields=['created_at', 'id'], name='advert_created_id'),
+        ),
+    ]
@@ -51,3 +51,4 @@ class Advert(models.Model):
         verbose_name = "Advert"
         verbose_name_plural = "Adverts"
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['created_at', 'id'], name='advert_created_id')]  # Keyset pagination
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from products.versions import bump_versions
+from .models import Advert
+
+
+@receiver(post_save, sender=Advert)
+@receiver(post_delete, sender=Advert)
+def bump_advert_version(sender, **kwargs):
+    """
+    Invalidate the ETags of advert reads.
+    """
+    bump_versions('adverts')
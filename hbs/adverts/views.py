@@ -3,15 +3,18 @@ from rest_framework import viewsets
 from rest_framework.permissions import AllowAny
 from .models import Advert
 from .serializers import AdvertSerializer
+from products.versions import VersionedReadMixin
 
-class AdvertViewSet(viewsets.ModelViewSet):
+class AdvertViewSet(VersionedReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing Advert objects.
     Supports all CRUD operations for adverts.
+    Anonymous reads carry ETags and can be revalidated.
     """
     queryset = Advert.objects.all()
     serializer_class = AdvertSerializer
     permission_classes = [AllowAny]
+    version_resources = ('adverts',)
 
     # def get_queryset(self):
     #     """
@@ -0,0 +1,157 @@
+import base64
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def positive_int(value, cutoff=None):
+    """
+    Parse a strictly positive integer query parameter.
+
+    Args:
+        value (str): The raw parameter.
+        cutoff (int): Largest value returned; larger values are capped to it.
+
+    Returns:
+        int: The parsed value.
+
+    Raises:
+        ValueError: If the value is not an integer above zero.
+    """
+    number = int(value)
+    if number <= 0:
+        raise ValueError(f"Expected a positive integer, got {value!r}.")
+    return min(number, cutoff) if cutoff else number
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on the values of the ordering columns.
+
+    A page is fetched with ``WHERE (ordering columns) > (last row's values)``
+    instead of an OFFSET, so deep pages cost the same as the first one when
+    the ordering columns are indexed. The ordering always ends with the
+    primary key, which makes the key unique even when the leading columns
+    (e.g. an order date) are shared by many rows.
+
+    Views choose the ordering with a ``keyset_ordering`` attribute and
+    otherwise use the model's ``Meta.ordering``, or the primary key.
+
+    Query parameters: `cursor` (opaque, from the `next` / `previous` links)
+    and `page_size` (at most 200).
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        from rest_framework.settings import api_settings
+
+        self.page_size = api_settings.PAGE_SIZE or 50
+
+    def get_page_size(self, request):
+        try:
+            return positive_int(request.query_params[self.page_size_query_param], cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_ordering(self, queryset, view):
+        """Ordering columns of the keyset, always ending with the primary key."""
+        pk_name = queryset.model._meta.pk.name
+        ordering = [
+            field.replace('pk', pk_name) if field.lstrip('-') == 'pk' else field
+            for field in getattr(view, 'keyset_ordering', None) or queryset.model._meta.ordering or ['pk']
+        ]
+        if not any(field.lstrip('-') == pk_name for field in ordering):
+            ordering.append(f"-{pk_name}" if ordering[-1].startswith('-') else pk_name)
+        return ordering
+
+    def encode_cursor(self, values, reverse):
+        payload = json.dumps({'v': values, 'r': reverse}, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4)))
+            values, reverse = payload['v'], bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, AttributeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def _after(self, values, reverse):
+        """Filter for the rows that come after (or, reversed, before) the given key."""
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            step = Q(**{f"{name}__{'lt' if descending else 'gt'}": values[index]})
+            for previous, value in zip(self.ordering[:index], values):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        return condition
+
+    def _key(self, instance):
+        return [instance.serializable_value(field.lstrip('-')) for field in self.ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset, view)
+        values, reverse = self.decode_cursor(request)
+
+        ordering = [field[1:] if field.startswith('-') else f"-{field}" for field in self.ordering] if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+
+        # One extra row tells whether there is a page beyond this one
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_values = self._key(rows[-1]) if rows and (has_more or reverse) else None
+        self.previous_values = self._key(rows[0]) if rows and values is not None and (has_more or not reverse) else None
+        return rows
+
+    def _link(self, values, reverse):
+        if values is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values, reverse))
+
+    def get_next_link(self):
+        return self._link(self.next_values, False)
+
+    def get_previous_link(self):
+        return self._link(self.previous_values, True)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
@@ -0,0 +1,42 @@
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+
+def requested_fields(request):
+    """
+    Read the sparse fieldset of a request.
+
+    Args:
+        request: The DRF request.
+
+    Returns:
+        tuple: (set of `fields` to keep or None for all, set of `exclude` fields to drop).
+    """
+    def names(param):
+        return {name.strip() for raw in request.query_params.getlist(param) for name in raw.split(',') if name.strip()}
+
+    return names('fields') or None, names('exclude')
+
+
+class SparseFieldsMixin:
+    """
+    Lets clients narrow a serializer with `?fields=` and `?exclude=`.
+
+    `?fields=sku,name,price` keeps only the listed fields and
+    `?exclude=description` drops fields; unknown names are ignored. Only the
+    top-level serializer of a read request is narrowed, so nested and
+    writable serializers keep all their fields.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        top_level = self.parent is None or (isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None)
+        if request is None or not top_level or request.method not in SAFE_METHODS:
+            return fields
+
+        keep, exclude = requested_fields(request)
+        return {
+            name: field for name, field in fields.items()
+            if (keep is None or name in keep) and name not in exclude
+        }
@@ -124,10 +124,18 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    # 'PAGE_SIZE': 10,
+    'DEFAULT_PAGINATION_CLASS': 'hbs.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
+# Seconds browsers and proxies may reuse public catalog responses before
+# revalidating them with their ETag
+CATALOG_CACHE_MAX_AGE = config('CATALOG_CACHE_MAX_AGE', default=60, cast=int)
+
+# Seconds rendered catalog responses are kept in the cache. Entries are keyed
+# by the resource versions, so writes invalidate them without waiting for this
+CATALOG_CACHE_TIMEOUT = config('CATALOG_CACHE_TIMEOUT', default=3600, cast=int)
+
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
@@ -196,6 +204,25 @@ DATABASES = {
     }
 }
 
+# Cache
+# Redis (or any Redis-compatible store) when REDIS_URL is set, otherwise a
+# per-process memory cache (development and tests)
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'hbs',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
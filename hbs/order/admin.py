@@ -2,21 +2,24 @@ from django.contrib import admin
 from django.http import JsonResponse
 from django.urls import path
 from django.shortcuts import render
-from .models import Order, OrderItem, CancellationRequest, ReturnRequest, Receipt
+from .models import Order, OrderItem, CancellationRequest, ReturnRequest, Receipt, PRICE_FIELDS
 from django.utils.html import format_html
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 1
+    readonly_fields = PRICE_FIELDS
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'date',  'payment_status', 'total')
+    list_display = ('id', 'date',  'payment_status', 'order_status', 'total')
+    list_filter = ('order_status',)
     inlines = [OrderItemInline]
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ('order', 'item', 'quantity')
+    list_display = ('order', 'item', 'quantity', 'unit_price', 'discounted_unit_price', 'line_total')
+    readonly_fields = PRICE_FIELDS
 
 @admin.register(CancellationRequest)
 class CancellationRequestAdmin(admin.ModelAdmin):
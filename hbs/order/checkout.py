@@ -0,0 +1,77 @@
+from django.db import transaction
+from django.db.models import Prefetch
+from rest_framework import serializers
+from products.models import Item
+from .models import Order, OrderItem
+from .totals import order_totals
+
+
+def resolve_lines(items_data):
+    """
+    Validate the lines of a new order and load their items with one query.
+
+    Args:
+        items_data (list): Posted lines, dicts with an ``item_id`` (the item's
+            sku) and an optional ``quantity`` (1 by default).
+
+    Returns:
+        list: (item, quantity) pairs, in the posted order.
+
+    Raises:
+        ValidationError: If any line is invalid, naming all of them.
+    """
+    if not isinstance(items_data, list) or not all(isinstance(line, dict) for line in items_data):
+        raise serializers.ValidationError({'error': "Items must be a list of objects with an item_id and a quantity."})
+
+    wanted, invalid = [], []
+    for line in items_data:
+        quantity = line.get('quantity', 1)
+        if isinstance(quantity, str) and quantity.strip().isdigit():
+            quantity = int(quantity)  # Form-encoded quantities
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+            invalid.append(str(line.get('item_id')))
+        wanted.append((str(line.get('item_id')), quantity))
+    if invalid:
+        raise serializers.ValidationError({'error': f"Quantities must be positive integers (items {', '.join(invalid)})."})
+
+    items = Item.objects.in_bulk({sku for sku, _ in wanted})
+    missing = sorted({sku for sku, _ in wanted if sku not in items})
+    if missing:
+        raise serializers.ValidationError({'error': f"Items with IDs {', '.join(missing)} not found."})
+    return [(items[sku], quantity) for sku, quantity in wanted]
+
+
+def place_order(serializer, items_data):
+    """
+    Check out a new order.
+
+    Every line is validated and its item resolved before anything is
+    written. The order is then inserted with its totals and payment status
+    already computed, and its lines (with their items' current prices) with
+    one ``bulk_create``, in one
+    transaction: an invalid line leaves no partial order behind.
+
+    Args:
+        serializer (OrderSerializer): Validated order data.
+        items_data (list): Posted lines (see resolve_lines).
+
+    Returns:
+        Order: The saved order, with its lines prefetched in their compact form.
+    """
+    lines = []
+    for item, quantity in resolve_lines(items_data):
+        line = OrderItem(item=item, quantity=quantity)
+        line.set_prices()
+        lines.append(line)
+    fields = order_totals(lines)
+    if lines:
+        amount_paid = serializer.validated_data.get('amount_paid', Order._meta.get_field('amount_paid').default)
+        fields['payment_status'] = 'paid' if amount_paid >= fields['total'] else 'pending'
+
+    with transaction.atomic():
+        order = serializer.save(**fields)
+        for line in lines:
+            line.order = order
+        OrderItem.objects.bulk_create(lines)
+
+    return Order.objects.prefetch_related(Prefetch('items', queryset=OrderItem.with_item_summaries())).get(pk=order.pk)
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from order.totals import check_order_totals, CHECK_CHUNK_SIZE
+
+
+class Command(BaseCommand):
+    help = "Verify the stored totals of every order against totals recomputed from its lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=CHECK_CHUNK_SIZE, help="Orders checked per aggregate query.")
+        parser.add_argument(
+            '--fix', action='store_true',
+            help="Rewrite the totals of the orders that differ, except orders whose line prices were backfilled.",
+        )
+
+    def handle(self, *args, **options):
+        report = check_order_totals(chunk_size=options['chunk_size'], fix=options['fix'])
+        backfilled = set(report['backfilled'])
+        for pk in report['mismatched']:
+            if pk in backfilled:
+                self.stdout.write(f"Order {pk}: stored totals differ from its backfilled line prices (left as charged).")
+            else:
+                self.stdout.write(f"Order {pk}: stored totals differ from its lines.")
+        message = (
+            f"Checked {report['checked']} orders in {report['elapsed_ms']} ms: "
+            f"{len(report['mismatched'])} mismatched ({len(backfilled)} with backfilled prices), {report['fixed']} fixed."
+        )
+        self.stdout.write(self.style.SUCCESS(message) if not report['mismatched'] or options['fix'] else self.style.WARNING(message))
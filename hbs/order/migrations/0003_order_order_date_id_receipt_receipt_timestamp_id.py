@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0002_initial'),
+        ('userManager', '0002_organization_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['date', 'id'], name='order_date_id'),
+        ),
+        migrations.AddIndex(
+            model_name='receipt',
+            index=models.Index(fields=['timestamp', 'id'], name='receipt_timestamp_id'),
+        ),
+    ]
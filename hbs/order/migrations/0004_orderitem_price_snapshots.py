@@ -0,0 +1,70 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:42
+
+from decimal import Decimal
+from django.db import migrations, models, transaction
+
+# Order lines backfilled per transaction
+BACKFILL_CHUNK_SIZE = 2000
+
+
+def backfill_prices(apps, schema_editor):
+    """
+    Set the prices of the existing order lines from their items' current
+    prices, one chunk of lines (in primary key order) per transaction.
+    These are not necessarily the prices charged, so the lines are marked
+    as backfilled.
+    """
+    OrderItem = apps.get_model('order', 'OrderItem')
+    last = 0
+    while True:
+        rows = list(
+            OrderItem.objects.filter(pk__gt=last).order_by('pk')
+            .values_list('pk', 'quantity', 'item__price', 'item__discounted_price')[:BACKFILL_CHUNK_SIZE]
+        )
+        if not rows:
+            break
+        last = rows[-1][0]
+        lines = [
+            OrderItem(
+                pk=pk, unit_price=price, discounted_unit_price=discounted_price,
+                line_total=discounted_price * quantity, prices_backfilled=True,
+            )
+            for pk, quantity, price, discounted_price in rows
+        ]
+        with transaction.atomic():
+            OrderItem.objects.bulk_update(
+                lines, ['unit_price', 'discounted_unit_price', 'line_total', 'prices_backfilled'], batch_size=500,
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False  # The backfill commits chunk by chunk
+
+    dependencies = [
+        ('order', '0003_order_order_date_id_receipt_receipt_timestamp_id'),
+        ('products', '0013_item_alternative_sku'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='discounted_unit_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='unit_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=10),
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='prices_backfilled',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(backfill_prices, migrations.RunPython.noop),
+    ]
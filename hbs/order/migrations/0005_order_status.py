@@ -0,0 +1,34 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:45
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_order_status(apps, schema_editor):
+    """Store the current step of the existing orders, with one UPDATE."""
+    Order = apps.get_model('order', 'Order')
+    OrderStep = apps.get_model('order_tracking', 'OrderStep')
+    steps = OrderStep.objects.filter(order=OuterRef('pk'), completed=False).order_by('-timestamp', '-pk')
+    Order.objects.update(order_status=Subquery(steps.values('step_name')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0004_orderitem_price_snapshots'),
+        ('order_tracking', '0001_initial'),
+        ('userManager', '0002_organization_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='order_status',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_status', 'date', 'id'], name='order_status_date_id'),
+        ),
+        migrations.RunPython(fill_order_status, migrations.RunPython.noop),
+    ]
@@ -3,16 +3,13 @@ from products.models import Item
 import uuid
 from django.core.serializers import serialize
 from django.db import models
-from products.models import Item
+from products.models import Item, ITEM_SUMMARY_FIELDS
+from products.short_ids import next_code
+from .totals import to_cents
 import uuid
 from userManager.models import Organization
-import random
-import string
 from decimal import Decimal
 
-def generate_unique_code():
-    """Generate a unique 6-character alphanumeric code."""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
 class Order(models.Model):
     id = models.CharField(primary_key=True, editable=False,max_length=6)
     date = models.DateField(auto_now_add=True)
@@ -54,31 +51,84 @@ class Order(models.Model):
     total_discount_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     total_discount_percentage = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
     extra_fee = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00')) # Packaging and Delivery fee
+    # Current tracking step (latest step not completed yet), kept up to date by the order_tracking signals
+    order_status = models.CharField(max_length=100, blank=True, null=True, editable=False)
     def save(self, *args, **kwargs):
         # Ensure unique ID is generated before saving
         if not self.id:
-            self.id = self.generate_unique_field('id')
+            self.id = self.generate_unique_field()
+            kwargs.setdefault('force_insert', True)  # Never overwrite a row on a code clash
         super(Order, self).save(*args, **kwargs)    
-    def generate_unique_field(self, field_name):
-        """Generate a unique 6-character alphanumeric code for a field."""
-        code = generate_unique_code()
-        while Order.objects.filter(**{field_name: code}).exists():
-            code = generate_unique_code()
-        return code
+    def generate_unique_field(self):
+        """Generate a unique 6-character alphanumeric code for the primary key field."""
+        return next_code(Order)
     def __str__(self):
         return f"Order {self.id} - {self.receipient_name}"
     class Meta:
         verbose_name = "Order"
         verbose_name_plural = "Orders"
+        indexes = [
+            models.Index(fields=['date', 'id'], name='order_date_id'),  # Keyset pagination
+            models.Index(fields=['order_status', 'date', 'id'], name='order_status_date_id'),  # Orders at a step, newest first
+        ]
 
     def add_items(self, items):
         for item, quantity in items:
             OrderItem.objects.create(order=self, item=item, quantity=quantity)
 
+# OrderItem fields kept from the last read of a line (see OrderItem.from_db)
+LINE_FIELDS = ('item_id', 'unit_price', 'line_total', 'quantity')
+
+# OrderItem fields set from the item's prices (see OrderItem.set_prices)
+PRICE_FIELDS = ('unit_price', 'discounted_unit_price', 'line_total')
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
+    # Prices of the item when it was ordered, so later catalog changes leave the order as it was
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    discounted_unit_price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))  # At the discounted price
+    # Prices copied from the catalog when the column was added, not the prices charged at checkout
+    prices_backfilled = models.BooleanField(default=False, editable=False)
+
+    _loaded_line = None  # LINE_FIELDS values as last read from the database
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the item, prices and quantity the line was loaded with, so
+        saves and deletes can apply their change to the order's totals as a delta.
+        """
+        instance = super().from_db(db, field_names, values)
+        if all(field in field_names for field in LINE_FIELDS):
+            instance._loaded_line = instance.line_values()
+        return instance
+
+    def line_values(self):
+        """Current values of LINE_FIELDS."""
+        return tuple(getattr(self, field) for field in LINE_FIELDS)
+
+    def set_prices(self, item=None):
+        """
+        Take the unit prices of an item (by default the line's own) and
+        compute the line total from them.
+        """
+        item = item or self.item
+        # Rounded to the cent first, so the line total is exactly what is stored
+        self.unit_price, self.discounted_unit_price = to_cents(item.price), to_cents(item.discounted_price)
+        self.line_total = self.discounted_unit_price * self.quantity
+
+    def save(self, *args, **kwargs):
+        # Prices are taken when the line is placed or its item replaced, and kept on quantity changes
+        if self._state.adding or self._loaded_line is None or self._loaded_line[0] != self.item_id:
+            self.set_prices()
+        else:
+            self.line_total = self.discounted_unit_price * self.quantity
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], *PRICE_FIELDS}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.quantity} of {self.item.name}"
@@ -87,6 +137,17 @@ class OrderItem(models.Model):
         verbose_name = "Order Item"
         verbose_name_plural = "Order Items"
 
+    @classmethod
+    def with_item_summaries(cls):
+        """
+        Order items joined to their item, loading only the item columns of the
+        compact representation (ITEM_SUMMARY_FIELDS) nested in order responses.
+        """
+        return cls.objects.select_related('item').only(
+            'id', 'order', 'quantity', 'item', *PRICE_FIELDS, 'prices_backfilled',
+            *(f'item__{field}' for field in ITEM_SUMMARY_FIELDS)
+        )
+
 class CancellationRequest(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     description = models.TextField()
@@ -148,4 +209,5 @@ class Receipt(models.Model):
     class Meta:
         verbose_name = "Receipt"
         verbose_name_plural = "Receipts"
+        indexes = [models.Index(fields=['timestamp', 'id'], name='receipt_timestamp_id')]  # Keyset pagination
 
@@ -1,26 +1,21 @@
 from rest_framework import serializers
-from .models import Order, OrderItem, CancellationRequest, ReturnRequest, Receipt
+from .models import Order, OrderItem, CancellationRequest, ReturnRequest, Receipt, PRICE_FIELDS
 from order_tracking.models import OrderStep
-from products.serializers import ItemSerializer
+from products.serializers import ItemSummarySerializer
+from hbs.serializers import SparseFieldsMixin
 class OrderItemSerializer(serializers.ModelSerializer):
-    item = ItemSerializer(read_only=True)
+    item = ItemSummarySerializer(read_only=True)
     class Meta:
         model = OrderItem
         fields = '__all__'
+        read_only_fields = PRICE_FIELDS  # Taken from the item when the line is placed
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
-    order_status = serializers.SerializerMethodField()
 
     class Meta:
         model = Order
-        fields = '__all__'
-    def get_order_status(self, obj):
-        # Get the latest completed step, or return None if no steps are completed
-        latest_step = obj.steps.filter(completed=False).order_by('-timestamp').first()
-        if latest_step:
-            return latest_step.step_name
-        return None  # Or return a default value like 'Pending' if no steps are completed
+        fields = '__all__'  # order_status is the stored current step, read-only
 class CancellationRequestSerializer(serializers.ModelSerializer):
     class Meta:
         model = CancellationRequest
@@ -1,99 +1,52 @@
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.db.models import Case, F, Value, When
 from .models import OrderItem, Order
+from .totals import apply_order_delta, line_amounts, recalculate_order_totals
 from paymentsApp.models import Payment
 
 @receiver(post_save, sender=OrderItem)
-def update_order_total_on_save(sender, instance, **kwargs):
+def update_order_total_on_save(sender, instance, created, **kwargs):
     """
-    Update the total of the Order whenever an OrderItem is saved.
+    Apply a saved OrderItem's change to the totals of its Order.
     Update the total discounted amount and total discount percentage as well.
-    """
-    order = instance.order
-    order_items = order.items.all()
-
-    total = 0
-    total_discount_amount = 0
-    total_original_price = 0
-
-    # Calculate total, discount amount, and original price
-    for order_item in order_items:
-        item = order_item.item
-        quantity = order_item.quantity
-
-        item_total = item.discounted_price * quantity  # Using the discounted price
-        total += item_total
 
-        original_item_total = item.price * quantity
-        discount_amount = original_item_total - item_total
-        total_original_price += original_item_total
-        total_discount_amount += discount_amount
-
-    # Calculate discount percentage if there is any discount
-    if total_original_price > 0:
-        total_discount_percentage = (total_discount_amount / total_original_price) * 100
-    else:
-        total_discount_percentage = 0
-
-    # Update the Order with the calculated totals
-    order.total = total
-    order.total_discount_amount = total_discount_amount
-    order.total_discount_percentage = total_discount_percentage
-    order.save()
-
-    # Check if payment status needs to be updated
-    update_payment_status(order)
+    The change is applied as a delta with a single Order write, from the
+    prices stored on the line. Lines saved without being loaded first fall
+    back to an aggregate recompute.
+    """
+    loaded, current = instance._loaded_line, instance.line_values()
+    instance._loaded_line = current
+    if created:
+        apply_order_delta(instance.order_id, *line_amounts(*current[1:]))
+    elif loaded is None:
+        recalculate_order_totals(instance.order)
+    elif loaded != current:
+        total, discount_amount = line_amounts(*current[1:])
+        old_total, old_discount_amount = line_amounts(*loaded[1:])
+        apply_order_delta(instance.order_id, total - old_total, discount_amount - old_discount_amount)
 
 @receiver(post_delete, sender=OrderItem)
-def update_order_total_on_delete(sender, instance, **kwargs):
+def update_order_total_on_delete(sender, instance, origin=None, **kwargs):
     """
-    Update the total of the Order whenever an OrderItem is deleted.
-    Update the total discounted amount and total discount percentage as well.
+    Remove a deleted OrderItem from the totals of its Order, with a single Order write.
     """
-    order = instance.order
-    order_items = order.items.all()
-
-    total = 0
-    total_discount_amount = 0
-    total_original_price = 0
-
-    # Calculate total, discount amount, and original price
-    for order_item in order_items:
-        item = order_item.item
-        quantity = order_item.quantity
-
-        item_total = item.discounted_price * quantity  # Using the discounted price
-        total += item_total
-
-        original_item_total = item.price * quantity
-        discount_amount = original_item_total - item_total
-        total_original_price += original_item_total
-        total_discount_amount += discount_amount
-
-    # Calculate discount percentage if there is any discount
-    if total_original_price > 0:
-        total_discount_percentage = (total_discount_amount / total_original_price) * 100
-    else:
-        total_discount_percentage = 0
-
-    # Update the Order with the calculated totals
-    order.total = total
-    order.total_discount_amount = total_discount_amount
-    order.total_discount_percentage = total_discount_percentage
-    order.save()
-
-    # Check if payment status needs to be updated
-    update_payment_status(order)
+    if isinstance(origin, Order) or getattr(origin, 'model', None) is Order:
+        return  # The order itself is being deleted
+    total, discount_amount = line_amounts(*(instance._loaded_line or instance.line_values())[1:])
+    apply_order_delta(instance.order_id, -total, -discount_amount)
 
 def update_payment_status(order):
     """
     Update the payment status of the Order to 'paid' if the amount_paid is equal to or exceeds the total.
+
+    The status is written with one UPDATE that compares the stored amounts,
+    so a stale in-memory order never writes back columns kept up to date by
+    other writers (the totals, by line deltas, and order_status, by the
+    tracking steps).
     """
-    if order.amount_paid >= order.total:
-        order.payment_status = 'paid'
-    else:
-        order.payment_status = 'pending'
-    order.save()
+    paid = Case(When(amount_paid__gte=F('total'), then=Value('paid')), default=Value('pending'))
+    Order.objects.filter(pk=order.pk).update(payment_status=paid)
 
 @receiver(post_save, sender=Payment)
 def update_order_payment_on_payment(sender, instance, **kwargs):
@@ -1,3 +1,198 @@
+from decimal import Decimal
+from unittest import mock
+from django.db import DatabaseError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from hbs.pagination import KeysetPagination
+from products.models import Item
+from .models import Order, OrderItem
+from .serializers import OrderItemSerializer
+from .totals import check_order_totals
 
-# Create your tests here.
+
+class OrderTotalsTests(TestCase):
+    """
+    Line changes are applied to their order's totals as deltas, which must
+    cancel out exactly, whatever the discounts.
+    """
+
+    def setUp(self):
+        # 33.33 at 10% off is 29.997 before it is rounded to the cent
+        self.item = Item.objects.create(name="Fractional", price=Decimal('33.33'), discount=Decimal('10.00'))
+        self.other = Item.objects.create(name="Other", price=Decimal('19.99'), discount=Decimal('12.50'))
+        self.order = Order.objects.create(receipient_name="Customer", receipt_email='customer@example.com')
+
+    def assertTotals(self, total, discount_amount, percentage):
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual(
+            (order.total, order.total_discount_amount, order.total_discount_percentage),
+            (Decimal(total), Decimal(discount_amount), Decimal(percentage)),
+        )
+
+    def test_add_then_remove(self):
+        line = OrderItem.objects.create(order=self.order, item=self.item, quantity=3)
+        self.assertTotals('90.00', '9.99', '9.99')
+        line.delete()
+        self.assertTotals('0.00', '0.00', '0.00')
+
+    def test_add_then_remove_loaded_line(self):
+        OrderItem.objects.create(order=self.order, item=self.item, quantity=3)
+        OrderItem.objects.get(order=self.order).delete()
+        self.assertTotals('0.00', '0.00', '0.00')
+
+    def test_round_trip(self):
+        line = OrderItem.objects.create(order=self.order, item=self.item, quantity=3)
+        OrderItem.objects.create(order=self.order, item=self.other, quantity=7)
+        line.quantity = 5
+        line.save()
+        line.item = self.other
+        line.save()
+        self.item.delete()
+        self.other.delete()  # Cascades to both lines
+        self.assertTotals('0.00', '0.00', '0.00')
+        self.assertEqual(check_order_totals()['mismatched'], [])
+
+    def test_totals_match_lines(self):
+        for item, quantity in ((self.item, 1), (self.item, 2), (self.other, 3)):
+            OrderItem.objects.create(order=self.order, item=item, quantity=quantity)
+        OrderItem.objects.filter(order=self.order).first().delete()
+        self.assertEqual(check_order_totals()['mismatched'], [])
+
+    def test_backfilled_orders_are_not_rewritten(self):
+        OrderItem.objects.create(order=self.order, item=self.item, quantity=2)
+        OrderItem.objects.filter(order=self.order).update(prices_backfilled=True, unit_price=Decimal('40.00'))
+        report = check_order_totals(fix=True)
+        self.assertEqual((report['mismatched'], report['backfilled'], report['fixed']), ([self.order.pk], [self.order.pk], 0))
+        self.assertTotals('60.00', '6.66', '9.99')
+
+    def test_serialized_lines_load_with_one_query(self):
+        for item in (self.item, self.other):
+            OrderItem.objects.create(order=self.order, item=item, quantity=2)
+        with self.assertNumQueries(1):
+            lines = OrderItemSerializer(OrderItem.with_item_summaries().filter(order=self.order), many=True).data
+        self.assertEqual([line['prices_backfilled'] for line in lines], [False, False])
+
+
+
+class CheckoutTests(TestCase):
+    """
+    Checkout validates every line before writing, writes the order and its
+    lines in one transaction, and costs the same queries for any number of lines.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.items = [Item.objects.create(name=f"Book {index}", price=100 + index) for index in range(5)]
+
+    def checkout(self, lines):
+        return self.client.post('/orders/', {
+            'receipient_name': "Customer",
+            'receipt_email': 'customer@example.com',
+            'items': lines,
+        }, format='json')
+
+    def assertNothingWritten(self, response):
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+        self.assertEqual((Order.objects.count(), OrderItem.objects.count()), (0, 0))
+
+    def test_unknown_item(self):
+        response = self.checkout([{'item_id': self.items[0].sku, 'quantity': 1}, {'item_id': 'NOSUCH', 'quantity': 2}])
+        self.assertNothingWritten(response)
+        self.assertIn('NOSUCH', response.json()['error'])
+
+    def test_invalid_quantities(self):
+        for quantity in (0, -1, 'two', 1.5, True):
+            self.assertNothingWritten(self.checkout([{'item_id': self.items[0].sku, 'quantity': quantity}]))
+
+    def test_invalid_lines(self):
+        self.assertNothingWritten(self.checkout([self.items[0].sku]))
+
+    def test_failed_insert_rolls_back_the_order(self):
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            self.checkout([{'item_id': self.items[0].sku, 'quantity': 1}])
+        self.assertEqual((Order.objects.count(), OrderItem.objects.count()), (0, 0))
+
+    def test_order_and_lines(self):
+        response = self.checkout([{'item_id': item.sku, 'quantity': 2} for item in self.items[:2]])
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual((order.total, order.items.count()), (Decimal('402.00'), 2))
+
+    def test_constant_queries(self):
+        self.checkout([{'item_id': self.items[0].sku, 'quantity': 1}])  # Creates the order code sequence
+        counts = []
+        for items in (self.items[:1], self.items):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.checkout([{'item_id': item.sku, 'quantity': 1} for item in items])
+            self.assertEqual(response.status_code, 201)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class OrderListQueryTests(TestCase):
+    """
+    Order listings read each order's status from the order row, so they
+    cost the same queries however many orders they list.
+    """
+
+    def add_orders(self, count):
+        from order_tracking.models import OrderStep
+
+        item = Item.objects.create(name="Book", price=10)
+        for index in range(count):
+            order = Order.objects.create(receipient_name=f"Customer {index}", receipt_email='customer@example.com')
+            OrderItem.objects.create(order=order, item=item, quantity=2)
+            OrderStep.objects.create(order=order, step_name='packaged')
+
+    def test_list(self):
+        for count in (1, 4):
+            self.add_orders(count)
+            # The page of orders and their lines
+            with self.assertNumQueries(2):
+                response = self.client.get('/orders/?page_size=100')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual({order['order_status'] for order in response.json()['results']}, {'packaged'})
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Cursor pages cover every row exactly once, in order, in both directions,
+    even when many rows share the leading ordering key.
+    """
+
+    def setUp(self):
+        for index in range(7):
+            Order.objects.create(receipient_name=f"Customer {index}", receipt_email='customer@example.com')
+        # Ties on the order date are broken by the primary key
+        Order.objects.update(date=timezone.now())
+        self.expected = list(Order.objects.order_by('-date', '-id').values_list('id', flat=True))
+
+    def pages(self, url, link):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([order['id'] for order in data['results']])
+            url = data[link]
+        return pages
+
+    def test_cursor_round_trip(self):
+        forward = self.pages('/orders/?page_size=3', 'next')
+        self.assertEqual([len(page) for page in forward], [3, 3, 1])
+        self.assertEqual(sum(forward, []), self.expected)
+        # From the last page back to the first, through the previous links
+        last = self.client.get('/orders/?page_size=3').json()['next']
+        last = self.client.get(last).json()['next']
+        self.assertEqual(self.pages(last, 'previous'), forward[::-1])
+
+    def test_page_size(self):
+        paginator = KeysetPagination()
+        for value, size in (('3', 3), ('500', 200), ('0', 50), ('-2', 50), ('many', 50)):
+            request = Request(APIRequestFactory().get('/orders/', {'page_size': value}))
+            self.assertEqual(paginator.get_page_size(request), size)
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get('/orders/?cursor=bm9wZQ').status_code, 404)
@@ -0,0 +1,186 @@
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction
+from django.db.models import DecimalField, F, Sum
+
+# Orders whose totals are checked per aggregate query
+CHECK_CHUNK_SIZE = 1000
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+# Original prices at or below this count as zero when computing the discount percentage
+NO_ORIGINAL_PRICE = Decimal('0.005')
+
+
+def to_cents(amount):
+    """Round an amount to the cent, half up, as it is stored."""
+    return Decimal(amount).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def line_amounts(unit_price, line_total, quantity):
+    """
+    Amounts a line adds to its order's totals.
+
+    Args:
+        unit_price (Decimal): The line's unit price before the discount.
+        line_total (Decimal): The line's stored total, at the discounted price.
+        quantity (int): The line's quantity.
+
+    Returns:
+        tuple: The line total and the discount amount, both rounded to the cent.
+    """
+    line_total = to_cents(line_total)
+    return line_total, to_cents(unit_price) * quantity - line_total
+
+
+def order_totals(lines):
+    """
+    Compute the totals of an order from its lines.
+
+    Args:
+        lines (iterable): OrderItems, with their prices set.
+
+    Returns:
+        dict: The order's total (at discounted prices), total_discount_amount
+        and total_discount_percentage.
+    """
+    total = total_discount_amount = ZERO
+    for line in lines:
+        line_total, discount_amount = line_amounts(line.unit_price, line.line_total, line.quantity)
+        total += line_total
+        total_discount_amount += discount_amount
+    return {
+        'total': total,
+        'total_discount_amount': total_discount_amount,
+        'total_discount_percentage': discount_percentage(total, total_discount_amount),
+    }
+
+
+def discount_percentage(total, discount_amount):
+    """Discount as a percentage of the original price (the total plus the discount)."""
+    original = total + discount_amount
+    if original > NO_ORIGINAL_PRICE:
+        return to_cents(discount_amount / original * 100)
+    return ZERO
+
+
+def apply_order_delta(order_id, total, discount_amount):
+    """
+    Add a line change to the totals of an order.
+
+    The order row is locked and read, its new totals, discount percentage
+    and payment status computed in Decimal, and written with one UPDATE.
+
+    Args:
+        order_id (str): The order.
+        total (Decimal): Change of the total, at discounted prices.
+        discount_amount (Decimal): Change of the discount amount.
+    """
+    from .models import Order
+
+    total, discount_amount = to_cents(total), to_cents(discount_amount)
+    if not total and not discount_amount:
+        return
+    with transaction.atomic(savepoint=False):
+        order = Order.objects.select_for_update().filter(pk=order_id).values('total', 'total_discount_amount', 'amount_paid').first()
+        if order is None:
+            return  # The order is being deleted
+        new_total = to_cents(order['total'] + total)
+        new_discount = to_cents(order['total_discount_amount'] + discount_amount)
+        Order.objects.filter(pk=order_id).update(
+            total=new_total,
+            total_discount_amount=new_discount,
+            total_discount_percentage=discount_percentage(new_total, new_discount),
+            payment_status='paid' if order['amount_paid'] >= new_total else 'pending',
+        )
+
+
+def aggregate_order_totals(orders):
+    """
+    Recompute the totals of many orders from the prices stored on their
+    lines, with one aggregate query (the items are not read).
+
+    Args:
+        orders (iterable): Order ids.
+
+    Returns:
+        dict: Order id -> (total, total_discount_amount). Orders without lines are omitted.
+    """
+    from .models import OrderItem
+
+    money = DecimalField(max_digits=12, decimal_places=2)
+    rows = OrderItem.objects.filter(order__in=list(orders)).values('order').order_by().annotate(
+        lines_total=Sum('line_total'),
+        original=Sum(F('unit_price') * F('quantity'), output_field=money),
+    )
+    return {row['order']: (row['lines_total'], row['original'] - row['lines_total']) for row in rows}
+
+
+def recalculate_order_totals(order):
+    """
+    Rewrite the totals of an order from its lines: one aggregate query and
+    one write. The fallback when a line change cannot be applied as a delta.
+
+    Args:
+        order (Order): The order, updated in memory as well.
+    """
+    total, discount_amount = aggregate_order_totals([order.pk]).get(order.pk, (ZERO, ZERO))
+    order.total, order.total_discount_amount = total, discount_amount
+    order.total_discount_percentage = discount_percentage(total, discount_amount)
+    order.payment_status = 'paid' if order.amount_paid >= total else 'pending'
+    order.save(update_fields=['total', 'total_discount_amount', 'total_discount_percentage', 'payment_status'])
+
+
+def check_order_totals(chunk_size=CHECK_CHUNK_SIZE, fix=False):
+    """
+    Compare the stored totals of every order with ones recomputed from its
+    lines, one chunk of orders (in primary key order) per aggregate query.
+
+    Args:
+        chunk_size (int): Orders per chunk.
+        fix (bool): Rewrite the totals of the orders that differ. Orders
+            with backfilled line prices are never rewritten: their stored
+            totals are what was charged, and their lines only hold the
+            catalog prices of the day the prices were backfilled.
+
+    Returns:
+        dict: Number of orders checked, the ids of those that differ, the
+        ones among them with backfilled prices (``backfilled``, not fixed),
+        and elapsed_ms.
+    """
+    from .models import Order, OrderItem
+
+    started = time.perf_counter()
+    report = {'checked': 0, 'mismatched': [], 'backfilled': [], 'fixed': 0}
+    fields = ('pk', 'total', 'total_discount_amount', 'total_discount_percentage')
+    last = None
+    while True:
+        chunk = Order.objects.order_by('pk')
+        if last is not None:
+            chunk = chunk.filter(pk__gt=last)
+        chunk = list(chunk.values_list(*fields)[:chunk_size])
+        if not chunk:
+            break
+        last = chunk[-1][0]
+        recomputed = aggregate_order_totals(row[0] for row in chunk)
+        mismatched = []
+        for pk, total, discount_amount, percentage in chunk:
+            expected_total, expected_discount = recomputed.get(pk, (ZERO, ZERO))
+            expected = (expected_total, expected_discount, discount_percentage(expected_total, expected_discount))
+            if (total, discount_amount, percentage) != expected:
+                mismatched.append(pk)
+        if mismatched:
+            backfilled = set(
+                OrderItem.objects.filter(order__in=mismatched, prices_backfilled=True).values_list('order', flat=True).distinct()
+            )
+            report['mismatched'] += mismatched
+            report['backfilled'] += [pk for pk in mismatched if pk in backfilled]
+            if fix:
+                for pk in mismatched:
+                    if pk not in backfilled:
+                        recalculate_order_totals(Order.objects.get(pk=pk))
+                        report['fixed'] += 1
+        report['checked'] += len(chunk)
+    report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return report
@@ -2,7 +2,9 @@ from rest_framework import viewsets, status
 from rest_framework.response import Response
 from .models import Order, OrderItem, CancellationRequest, ReturnRequest, Receipt
 from .serializers import OrderSerializer, OrderItemSerializer, CancellationRequestSerializer, ReturnRequestSerializer, ReceiptSerializer
+from .checkout import place_order
 from products.models import Item
+from django.db.models import Prefetch
 from uuid import UUID
 from rest_framework.permissions import AllowAny
 
@@ -10,35 +12,31 @@ class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [AllowAny]
+    keyset_ordering = ('-date', '-id')  # Newest orders first
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            # Items are nested in their compact form, so only those columns are loaded
+            queryset = queryset.prefetch_related(Prefetch('items', queryset=OrderItem.with_item_summaries()))
+        if self.action == 'list' and 'order_status' in self.request.query_params:
+            # Orders currently at a tracking step, read through the order_status index
+            queryset = queryset.filter(order_status=self.request.query_params['order_status'])
+        return queryset
 
     def create(self, request, *args, **kwargs):
         # Extract the items from the request data
         items_data = request.data.pop('items', [])
 
-        # Create the order
+        # Validate the order, then check out the order and all its items in one transaction
         order_serializer = self.get_serializer(data=request.data)
         order_serializer.is_valid(raise_exception=True)
-        order = order_serializer.save()
-
-        # Create the associated OrderItems
-        for item_data in items_data:
-            item_id = item_data.get('item_id')
-            quantity = item_data.get('quantity', 1)
-
-            try:
-                # Fetch the item using the validated UUID
-                item = Item.objects.get(sku=item_id)
-            except Item.DoesNotExist:
-                return Response({"error": f"Item with ID {item_id} not found."}, status=status.HTTP_400_BAD_REQUEST)
-            OrderItem.objects.create(order=order, item=item, quantity=quantity)
-
-        # Recalculate the total and save the order
-        order.save()
+        order = place_order(order_serializer, items_data)
 
         # Return the serialized order
         return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
 class OrderItemViewSet(viewsets.ModelViewSet):
-    queryset = OrderItem.objects.all()
+    queryset = OrderItem.with_item_summaries()
     serializer_class = OrderItemSerializer
 
 class CancellationRequestViewSet(viewsets.ModelViewSet):
@@ -50,5 +48,8 @@ class ReturnRequestViewSet(viewsets.ModelViewSet):
     serializer_class = ReturnRequestSerializer
 
 class ReceiptViewSet(viewsets.ModelViewSet):
-    queryset = Receipt.objects.all()
+    queryset = Receipt.objects.select_related('order').prefetch_related(
+        Prefetch('order__items', queryset=OrderItem.with_item_summaries())
+    )
     serializer_class = ReceiptSerializer
+    keyset_ordering = ('-timestamp', '-id')  # Newest receipts first
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from order_tracking.steps import STEP_ORDER, advance_orders, orders_at
+
+
+class Command(BaseCommand):
+    help = "Move many orders forward to a tracking step in one transaction."
+
+    def add_arguments(self, parser):
+        parser.add_argument('step', choices=STEP_ORDER, help="Step to move the orders to.")
+        parser.add_argument('--orders', nargs='+', metavar='ID', help="Ids of the orders to move.")
+        parser.add_argument('--from-step', choices=STEP_ORDER, help="Move every order currently at this step.")
+
+    def handle(self, *args, **options):
+        if bool(options['orders']) == bool(options['from_step']):
+            raise CommandError("Give either --orders or --from-step.")
+        orders = options['orders'] or orders_at(options['from_step'])
+
+        results = advance_orders(orders, options['step'])
+        for result in results:
+            if result['result'] == 'rejected':
+                self.stdout.write(self.style.WARNING(f"Order {result['order']}: {result['error']}"))
+        advanced = sum(1 for result in results if result['result'] == 'advanced')
+        unchanged = sum(1 for result in results if result['result'] == 'unchanged')
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {advanced} orders to '{options['step']}' ({unchanged} already there, "
+            f"{len(results) - advanced - unchanged} rejected)."
+        ))
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from products.models import Item
 from order.models import Order, OrderItem
 
@@ -23,9 +23,11 @@ class OrderStep(models.Model):
     def complete_step(self):
         """
         Marks the current step as completed and saves the model.
+        The next step and the order's status are written in the same transaction.
         """
-        self.completed = True
-        self.save()
+        with transaction.atomic():
+            self.completed = True
+            self.save()
 
     class Meta:
         verbose_name = "Order Step"
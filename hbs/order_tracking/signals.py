@@ -1,6 +1,8 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from .models import OrderStep,OrderChecklist,OrderItemChecklist
+from .steps import STEP_ORDER, refresh_order_status
+from order.models import Order
 from paymentsApp.models import Payment
 @receiver(post_save, sender=Payment)
 def create_order_step_and_checklist_on_payment(sender, instance, created, **kwargs):
@@ -44,22 +46,24 @@ def move_to_next_step(sender, instance, created, **kwargs):
     Move the order to the next step when the current step is completed.
     """
     if instance.completed:
-        # Define the order of steps
-        step_order = [
-            'created',
-            'processing',
-            'packaged',
-            'shipped',
-            'delivered',
-            'completed'
-        ]
         # Get the index of the current step
-        current_step_index = step_order.index(instance.step_name)
+        current_step_index = STEP_ORDER.index(instance.step_name)
 
         # If there is a next step, create it
-        if current_step_index < len(step_order) - 1:
-            next_step_name = step_order[current_step_index + 1]
+        if current_step_index < len(STEP_ORDER) - 1:
+            next_step_name = STEP_ORDER[current_step_index + 1]
             OrderStep.objects.create(
                 order=instance.order,
                 step_name=next_step_name
             )
+
+@receiver(post_save, sender=OrderStep)
+@receiver(post_delete, sender=OrderStep)
+def update_order_status(sender, instance, origin=None, **kwargs):
+    """
+    Store the order's current step on the Order whenever one of its steps
+    is saved or deleted, so order listings need no query per order.
+    """
+    if isinstance(origin, Order) or getattr(origin, 'model', None) is Order:
+        return  # The order itself is being deleted
+    refresh_order_status([instance.order_id])
@@ -0,0 +1,109 @@
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+# Tracking steps, in the order an order goes through them
+STEP_ORDER = ('created', 'processing', 'packaged', 'shipped', 'delivered', 'completed')
+
+
+def current_steps():
+    """
+    Subquery of the current step of an order: its latest step that is not
+    completed yet (None if there is none).
+    """
+    from .models import OrderStep
+
+    steps = OrderStep.objects.filter(order=OuterRef('pk'), completed=False).order_by('-timestamp', '-pk')
+    return Subquery(steps.values('step_name')[:1])
+
+
+def refresh_order_status(orders):
+    """
+    Store the current step of some orders in their ``order_status``, with one UPDATE.
+
+    Args:
+        orders (iterable): Order ids.
+
+    Returns:
+        int: Number of orders updated.
+    """
+    from order.models import Order
+
+    return Order.objects.filter(pk__in=list(orders)).update(order_status=current_steps())
+
+
+def orders_at(step):
+    """
+    Ids of the orders whose current step is ``step``, read through the order_status index.
+    """
+    from order.models import Order
+
+    return list(Order.objects.filter(order_status=step).order_by('date', 'id').values_list('pk', flat=True))
+
+
+def advance_orders(orders, step):
+    """
+    Move many orders forward to a tracking step, in one transaction.
+
+    Moves are validated against STEP_ORDER: an order must exist, have a step
+    in progress, and ``step`` must come after it. Its current step is
+    completed, the steps it skips are recorded as completed, and ``step``
+    becomes its new current step. All current steps are locked and read
+    with one query, completed with one UPDATE, and the new steps inserted
+    with one ``bulk_create``, so the number of queries does not depend on
+    the number of orders. Step signals are not sent; the orders' status is
+    written directly.
+
+    Args:
+        orders (iterable): Order ids.
+        step (str): The target step, one of STEP_ORDER.
+
+    Returns:
+        list: One result per order, in the given order (duplicates dropped):
+        a dict with the ``order``, its ``result`` ('advanced', 'unchanged' or
+        'rejected'), the step it was at (``from``) and, for rejected moves,
+        the ``error``.
+
+    Raises:
+        ValueError: If ``step`` is not a tracking step.
+    """
+    from order.models import Order
+    from .models import OrderStep
+
+    if step not in STEP_ORDER:
+        raise ValueError(f"Unknown step '{step}'. Steps are: {', '.join(STEP_ORDER)}.")
+    orders = list(dict.fromkeys(str(pk) for pk in orders))
+    target = STEP_ORDER.index(step)
+
+    with transaction.atomic():
+        found = set(Order.objects.filter(pk__in=orders).values_list('pk', flat=True))
+        current = {}
+        in_progress = OrderStep.objects.select_for_update().filter(order__in=found, completed=False)
+        for order_step in in_progress.order_by('order', '-timestamp', '-pk'):
+            current.setdefault(order_step.order_id, order_step)  # The latest step not completed yet
+
+        results, completed, created, advanced = [], [], [], []
+        for pk in orders:
+            order_step = current.get(pk)
+            result = {'order': pk, 'from': order_step.step_name if order_step else None}
+            if pk not in found:
+                result.update(result='rejected', error="Order not found.")
+            elif order_step is None:
+                result.update(result='rejected', error="Order has no step in progress.")
+            elif order_step.step_name == step:
+                result['result'] = 'unchanged'
+            elif STEP_ORDER.index(order_step.step_name) > target:
+                result.update(result='rejected', error=f"Cannot move back from '{order_step.step_name}' to '{step}'.")
+            else:
+                completed.append(order_step.pk)
+                skipped = STEP_ORDER[STEP_ORDER.index(order_step.step_name) + 1:target]
+                created += [OrderStep(order_id=pk, step_name=name, completed=True) for name in skipped]
+                created.append(OrderStep(order_id=pk, step_name=step))  # Inserted last, so it is the latest
+                advanced.append(pk)
+                result['result'] = 'advanced'
+            results.append(result)
+
+        if advanced:
+            OrderStep.objects.filter(pk__in=completed).update(completed=True)
+            OrderStep.objects.bulk_create(created)
+            Order.objects.filter(pk__in=advanced).update(order_status=step)
+    return results
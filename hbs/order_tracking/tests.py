@@ -1,3 +1,112 @@
+from decimal import Decimal
 from django.test import TestCase
+from rest_framework.test import APIClient
+from order.models import Order, OrderItem
+from paymentsApp.models import Payment
+from products.models import Item
+from userManager.models import Individual
+from .models import OrderStep
+from .steps import advance_orders, current_steps
 
-# Create your tests here.
+
+class OrderStatusTests(TestCase):
+    """
+    An order's stored status follows its tracking steps as they are created,
+    completed, updated and deleted.
+    """
+
+    def setUp(self):
+        self.order = Order.objects.create(receipient_name="Customer", receipt_email='customer@example.com')
+
+    def assertStatus(self, status):
+        self.assertEqual(Order.objects.get(pk=self.order.pk).order_status, status)
+
+    def test_create_and_complete(self):
+        self.assertStatus(None)
+        step = OrderStep.objects.create(order=self.order, step_name='created')
+        self.assertStatus('created')
+        step.complete_step()  # Creates the next step
+        self.assertStatus('processing')
+
+    def test_update(self):
+        created = OrderStep.objects.create(order=self.order, step_name='created')
+        processing = OrderStep.objects.create(order=self.order, step_name='processing')
+        self.assertStatus('processing')
+        OrderStep.objects.filter(pk=processing.pk).delete()
+        created.step_name = 'packaged'
+        created.save()
+        self.assertStatus('packaged')
+
+    def test_delete(self):
+        OrderStep.objects.create(order=self.order, step_name='created')
+        shipped = OrderStep.objects.create(order=self.order, step_name='shipped')
+        self.assertStatus('shipped')
+        shipped.delete()
+        self.assertStatus('created')
+        OrderStep.objects.get(order=self.order).delete()
+        self.assertStatus(None)
+
+    def test_payment_keeps_status_and_totals(self):
+        # The payment's order was loaded before its steps and lines were written
+        OrderStep.objects.create(order=self.order, step_name='created')
+        OrderItem.objects.create(order=self.order, item=Item.objects.create(name="Book", price=10), quantity=3)
+        Payment.objects.create(order=self.order, payment_method='mpesa', amount=30)
+        order = Order.objects.get(pk=self.order.pk)
+        self.assertEqual((order.order_status, order.total, order.payment_status), ('created', Decimal('30.00'), 'pending'))
+
+
+class AdvanceOrdersTests(TestCase):
+    """
+    Bulk step advancement validates every move against the step order and
+    writes them all with a fixed number of queries.
+    """
+
+    def add_orders(self, count, step='processing'):
+        orders = [Order.objects.create(receipient_name=f"Customer {index}", receipt_email='customer@example.com') for index in range(count)]
+        OrderStep.objects.bulk_create([OrderStep(order=order, step_name=step) for order in orders])
+        Order.objects.filter(pk__in=[order.pk for order in orders]).update(order_status=step)
+        return [order.pk for order in orders]
+
+    def test_query_budget(self):
+        # Savepoint, orders, locked current steps, completions, new steps, order statuses, release
+        for count in (5, 50):
+            orders = self.add_orders(count)
+            with self.assertNumQueries(7):
+                results = advance_orders(orders, 'packaged')
+            self.assertEqual({result['result'] for result in results}, {'advanced'})
+
+    def test_status_matches_steps(self):
+        orders = self.add_orders(3)
+        advance_orders(orders, 'shipped')
+        for order in Order.objects.filter(pk__in=orders).annotate(current=current_steps()):
+            self.assertEqual((order.order_status, order.current), ('shipped', 'shipped'))
+        # The skipped step is recorded as completed
+        self.assertEqual(
+            list(OrderStep.objects.filter(order=orders[0]).order_by('pk').values_list('step_name', 'completed')),
+            [('processing', True), ('packaged', True), ('shipped', False)],
+        )
+
+    def test_invalid_moves(self):
+        shipped, = self.add_orders(1, step='shipped')
+        packaged, = self.add_orders(1, step='packaged')
+        idle = Order.objects.create(receipient_name="Idle", receipt_email='idle@example.com').pk
+        results = {result['order']: result for result in advance_orders([shipped, packaged, idle, 'NOPE00'], 'packaged')}
+        self.assertEqual(results[shipped]['result'], 'rejected')
+        self.assertEqual(results[packaged]['result'], 'unchanged')
+        self.assertEqual(results[idle]['error'], "Order has no step in progress.")
+        self.assertEqual(results['NOPE00']['error'], "Order not found.")
+        self.assertEqual(OrderStep.objects.count(), 2)
+
+    def test_unknown_step(self):
+        with self.assertRaises(ValueError):
+            advance_orders([], 'lost')
+
+    def test_endpoint_is_staff_only(self):
+        orders = self.add_orders(2)
+        client = APIClient()
+        client.force_authenticate(Individual.objects.create_user(username='customer', email='customer@example.com', password='x'))
+        response = client.post('/ordertracking/orders/advance/', {'step': 'packaged', 'orders': orders}, format='json')
+        self.assertEqual(response.status_code, 403)
+        client.force_authenticate(Individual.objects.create_user(username='admin', email='admin@example.com', password='x', is_staff=True))
+        response = client.post('/ordertracking/orders/advance/', {'step': 'packaged', 'orders': orders}, format='json')
+        self.assertEqual((response.status_code, response.json()['advanced']), (200, 2))
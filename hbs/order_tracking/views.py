@@ -1,12 +1,15 @@
 from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
 from .models import Order, OrderItem, OrderStep, OrderChecklist, OrderItemChecklist
 from .serializers import OrderSerializer, OrderItemSerializer, OrderStepSerializer, OrderChecklistSerializer, OrderItemChecklistSerializer
+from .steps import STEP_ORDER, advance_orders, orders_at
 
 class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    keyset_ordering = ('-date', '-id')  # Newest orders first
 
     @action(detail=True, methods=['post'])
     def add_item(self, request, pk=None):
@@ -28,6 +31,36 @@ class OrderViewSet(viewsets.ModelViewSet):
             return Response(step_serializer.data)
         return Response(step_serializer.errors, status=400)
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def advance(self, request):
+        """
+        Move many orders forward to a step in one transaction (staff only).
+
+        The body names the target ``step`` and either the ``orders`` (a list
+        of order ids) or ``from_step``, to move every order currently at
+        that step. Returns the result of each order.
+
+        The steps are written in bulk by advance_orders, which bypasses the
+        OrderStep post_save and post_delete signals: move_to_next_step does
+        not run, and update_order_status does not run either, since the
+        orders' status is written directly.
+        """
+        step, orders, from_step = request.data.get('step'), request.data.get('orders'), request.data.get('from_step')
+        if step not in STEP_ORDER:
+            return Response({'error': f"step must be one of: {', '.join(STEP_ORDER)}."}, status=400)
+        if (orders is None) == (from_step is None):
+            return Response({'error': "Give either orders or from_step."}, status=400)
+        if from_step is not None:
+            if from_step not in STEP_ORDER:
+                return Response({'error': f"from_step must be one of: {', '.join(STEP_ORDER)}."}, status=400)
+            orders = orders_at(from_step)
+        elif not isinstance(orders, list):
+            return Response({'error': "orders must be a list of order ids."}, status=400)
+
+        results = advance_orders(orders, step)
+        advanced = sum(1 for result in results if result['result'] == 'advanced')
+        return Response({'step': step, 'advanced': advanced, 'results': results})
+
     @action(detail=True, methods=['post'])
     def add_checklist(self, request, pk=None):
         order = self.get_object()
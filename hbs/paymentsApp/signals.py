@@ -1,10 +1,8 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from .models import Payment
-from order.models import Receipt
+from order.models import Receipt, PRICE_FIELDS
 from django.core.mail import EmailMessage,send_mail
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 from io import BytesIO
 import logging
 from django.conf import settings
@@ -14,6 +12,66 @@ from userManager.models import Individual
 
 logger = logging.getLogger(__name__)
 
+def render_receipt_pdf(order):
+    """
+    Render the PDF receipt of an order.
+
+    reportlab is imported here rather than at module level, so it is only
+    loaded by the processes that actually generate receipts.
+
+    Returns:
+        bytes: The PDF document.
+    """
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=letter)
+    pdf.setTitle("Harmosoft Book Store Receipt")
+
+    # Header
+    pdf.setFont("Helvetica-Bold", 16)
+    pdf.drawString(100, 750, "Harmosoft Book Store")
+
+    # Order details
+    pdf.setFont("Helvetica", 12)
+    pdf.drawString(100, 730, f"Receipt for Order: {order.id}")
+    pdf.drawString(100, 710, f"Date: {order.date}")
+    pdf.drawString(100, 690, f"Customer: {order.receipient_name}")
+
+    # Items
+    y_position = 670
+    pdf.drawString(100, y_position, "Items:")
+    y_position -= 20
+
+    # Prices from the line snapshots, i.e. what was charged, not the current catalog prices
+    lines = order.items.select_related('item').only('order', 'quantity', *PRICE_FIELDS, 'item__name').order_by('pk')
+    for line in lines:
+        price = f"KSH{line.unit_price}"
+        if line.discounted_unit_price and line.discounted_unit_price != line.unit_price:
+            price += f", KSH{line.discounted_unit_price} after discount"
+        pdf.drawString(100, y_position, f"{line.quantity} x {line.item.name} @ {price} = KSH{line.line_total}")
+        y_position -= 20
+
+    # Total
+    pdf.drawString(100, y_position, f"Total: KSH{order.total}")
+
+    # Footer
+    y_position -= 40
+    pdf.setFont("Helvetica", 10)
+    pdf.drawString(100, y_position, "Note: This is a system-generated receipt.")
+
+    # Save PDF to buffer
+    pdf.showPage()
+    pdf.save()
+
+    # Get the value of the PDF in memory
+    buffer.seek(0)
+    pdf_data = buffer.getvalue()
+    buffer.close()
+    return pdf_data
+
+
 @receiver(post_save, sender=Payment)
 def generate_receipt_and_send_email(sender, instance, created, **kwargs):
     try:
@@ -24,45 +82,7 @@ def generate_receipt_and_send_email(sender, instance, created, **kwargs):
             # Check if receipt has already been created
             if not Receipt.objects.filter(order=order).exists():
                 # Generate receipt PDF
-                buffer = BytesIO()
-                pdf = canvas.Canvas(buffer, pagesize=letter)
-                pdf.setTitle("Harmosoft Book Store Receipt")
-
-                # Header
-                pdf.setFont("Helvetica-Bold", 16)
-                pdf.drawString(100, 750, "Harmosoft Book Store")
-
-                # Order details
-                pdf.setFont("Helvetica", 12)
-                pdf.drawString(100, 730, f"Receipt for Order: {order.id}")
-                pdf.drawString(100, 710, f"Date: {order.date}")
-                pdf.drawString(100, 690, f"Customer: {order.receipient_name}")
-
-                # Items
-                y_position = 670
-                pdf.drawString(100, y_position, "Items:")
-                y_position -= 20
-
-                for item in order.items.all():
-                    pdf.drawString(100, y_position, f"{item.quantity} x {item.item.name} @ KSH{item.item.price}")
-                    y_position -= 20
-
-                # Total
-                pdf.drawString(100, y_position, f"Total: KSH{order.total}")
-
-                # Footer
-                y_position -= 40
-                pdf.setFont("Helvetica", 10)
-                pdf.drawString(100, y_position, "Note: This is a system-generated receipt.")
-
-                # Save PDF to buffer
-                pdf.showPage()
-                pdf.save()
-
-                # Get the value of the PDF in memory
-                buffer.seek(0)
-                pdf_data = buffer.getvalue()
-                buffer.close()
+                pdf_data = render_receipt_pdf(order)
 
                 # Create a receipt instance and save it
                 receipt = Receipt.objects.create(order=order)
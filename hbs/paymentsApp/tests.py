@@ -1,3 +1,27 @@
+from decimal import Decimal
+from unittest import mock
 from django.test import TestCase
+from reportlab.pdfgen.canvas import Canvas
+from order.models import Order, OrderItem
+from products.models import Item
+from .signals import render_receipt_pdf
 
-# Create your tests here.
+
+class ReceiptTests(TestCase):
+    """Receipts show the prices the customer was charged, from the order lines."""
+
+    def setUp(self):
+        self.item = Item.objects.create(name="Atlas", price=Decimal('200.00'), discount=Decimal('10.00'))
+        self.order = Order.objects.create(receipient_name="Customer", receipt_email='customer@example.com')
+        OrderItem.objects.create(order=self.order, item=self.item, quantity=2)
+
+    def render_lines(self):
+        with mock.patch.object(Canvas, 'drawString', autospec=True) as draw:
+            with self.assertNumQueries(1):
+                render_receipt_pdf(self.order)
+        return [call.args[3] for call in draw.call_args_list]
+
+    def test_prices_are_taken_at_order_time(self):
+        self.item.price = Decimal('500.00')
+        self.item.save()
+        self.assertIn("2 x Atlas @ KSH200.00, KSH180.00 after discount = KSH360.00", self.render_lines())
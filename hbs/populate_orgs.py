@@ -1,20 +1,16 @@
-import pandas as pd
 import requests
 import json
+from products.spreadsheets import iter_rows
 
 BASE_URL = 'http://127.0.0.1:8000/'  # Replace with your actual base URL
 REGISTER_URL = f"{BASE_URL}/register/"
 
 def generate_organizations(file_path):
-    # Determine file type and read data
-    if file_path.endswith('.xlsx') or file_path.endswith('.xls'):
-        df = pd.read_excel(file_path)
-    elif file_path.endswith('.csv'):
-        df = pd.read_csv(file_path)
-    else:
+    # Determine file type and stream the rows
+    if not file_path.endswith(('.xlsx', '.csv')):
         raise ValueError("Unsupported file format. Please use .xlsx or .csv")
 
-    for index, row in df.iterrows():
+    for row in iter_rows(file_path):
         school_name = row.get('SCHOOL_NAME')
         level = row.get('LEVEL')
         county = row.get('COUNTY')
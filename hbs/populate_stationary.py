@@ -1,9 +1,10 @@
 import os
-import pandas as pd
 import requests
 import logging
 from pathlib import Path
 from urllib.parse import urlparse
+from products.image_fetcher import ImageFetcher
+from products.spreadsheets import iter_rows, iter_chunks
 
 # Set the base URL for API requests
 BASE_URL = 'http://127.0.0.1:80/items/'  # Replace with your actual base URL
@@ -14,6 +15,13 @@ LOG_FILE = 'failed_books.log'
 ISBN_LOG_FILE = 'isbn_log.txt'
 logging.basicConfig(filename=LOG_FILE, level=logging.ERROR, format='%(asctime)s - %(message)s')
 
+# Downloaded images are cached here, so an interrupted run resumes without refetching
+IMAGE_CACHE_DIR = '.image_cache'
+_image_fetcher = None
+
+# Rows read from a sheet (and images prefetched) at a time
+CHUNK_SIZE = 200
+
 # Path to data directory
 DATA_FOLDER = Path("C:\\Users\\karan\\Documents\\Github\\Harmosoft-Book-Store-Backend\\hbs\\data\\stationary")  # Change this to your actual data folder path
 
@@ -45,7 +53,7 @@ def get_excel_files_from_folder(folder):
     excel_files = []
     for root, dirs, files in os.walk(folder):
         for file in files:
-            if file.endswith('.xlsx') or file.endswith('.xls'):
+            if file.endswith('.xlsx'):  # Legacy .xls workbooks cannot be streamed
                 excel_files.append(os.path.join(root, file))
     return excel_files
 
@@ -58,15 +66,23 @@ def map_category_from_folder(folder_name):
 
 
 
+def get_image_fetcher():
+    """The image cache, created (with its directory) when the script first needs it."""
+    global _image_fetcher
+    if _image_fetcher is None:
+        _image_fetcher = ImageFetcher(IMAGE_CACHE_DIR)
+    return _image_fetcher
+
+def prefetch_images(rows):
+    """Download the images of a chunk of rows concurrently into the local cache."""
+    get_image_fetcher().fetch_all(f"{BASE_IMAGE_URL}{row['image-src']}" for row in rows if isinstance(row.get('image-src'), str))
+
 def download_image(image_url):
-    """Download the image from the URL if available."""
-    try:
-        response = requests.get(image_url)
-        if response.status_code == 200:
-            image_name = urlparse(image_url).path.split('/')[-1]
-            return (image_name, response.content)
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to download image: {e}")
+    """Return the image for the URL from the local cache, downloading it if needed."""
+    image_file = get_image_fetcher().fetch_all([image_url]).get(image_url)
+    if image_file:
+        image_name = urlparse(image_url).path.split('/')[-1]
+        return (image_name, image_file.read_bytes())
     return None
 
 def generate_items(file_path):
@@ -75,77 +91,76 @@ def generate_items(file_path):
     study_level = 'ALL'  # Map study level
     category = map_category_from_folder(folder_name)  # Set category based on folder name
     try:
-        # Load the Excel file
-        df = pd.read_excel(file_path)
-        total_items = len(df)
+        # Stream the sheet in chunks instead of loading it whole
         processed_items = 0
 
-        for index, row in df.iterrows():
-            item_name = row.get('name', None)
-            if not item_name:
-                logging.error(f"Item without name found in {file_path}")
-                continue  # Skip rows without item names
-
-            # # Extract and clean the ISBN
-            # ISBN = str(row.get('ISBN', '')).replace('ISBN:', '').strip()
-
-            # # Check for duplicate ISBN
-            # if ISBN in processed_isbns:
-            #     print(f"Duplicate ISBN {ISBN} found. Skipping {item_name}.")
-            #     continue
-
-            # Prepare data for sending
-            subject = 'All'
-            price = str(row.get('price', '0')).replace('KES', '').replace(',', '').strip()
-            tag = folder_name.capitalize()
-
-            payload = {
-                "name": item_name,
-                "description": row.get('description', 'No description provided.'),
-                "price": price,
-                "visibility": bool(row.get('visibility', False)),
-                "stock_availability": bool(row.get('stock_availability', False)),
-                "subject": subject,
-                "publisher": row.get('Author', 'N/A'),
-                "category": category,
-                "grade": grade,
-                "study_level": study_level,
-                "curriculum": row.get('curriculum', 'CBC'),
-                # "ISBN": ISBN,
-                "tag": tag
-            }
-
-            # Handle image if available
-            image_path = row.get('image-src')
-            files = None
-            if image_path:
-                image_url = f"{BASE_IMAGE_URL}{image_path}"
-                image = download_image(image_url)
-                if image:
-                    image_name, image_data = image
-                    files = {'image': (image_name, image_data, 'application/octet-stream')}  # Prepare image for upload
-
-            try:
-                # Send a POST request to the API
-                if files:
-                    response = requests.post(BASE_URL, data=payload, files=files)
-                else:
-                    response = requests.post(BASE_URL, json=payload)
-
-                if response.status_code == 201:
-                    processed_items += 1
-                    remaining_items = total_items - processed_items
-                    print(f"Successfully added: {item_name}. Processed {processed_items}/{total_items}. Remaining: {remaining_items}")
-                    # save_isbn_to_log(ISBN)  # Save successful ISBN to log
-                    # processed_isbns.add(ISBN)
-                elif response.status_code == 400 and "ISBN" in response.json():
-                    # Log ISBN duplication error
-                    logging.error(f"Failed to add {item_name} - ISBN already exists: {ISBN}") # type: ignore
-                    # save_isbn_to_log(ISBN)  # Save ISBN that caused error to log
-                else:
-                    logging.error(f"Failed to add {item_name} - {response.status_code} - {response.text}")
-            except requests.exceptions.RequestException as e:
-                logging.error(f"Error adding {item_name} from {file_path}: {str(e)}")
+        for rows in iter_chunks(iter_rows(file_path), CHUNK_SIZE):
+            prefetch_images(rows)
+            for row in rows:
+                item_name = row.get('name', None)
+                if not item_name:
+                    logging.error(f"Item without name found in {file_path}")
+                    continue  # Skip rows without item names
+
+                # # Extract and clean the ISBN
+                # ISBN = str(row.get('ISBN', '')).replace('ISBN:', '').strip()
+
+                # # Check for duplicate ISBN
+                # if ISBN in processed_isbns:
+                #     print(f"Duplicate ISBN {ISBN} found. Skipping {item_name}.")
+                #     continue
+
+                # Prepare data for sending
+                subject = 'All'
+                price = str(row.get('price', '0')).replace('KES', '').replace(',', '').strip()
+                tag = folder_name.capitalize()
+
+                payload = {
+                    "name": item_name,
+                    "description": row.get('description', 'No description provided.'),
+                    "price": price,
+                    "visibility": bool(row.get('visibility', False)),
+                    "stock_availability": bool(row.get('stock_availability', False)),
+                    "subject": subject,
+                    "publisher": row.get('Author', 'N/A'),
+                    "category": category,
+                    "grade": grade,
+                    "study_level": study_level,
+                    "curriculum": row.get('curriculum', 'CBC'),
+                    # "ISBN": ISBN,
+                    "tag": tag
+                }
+
+                # Handle image if available
+                image_path = row.get('image-src')
+                files = None
+                if image_path:
+                    image_url = f"{BASE_IMAGE_URL}{image_path}"
+                    image = download_image(image_url)
+                    if image:
+                        image_name, image_data = image
+                        files = {'image': (image_name, image_data, 'application/octet-stream')}  # Prepare image for upload
+
+                try:
+                    # Send a POST request to the API
+                    if files:
+                        response = requests.post(BASE_URL, data=payload, files=files)
+                    else:
+                        response = requests.post(BASE_URL, json=payload)
+
+                    if response.status_code == 201:
+                        processed_items += 1
+                        print(f"Successfully added: {item_name}. Processed {processed_items} from {file_path}.")
+                        # save_isbn_to_log(ISBN)  # Save successful ISBN to log
+                        # processed_isbns.add(ISBN)
+                    elif response.status_code == 400 and "ISBN" in response.json():
+                        # Log ISBN duplication error
+                        logging.error(f"Failed to add {item_name} - ISBN already exists: {ISBN}") # type: ignore
+                        # save_isbn_to_log(ISBN)  # Save ISBN that caused error to log
+                    else:
+                        logging.error(f"Failed to add {item_name} - {response.status_code} - {response.text}")
+                except requests.exceptions.RequestException as e:
+                    logging.error(f"Error adding {item_name} from {file_path}: {str(e)}")
 
     except Exception as e:
         logging.error(f"Error processing file {file_path}: {str(e)}")
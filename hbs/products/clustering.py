@@ -0,0 +1,324 @@
+import time
+from collections import Counter, defaultdict
+from itertools import accumulate
+from django.db import transaction
+from django.db.models import Q
+from .facets import apply_facet_deltas, facet_key
+from .versions import bump_versions
+from .neighbors import neighbor_points, defer_neighbor_refresh
+
+# Items are clustered within groups sharing these classification fields
+GROUP_FIELDS = ('tag', 'category', 'subject', 'grade', 'curriculum')
+
+# Pack labels ordered from the cheapest cluster to the most expensive one
+PACK_LABELS = ('Economy Pack', 'Value Pack', 'Premium Pack')
+DEFAULT_PACK = PACK_LABELS[0]
+
+# Groups with more distinct prices than this are solved with the per-group
+# dynamic program instead of the exhaustive vectorized search
+VECTORIZED_MAX_DISTINCT = 256
+
+
+def _segment_cost(weights, sums, squares, start, end):
+    """Within-segment sum of squared distances to the mean for points [start, end)."""
+    total = sums[end] - sums[start]
+    return (squares[end] - squares[start]) - total * total / (weights[end] - weights[start])
+
+
+def optimal_breaks(values, n_clusters=3):
+    """
+    Solve 1-D k-means exactly over the given values.
+
+    The distinct values are sorted and weighted by their multiplicity, then
+    split into contiguous segments with a dynamic program whose layers are
+    filled by divide and conquer (the optimal split point is monotone), so
+    the whole run is O(n log n). Ties are broken towards the leftmost split,
+    which makes the result fully deterministic.
+
+    Args:
+        values (list): Numeric values to cluster.
+        n_clusters (int): Maximum number of clusters. Fewer are used when
+            there are fewer distinct values.
+
+    Returns:
+        tuple: The sorted distinct values and the indices into them at which
+        each cluster after the first starts.
+    """
+    counts = defaultdict(int)
+    for value in values:
+        counts[float(value)] += 1
+    distinct = sorted(counts)
+    n_clusters = max(1, min(n_clusters, len(distinct)))
+
+    weights = [0.0, *accumulate(float(counts[value]) for value in distinct)]
+    sums = [0.0, *accumulate(counts[value] * value for value in distinct)]
+    squares = [0.0, *accumulate(counts[value] * value * value for value in distinct)]
+    size = len(distinct)
+
+    def cost(start, end):
+        return _segment_cost(weights, sums, squares, start, end)
+
+    # best[i]: optimal cost of the first i distinct values in the current layer
+    best = [cost(0, i) if i else 0.0 for i in range(size + 1)]
+    splits = []
+    for layer in range(2, n_clusters):
+        current = [float('inf')] * (size + 1)
+        argmin = [0] * (size + 1)
+
+        def solve(low, high, opt_low, opt_high):
+            if low > high:
+                return
+            middle = (low + high) // 2
+            for split in range(max(opt_low, layer - 1), min(opt_high, middle - 1) + 1):
+                candidate = best[split] + cost(split, middle)
+                if candidate < current[middle]:
+                    current[middle] = candidate
+                    argmin[middle] = split
+            solve(low, middle - 1, opt_low, argmin[middle])
+            solve(middle + 1, high, argmin[middle], opt_high)
+
+        solve(layer, size, layer - 1, size - 1)
+        best = current
+        splits.append(argmin)
+
+    breaks = []
+    if n_clusters > 1:
+        # Last layer is only needed for the full range of values
+        last, end = float('inf'), size
+        for split in range(n_clusters - 1, size):
+            candidate = best[split] + cost(split, size)
+            if candidate < last:
+                last, end = candidate, split
+        breaks.append(end)
+        for argmin in reversed(splits):
+            end = argmin[end]
+            breaks.append(end)
+    return distinct, breaks[::-1]
+
+
+def pack_indices(prices, n_clusters=3):
+    """
+    Assign each price the rank of its optimal 1-D k-means cluster.
+
+    Args:
+        prices (list): Prices to cluster.
+        n_clusters (int): Maximum number of clusters.
+
+    Returns:
+        list: Cluster ranks (0 is the cheapest cluster) in the order of the given prices.
+    """
+    if not prices:
+        return []
+    distinct, breaks = optimal_breaks(prices, n_clusters)
+    rank, ranks = 0, {}
+    for index, value in enumerate(distinct):
+        while rank < len(breaks) and index >= breaks[rank]:
+            rank += 1
+        ranks[value] = rank
+    return [ranks[float(price)] for price in prices]
+
+
+def label_prices(prices):
+    """
+    Assign a pack label to each price of a single group.
+
+    Args:
+        prices (list): Prices of the items in the group.
+
+    Returns:
+        list: Pack labels in the same order as the given prices. Groups with
+        fewer than 3 items all fall into the default (Economy) pack.
+    """
+    if len(prices) < 3:
+        return [DEFAULT_PACK] * len(prices)
+    return [PACK_LABELS[rank] for rank in pack_indices(prices, len(PACK_LABELS))]
+
+
+def label_groups(prices, group_ids):
+    """
+    Assign pack labels to every row of many price groups in one NumPy pass.
+
+    Rows are sorted by (group, price) and duplicate prices are collapsed into
+    weighted points. For every group, all pairs of split points over its
+    distinct prices are scored with segmented prefix sums and the cheapest
+    pair is kept, which gives the same exact optimum as ``label_prices``.
+    The few groups with more than ``VECTORIZED_MAX_DISTINCT`` distinct prices
+    fall back to ``optimal_breaks``.
+
+    Args:
+        prices (array-like): Price of every row.
+        group_ids (array-like): Integer group id of every row.
+
+    Returns:
+        numpy.ndarray: Pack label of every row, in input order. Groups with
+        fewer than 3 items all fall into the default (Economy) pack.
+    """
+    import numpy as np  # Loaded on first use to keep it out of worker boot
+
+    prices = np.asarray(prices, dtype=np.float64)
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    if not len(prices):
+        return np.array([], dtype=object)
+
+    # Collapse rows into distinct (group, price) points sorted by group then price
+    order = np.lexsort((prices, group_ids))
+    sorted_groups, sorted_prices = group_ids[order], prices[order]
+    is_new = np.ones(len(order), dtype=bool)
+    is_new[1:] = (sorted_groups[1:] != sorted_groups[:-1]) | (sorted_prices[1:] != sorted_prices[:-1])
+    point_starts = np.flatnonzero(is_new)
+    point_of_row = np.empty(len(order), dtype=np.int64)
+    point_of_row[order] = np.cumsum(is_new) - 1
+    values = sorted_prices[point_starts]
+    point_groups = sorted_groups[point_starts]
+    weights = np.diff(np.append(point_starts, len(order))).astype(np.float64)
+
+    # Per-group offsets into the points, distinct price counts and item counts
+    group_first = np.flatnonzero(np.r_[True, point_groups[1:] != point_groups[:-1]])
+    distinct = np.diff(np.append(group_first, len(values)))
+    group_items = np.add.reduceat(weights, group_first)
+    local_index = np.arange(len(values)) - np.repeat(group_first, distinct)
+
+    point_group_index = np.repeat(np.arange(len(group_first)), distinct)
+
+    # Prefix sums with a leading zero per group: prefix[base[g] + i] holds the
+    # sum over the first i points of group g. Each group's sums are
+    # accumulated on their own, in rows of a zero-padded matrix shared by the
+    # groups of the same power-of-two width, not as differences of one running
+    # sum over all groups: so a group's costs are bit for bit those of
+    # optimal_breaks, and its labels never depend on the other groups of the
+    # batch when two splits cost the same
+    base = group_first + np.arange(len(group_first))
+    slot = np.repeat(base, distinct) + local_index + 1
+    widths = np.left_shift(1, np.ceil(np.log2(distinct)).astype(np.int64))
+    point_width = widths[point_group_index]
+    columns = (weights, weights * values, weights * values * values)
+    prefixes = [np.zeros(len(values) + len(group_first)) for _ in columns]
+    for width in np.unique(widths):
+        width_groups = np.flatnonzero(widths == width)
+        row_of_group = np.zeros(len(group_first), dtype=np.int64)
+        row_of_group[width_groups] = np.arange(len(width_groups))
+        points = np.flatnonzero(point_width == width)
+        rows, positions = row_of_group[point_group_index[points]], local_index[points]
+        for column, prefix in zip(columns, prefixes):
+            matrix = np.zeros((len(width_groups), width))
+            matrix[rows, positions] = column[points]
+            prefix[slot[points]] = np.cumsum(matrix, axis=1)[rows, positions]
+
+    def cost(group, start, end):
+        weight_sum, total, squares = (
+            prefix[base[group] + end] - prefix[base[group] + start] for prefix in prefixes
+        )
+        return squares - total * total / weight_sum
+
+    first_break = np.full(len(group_first), np.iinfo(np.int64).max)
+    second_break = np.full(len(group_first), np.iinfo(np.int64).max)
+    first_break[distinct == 2] = 1
+
+    # Exhaustive search over split pairs (a, b), enumerated b-major so the
+    # first minimum matches the leftmost tie-breaking of the dynamic program
+    searched = np.flatnonzero((distinct >= 3) & (distinct <= VECTORIZED_MAX_DISTINCT))
+    if len(searched):
+        pair_counts = (distinct[searched] - 1) * (distinct[searched] - 2) // 2
+        pair_group = np.repeat(searched, pair_counts)
+        pair_offsets = np.cumsum(pair_counts) - pair_counts
+        pair_index = np.arange(pair_counts.sum()) - np.repeat(pair_offsets, pair_counts)
+        second = np.floor((3 + np.sqrt(1 + 8 * pair_index)) / 2).astype(np.int64)
+        second -= (second - 1) * (second - 2) // 2 > pair_index
+        second += second * (second - 1) // 2 <= pair_index
+        first = pair_index - (second - 1) * (second - 2) // 2 + 1
+        size = distinct[pair_group]
+        totals = (cost(pair_group, 0, first) + cost(pair_group, first, second)) + cost(pair_group, second, size)
+        best = np.minimum.reduceat(totals, pair_offsets)
+        winners = np.flatnonzero(totals == np.repeat(best, pair_counts))
+        winner_groups, first_winner = np.unique(pair_group[winners], return_index=True)
+        first_break[winner_groups] = first[winners[first_winner]]
+        second_break[winner_groups] = second[winners[first_winner]]
+
+    for group in np.flatnonzero(distinct > VECTORIZED_MAX_DISTINCT):
+        start = group_first[group]
+        points = slice(start, start + distinct[group])
+        _, breaks = optimal_breaks(np.repeat(values[points], weights[points].astype(np.int64)), len(PACK_LABELS))
+        first_break[group], second_break[group] = breaks
+
+    ranks = (local_index >= first_break[point_group_index]).astype(np.int64)
+    ranks += local_index >= second_break[point_group_index]
+    ranks[group_items[point_group_index] < 3] = 0
+    return np.asarray(PACK_LABELS, dtype=object)[ranks[point_of_row]]
+
+
+def cluster_group_filter(groups):
+    """
+    Build a filter matching the items of any of the given cluster groups.
+
+    Args:
+        groups (iterable): (tag, category, subject, grade, curriculum) tuples.
+
+    Returns:
+        Q: A filter usable on the Item queryset.
+    """
+    query = Q(pk__in=[])
+    for group in groups:
+        query |= Q(**dict(zip(GROUP_FIELDS, group)))
+    return query
+
+
+def recluster_items(queryset=None, batch_size=500, changes=None, refresh_neighbors=True):
+    """
+    Recompute the price cluster of every item in the queryset in one pass.
+
+    The (sku, price, group key) rows are read once, every distinct group is
+    clustered exactly once in a single vectorized pass and only the rows whose
+    label changed are written back with ``bulk_update``, so no per-row
+    post_save signal is fired. The facet counts of the moved rows are updated
+    in the same transaction, and their neighbors are refreshed once it commits.
+
+    Args:
+        queryset (QuerySet): Items to recluster. Defaults to the whole catalog.
+            Whole groups should be passed, since a group is clustered from the
+            items present in the queryset only.
+        batch_size (int): Number of rows written per UPDATE batch.
+        changes (dict): If given, filled with the new label of every updated sku.
+        refresh_neighbors (bool): Refresh the neighbors of the moved items.
+            Callers that rebuild the neighbor table afterwards can skip it.
+
+    Returns:
+        dict: Timing and counts of the run (groups, items, updated, elapsed_ms).
+    """
+    from .models import Item
+
+    started = time.perf_counter()
+    if queryset is None:
+        queryset = Item.objects.all()
+
+    rows = list(
+        queryset.order_by().values_list('sku', 'price', 'cluster', 'study_level', *GROUP_FIELDS).iterator(chunk_size=2000)
+    )
+    group_index = {}
+    group_ids = [group_index.setdefault(tuple(row[4:]), len(group_index)) for row in rows]
+    labels = label_groups([row[1] for row in rows], group_ids)
+
+    changed, facet_deltas, neighbor_moves = [], Counter(), set()
+    for (sku, price, cluster, study_level, *group), label in zip(rows, labels):
+        if cluster != label:
+            changed.append(Item(sku=sku, cluster=label))
+            values = dict(zip(GROUP_FIELDS, group), sku=sku, price=price, study_level=study_level)
+            facet_deltas[facet_key({**values, 'cluster': cluster})] -= 1
+            facet_deltas[facet_key({**values, 'cluster': label})] += 1
+            neighbor_moves |= neighbor_points({**values, 'cluster': cluster}) | neighbor_points({**values, 'cluster': label})
+
+    with transaction.atomic():
+        Item.objects.bulk_update(changed, ['cluster'], batch_size=batch_size)
+        apply_facet_deltas(facet_deltas)
+        if changed:
+            bump_versions('items')
+            if refresh_neighbors:
+                defer_neighbor_refresh(neighbor_moves)
+    if changes is not None:
+        changes.update((item.sku, item.cluster) for item in changed)
+
+    return {
+        'groups': len(group_index),
+        'items': len(rows),
+        'updated': len(changed),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 2),
+    }
@@ -0,0 +1,54 @@
+import threading
+from django.db import transaction
+
+# Per-thread batch of each flush function, with the on_commit callback holding it
+_batches = threading.local()
+
+
+def defer(flush, **values):
+    """
+    Queue values for a flush function to process once the current transaction commits.
+
+    Every call for the same ``flush`` within a transaction adds to one batch,
+    and ``flush`` is called once, with the batch as keyword arguments (name ->
+    list of the queued values, in order and possibly repeated). However many
+    rows a transaction writes, its follow-up work therefore runs once.
+
+    The batch is held by the closure registered with ``on_commit``, so it
+    belongs to the transaction, or savepoint, it was started in: when that is
+    rolled back, the batch is discarded with the callback and never reaches
+    the flush of a later transaction. Each savepoint level starts a batch of
+    its own. Outside of an atomic block ``flush`` runs immediately.
+
+    Args:
+        flush (callable): Function called with the batch. It runs with
+            ``robust=True``: an exception is logged instead of raised.
+        **values (iterable): Values to add to the batch, per keyword.
+    """
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        transaction.on_commit(lambda: flush(**{name: list(queued) for name, queued in values.items()}), robust=True)
+        return
+
+    if not hasattr(_batches, 'pending'):
+        _batches.pending = {}
+    key = (connection.alias, flush)
+    batch, callback = _batches.pending.get(key, (None, None))
+    savepoints = set(connection.savepoint_ids)
+    if callback is None or not any(
+        registered is callback and started == savepoints for started, registered, _ in connection.run_on_commit
+    ):
+        # No batch yet at this level of the transaction: the last one was
+        # flushed, rolled back or started in another savepoint
+        batch = {}
+
+        def callback():
+            if _batches.pending.get(key, (None, None))[1] is callback:
+                del _batches.pending[key]
+            flush(**batch)
+
+        transaction.on_commit(callback, robust=True)
+        _batches.pending[key] = batch, callback
+
+    for name, queued in values.items():
+        batch.setdefault(name, []).extend(queued)
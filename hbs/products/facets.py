@@ -0,0 +1,136 @@
+from collections import Counter
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+# Item fields the catalog can be filtered and faceted on
+FACET_FIELDS = ('category', 'grade', 'study_level', 'curriculum', 'subject', 'cluster')
+
+
+def facet_key(values):
+    """
+    Build the facet key of an item.
+
+    Args:
+        values: An Item, or a mapping of field name to value.
+
+    Returns:
+        tuple: The item's values of FACET_FIELDS.
+    """
+    if isinstance(values, dict):
+        return tuple(values[field] for field in FACET_FIELDS)
+    return tuple(getattr(values, field) for field in FACET_FIELDS)
+
+
+def apply_facet_deltas(deltas):
+    """
+    Add count deltas to the facet-count cache.
+
+    Each key is updated with a single ``F()`` increment, so concurrent writers
+    never lose updates. Rows for new keys are created on first use.
+
+    Args:
+        deltas (dict): Facet key -> change in the number of items.
+    """
+    from .models import FacetCount
+
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        lookup = dict(zip(FACET_FIELDS, key))
+        if FacetCount.objects.filter(**lookup).update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                FacetCount.objects.create(count=delta, **lookup)
+        except IntegrityError:
+            # Created concurrently in the meantime
+            FacetCount.objects.filter(**lookup).update(count=F('count') + delta)
+
+
+def item_moved(old_key, new_key):
+    """Record an item leaving one facet key (None if new) for another (None if deleted)."""
+    if old_key == new_key:
+        return
+    deltas = Counter()
+    if old_key is not None:
+        deltas[old_key] -= 1
+    if new_key is not None:
+        deltas[new_key] += 1
+    apply_facet_deltas(deltas)
+
+
+def recount_facet_keys(keys):
+    """
+    Recount the items of some facet keys from the Item table.
+
+    Used instead of deltas when an item's previous facet values were not
+    known when it was written, so the counts of its keys are exact again.
+
+    Args:
+        keys: Facet keys to recount.
+    """
+    from .models import Item, FacetCount
+
+    for key in set(keys):
+        lookup = dict(zip(FACET_FIELDS, key))
+        count = Item.objects.filter(**lookup).count()
+        if FacetCount.objects.filter(**lookup).update(count=count):
+            continue
+        try:
+            with transaction.atomic():
+                FacetCount.objects.create(count=count, **lookup)
+        except IntegrityError:
+            # Created concurrently in the meantime
+            FacetCount.objects.filter(**lookup).update(count=count)
+
+
+def rebuild_facet_counts():
+    """
+    Recompute the facet-count cache from the Item table with one GROUP BY.
+
+    Returns:
+        int: Number of facet keys stored.
+    """
+    from .models import Item, FacetCount
+
+    rows = Item.objects.order_by().values(*FACET_FIELDS).annotate(total=Count('sku'))
+    with transaction.atomic():
+        FacetCount.objects.all().delete()
+        FacetCount.objects.bulk_create(
+            [FacetCount(count=row.pop('total'), **row) for row in rows], batch_size=1000
+        )
+    return FacetCount.objects.count()
+
+
+def facet_counts(filters=None, items=None):
+    """
+    Count the items per value of every facet under the given filters.
+
+    Counts are summed from the facet-count cache, which holds one row per
+    combination of facet values, so no GROUP BY runs over the Item table.
+    Each facet is counted with the filters on the other facets only, so the
+    values of a facet stay selectable once one of them is chosen.
+
+    The cache only covers the whole catalog: counts within a subset of the
+    items (e.g. search results) are grouped from that queryset instead.
+
+    Args:
+        filters (dict): Facet field -> list of selected values.
+        items (QuerySet): Items to count, not yet filtered on the facets.
+            Defaults to the whole catalog.
+
+    Returns:
+        dict: Facet field -> {value: item count}, values in descending count order.
+    """
+    from .models import FacetCount
+
+    filters = {field: list(values) for field, values in (filters or {}).items() if values}
+    counts = {}
+    for field in FACET_FIELDS:
+        others = {f'{other}__in': values for other, values in filters.items() if other != field}
+        if items is None:
+            rows = FacetCount.objects.filter(count__gt=0, **others).values(field).annotate(total=Sum('count'))
+        else:
+            rows = items.filter(**others).order_by().values(field).annotate(total=Count('pk'))
+        counts[field] = dict(rows.order_by('-total', field).values_list(field, 'total'))
+    return counts
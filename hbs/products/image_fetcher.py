@@ -0,0 +1,144 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# Defaults for catalog image downloads
+DEFAULT_WORKERS = 8
+DEFAULT_TIMEOUT = (5, 30)  # (connect, read) seconds
+DEFAULT_RETRIES = 3
+
+# Name of the checkpoint file kept in the cache directory
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+def build_session(workers=DEFAULT_WORKERS, retries=DEFAULT_RETRIES):
+    """
+    Create a ``requests.Session`` with a connection pool sized for the workers.
+
+    Connection errors and 429/5xx responses are retried with exponential
+    backoff by urllib3, so a flaky image host does not fail the import.
+
+    Args:
+        workers (int): Number of threads sharing the session.
+        retries (int): Retries per request.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=('GET',), raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+class ImageFetcher:
+    """
+    Downloads catalog images concurrently into a content-addressed cache.
+
+    Images are stored under ``<cache_dir>/<sha256[:2]>/<sha256><ext>``, so an
+    image shared by many rows is written once. Every finished URL is appended
+    to a manifest in the cache directory, which is the checkpoint: a rerun
+    after a crash only downloads the URLs that are not in it yet.
+
+    Attributes:
+        cache_dir (Path): Directory holding the cached images and the manifest.
+        workers (int): Size of the download thread pool.
+        timeout (tuple): (connect, read) timeout of each request.
+    """
+
+    def __init__(self, cache_dir, workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT,
+                 retries=DEFAULT_RETRIES, session=None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.timeout = timeout
+        self.session = session or build_session(workers, retries)
+        self.manifest_path = self.cache_dir / MANIFEST_NAME
+        self.manifest = self._load_manifest()
+        self._lock = threading.Lock()
+
+    def _load_manifest(self):
+        """Read the url -> cached file name checkpoint written by earlier runs."""
+        manifest = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Partial line from an interrupted run
+                    if (self.cache_dir / entry['file']).exists():
+                        manifest[entry['url']] = entry['file']
+        return manifest
+
+    def _record(self, url, file_name):
+        with self._lock:
+            self.manifest[url] = file_name
+            with open(self.manifest_path, 'a') as file:
+                file.write(json.dumps({'url': url, 'file': file_name}) + '\n')
+
+    def _store(self, content, url):
+        """Write the image under its content hash and return its cache-relative name."""
+        digest = hashlib.sha256(content).hexdigest()
+        extension = os.path.splitext(urlparse(url).path)[1].lower()[:8]
+        file_name = f"{digest[:2]}/{digest}{extension}"
+        path = self.cache_dir / file_name
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            # Write then rename, so a crash never leaves a truncated image behind
+            partial = path.with_name(f"{path.name}.{threading.get_ident()}.part")
+            partial.write_bytes(content)
+            os.replace(partial, path)
+        return file_name
+
+    def _fetch(self, url):
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+        except Exception as exc:
+            logger.error(f"Failed to download image {url}: {exc}")
+            return url, None
+        if response.status_code != 200:
+            logger.error(f"Failed to download image {url}: HTTP {response.status_code}")
+            return url, None
+        file_name = self._store(response.content, url)
+        self._record(url, file_name)
+        return url, file_name
+
+    def path_for(self, url):
+        """Return the cached file of a URL, or None if it was not fetched."""
+        file_name = self.manifest.get(url)
+        return self.cache_dir / file_name if file_name else None
+
+    def fetch_all(self, urls):
+        """
+        Download every URL that is not cached yet.
+
+        Args:
+            urls (iterable): Image URLs. Duplicates are fetched once.
+
+        Returns:
+            dict: Cached file path of every URL, or None for failed downloads.
+        """
+        urls = list(dict.fromkeys(url for url in urls if url))
+        missing = [url for url in urls if url not in self.manifest]
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for _ in pool.map(self._fetch, missing):
+                    pass
+        return {url: self.path_for(url) for url in urls}
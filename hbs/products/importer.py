@@ -0,0 +1,300 @@
+import time
+from collections import Counter
+from urllib.parse import urljoin
+from django.core.files import File
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from rest_framework import serializers
+from .models import Item, discounted_price_for
+from .clustering import recluster_items, cluster_group_filter
+from .short_ids import allocate_codes
+from .spreadsheets import SpreadsheetError, iter_chunks
+from .facets import apply_facet_deltas, facet_key
+from .versions import bump_versions
+from .deferred import defer
+from .neighbors import neighbor_points, defer_neighbor_refresh
+from .packs import alternative_key, defer_pack_invalidation
+
+# Item fields a catalog row may set
+IMPORT_FIELDS = [
+    'name', 'ISBN', 'description', 'price', 'discount', 'visibility', 'stock_availability',
+    'subject', 'publisher', 'category', 'grade', 'study_level', 'curriculum', 'tag',
+]
+
+# Columns that may hold an image URL (the scraped sheets use 'image-src')
+IMAGE_COLUMNS = ('image', 'image-src')
+
+
+class ItemImportSerializer(serializers.ModelSerializer):
+    """
+    Validates a single catalog row.
+
+    The ISBN uniqueness check is left out on purpose: rows are upserted by
+    ISBN, and existing ISBNs are resolved for a whole batch in one query.
+    """
+    class Meta:
+        model = Item
+        fields = IMPORT_FIELDS
+        extra_kwargs = {'ISBN': {'validators': []}}
+
+
+def clean_row(row, defaults=None):
+    """
+    Normalize a raw spreadsheet row into Item field values.
+
+    Blank cells are dropped so model defaults apply, prices lose their
+    currency prefix and thousands separators, and ISBNs lose their 'ISBN:'
+    prefix, the same way the populate scripts cleaned them.
+    """
+    if not isinstance(row, dict):
+        raise serializers.ValidationError({'non_field_errors': ["A row must be an object of column values."]})
+    data = dict(defaults or {})
+    for key, value in row.items():
+        if key in IMPORT_FIELDS and value is not None and str(value).strip() != '':
+            data[key] = value.strip() if isinstance(value, str) else value
+    if isinstance(data.get('price'), str):
+        data['price'] = data['price'].replace('KES', '').replace(',', '').strip()
+    if 'ISBN' in data:
+        data['ISBN'] = str(data['ISBN']).replace('ISBN:', '').strip()
+    return data
+
+
+def image_url(row, base_url=None):
+    """Return the absolute image URL of a raw row, or None."""
+    for column in IMAGE_COLUMNS:
+        value = row.get(column)
+        if isinstance(value, str) and value.strip():
+            return urljoin(base_url, value.strip()) if base_url else value.strip()
+    return None
+
+
+def upsert_key(data):
+    """
+    Return the key a validated row is upserted by.
+
+    Rows are matched on their ISBN. Rows without one fall back to their name
+    and publisher, matched only against items that have no ISBN either, so
+    re-importing the same sheet updates those items instead of adding them
+    again.
+    """
+    if data.get('ISBN'):
+        return 'ISBN', data['ISBN']
+    return 'name', data['name'], data.get('publisher', Item._meta.get_field('publisher').default)
+
+
+def import_items(rows, defaults=None, batch_size=500, images=None, image_base_url=None, refresh_neighbors=True):
+    """
+    Upsert catalog rows into the Item table.
+
+    Rows are validated and written batch by batch: existing items are looked
+    up by ISBN, or by name and publisher for rows without one (see
+    upsert_key), with at most two queries per batch, new items get their SKUs from a
+    single allocator lease and are written with ``bulk_create``, changed
+    items with ``bulk_update`` (rows identical to the stored item are
+    skipped). Discounted prices are computed in the same
+    pass; the price packs of every affected group and the neighbors of
+    every moved item are recomputed once at the end, and the stored
+    collection packs these groups appear in are dropped.
+
+    With an ``ImageFetcher``, the images of each batch are downloaded
+    concurrently before the batch is written. They are attached to new items
+    and to existing items that still have the default image.
+
+    Args:
+        rows (iterable): Row dictionaries, e.g. streamed by ``iter_rows``.
+            Only one batch of rows is held in memory at a time. Rows that
+            are not dictionaries, SpreadsheetErrors yielded in place of
+            unreadable rows, and a SpreadsheetError that stops the file are
+            reported as errors of their row.
+        defaults (dict): Field values applied to rows that leave them blank.
+        batch_size (int): Rows validated and written per batch.
+        images (ImageFetcher): Downloads row images. Images are skipped if None.
+        image_base_url (str): Base for relative image URLs.
+        refresh_neighbors (bool): Refresh the neighbor table around the
+            moved items. Large imports can skip it and run
+            ``rebuild_item_neighbors`` once they are done instead.
+
+    Each batch is committed on its own. If the file cannot be read to the
+    end, or a batch fails to write, the import stops there: ``complete`` is
+    False and ``committed_through`` is the last row of the last batch
+    written (rows after it were not imported).
+
+    Returns:
+        dict: Counts of created, updated and unchanged items, the per-row
+        errors (row numbers start at 1), whether the import is complete,
+        the last row committed and the cluster recompute report.
+    """
+    started = time.perf_counter()
+    report = {
+        'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'images': 0, 'errors': [],
+        'complete': True, 'committed_through': 0,
+    }
+    seen_keys = {}
+    groups, neighbor_moves = set(), set()
+
+    for batch in iter_chunks(enumerate(_readable(rows), start=1), batch_size):
+        report['rows'] += len(batch)
+        first, last = batch[0][0], batch[-1][0]
+        try:
+            _import_batch(batch, defaults, seen_keys, groups, neighbor_moves, report, images, image_base_url)
+        except DatabaseError as exc:
+            # Earlier batches are already committed; this one was rolled back
+            report['errors'].append({'row': first, 'errors': {'batch': [f"Rows {first} to {last} were not written: {exc}"]}})
+            report['complete'] = False
+            break
+        # A file error takes the place of the row after the last one read
+        report['committed_through'] = last if report['complete'] else last - 1
+
+    if groups:
+        report['clusters'] = recluster_items(
+            Item.objects.filter(cluster_group_filter(groups)), refresh_neighbors=refresh_neighbors
+        )
+    else:
+        report['clusters'] = None
+    if refresh_neighbors:
+        defer_neighbor_refresh(neighbor_moves)
+    defer_pack_invalidation(groups={alternative_key(group) for group in groups})
+    report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return report
+
+
+def _readable(rows):
+    """
+    Yield the rows, then the SpreadsheetError that stopped the file from
+    being read further, if any, so it is reported like a row error.
+    """
+    try:
+        yield from rows
+    except SpreadsheetError as exc:
+        yield exc
+
+
+def _import_batch(batch, defaults, seen_keys, groups, neighbor_moves, report, images, image_base_url):
+    """
+    Validate and write one batch of rows, recording errors in the report.
+    """
+    # One serializer validates every row, so its fields are only built once
+    serializer = ItemImportSerializer()
+    valid = []
+    for number, row in batch:
+        if isinstance(row, SpreadsheetError):
+            report['errors'].append({'row': number, 'errors': {'file': [str(row)]}})
+            if not row.row_error:
+                report['complete'] = False  # The rest of the file could not be read
+            continue
+        try:
+            data = serializer.run_validation(clean_row(row, defaults))
+        except serializers.ValidationError as exc:
+            report['errors'].append({'row': number, 'errors': exc.detail})
+            continue
+        key = upsert_key(data)
+        if key in seen_keys:
+            report['errors'].append({'row': number, 'errors': {key[0]: [f"Duplicate of row {seen_keys[key]}."]}})
+            continue
+        seen_keys[key] = number
+        valid.append((data, image_url(row, image_base_url) if images else None))
+
+    cached = images.fetch_all(url for _, url in valid) if images else {}
+    existing = {
+        ('ISBN', isbn): item
+        for isbn, item in Item.objects.in_bulk([data['ISBN'] for data, _ in valid if data.get('ISBN')], field_name='ISBN').items()
+    }
+    names = {data['name'] for data, _ in valid if not data.get('ISBN')}
+    ambiguous = set()
+    if names:
+        for item in Item.objects.filter(Q(ISBN__isnull=True) | Q(ISBN=''), name__in=names):
+            key = upsert_key({'name': item.name, 'publisher': item.publisher})
+            if key in existing:
+                ambiguous.add(key)
+            existing[key] = item
+
+    created, updated, update_fields, attached = [], [], set(), []
+    for data, url in valid:
+        key = upsert_key(data)
+        if key in ambiguous:
+            number = seen_keys[key]
+            report['errors'].append({'row': number, 'errors': {'name': [
+                "Several items without an ISBN have this name and publisher; give the row an ISBN."
+            ]}})
+            continue
+        item = existing.get(key)
+        path = cached.get(url)
+        if item is None:
+            item = Item(**data)
+            created.append(item)
+            if path:
+                attached.append(_attach_image(item, path, url))
+                report['images'] += 1
+        else:
+            changed = {field for field, value in data.items() if getattr(item, field) != value}
+            if path and item.image.name in ('', Item._meta.get_field('image').default):
+                attached.append(_attach_image(item, path, url))
+                report['images'] += 1
+                changed.add('image')
+            if not changed:
+                report['unchanged'] += 1
+                continue
+            groups.add(item.cluster_group)
+            for field in changed - {'image'}:
+                setattr(item, field, data[field])
+            update_fields.update(changed)
+            updated.append(item)
+        item.discounted_price = discounted_price_for(item.price, item.discount)
+        groups.add(item.cluster_group)
+
+    with transaction.atomic():
+        for item, sku in zip(created, allocate_codes(Item, len(created))):
+            item.sku = sku
+        Item.objects.bulk_create(created)
+        if updated:
+            Item.objects.bulk_update(updated, sorted(update_fields | {'discounted_price'}))
+        # Bulk writes skip the signals that keep the facet counts current
+        facet_deltas = Counter(facet_key(item) for item in created)
+        for item in updated:
+            facet_deltas[item._loaded_facet_key] -= 1
+            facet_deltas[facet_key(item)] += 1
+        apply_facet_deltas(facet_deltas)
+        if created or updated:
+            bump_versions('items')
+        # The image files are only written once the rows naming them are committed
+        defer(store_images, images=attached)
+
+    report['created'] += len(created)
+    report['updated'] += len(updated)
+    for item in created + updated:
+        neighbor_moves |= neighbor_points(item.neighbor_values)
+        if item._loaded_neighbor_values:
+            neighbor_moves |= neighbor_points(item._loaded_neighbor_values)
+
+
+def _attach_image(item, path, url):
+    """
+    Name the item's image after a cached file, through the item's upload_to,
+    without writing the file yet (see store_images).
+
+    Returns:
+        tuple: (item, cached file path), to pass to store_images.
+    """
+    field = item.image.field
+    name = field.generate_filename(item, url.rsplit('/', 1)[-1] or path.name)
+    item.image.name = field.storage.get_available_name(name, max_length=field.max_length)
+    return item, path
+
+
+def store_images(images):
+    """
+    Copy the cached image files of committed items into media storage.
+
+    Files are written after the rows naming them are committed, so a batch
+    that fails leaves no orphaned files behind. A name taken in the meantime
+    is replaced by the one the storage picks, and saved on the item's row.
+
+    Args:
+        images (list): (item, cached file path) pairs from _attach_image.
+    """
+    for item, path in images:
+        with open(path, 'rb') as file:
+            stored = item.image.storage.save(item.image.name, File(file), max_length=item.image.field.max_length)
+        if stored != item.image.name:
+            item.image.name = stored
+            Item.objects.filter(pk=item.pk).update(image=stored)
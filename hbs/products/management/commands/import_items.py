@@ -0,0 +1,65 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from products.importer import import_items
+from products.spreadsheets import iter_rows, detect_format, unsupported_format_message, SUPPORTED_FORMATS
+from products.image_fetcher import ImageFetcher, DEFAULT_WORKERS
+
+
+class Command(BaseCommand):
+    help = "Bulk import catalog items from a CSV, XLSX or NDJSON file, upserting by ISBN."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Catalog file to import.")
+        parser.add_argument('--format', choices=SUPPORTED_FORMATS, help="File format (default: from the extension).")
+        parser.add_argument(
+            '--set', action='append', default=[], metavar='FIELD=VALUE', dest='defaults',
+            help="Default value for rows that leave a field blank, e.g. --set grade='Grade 4'. Repeatable.",
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--images', action='store_true', help="Download the images in the 'image' / 'image-src' column.")
+        parser.add_argument('--image-base-url', help="Base URL for relative image paths, e.g. https://textbookcentre.com.")
+        parser.add_argument(
+            '--image-cache', default=str(settings.BASE_DIR / '.image_cache'),
+            help="Image cache and download checkpoint directory. Reruns skip images already in it.",
+        )
+        parser.add_argument('--image-workers', type=int, default=DEFAULT_WORKERS)
+        parser.add_argument(
+            '--skip-neighbors', action='store_true',
+            help="Do not refresh item substitutes and suggestions; run rebuild_item_neighbors afterwards.",
+        )
+        parser.add_argument('--report', help="Write the full JSON report, including row errors, to this file.")
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or detect_format(options['path'])
+        if file_format not in SUPPORTED_FORMATS:
+            raise CommandError(unsupported_format_message(file_format))
+
+        defaults = {}
+        for pair in options['defaults']:
+            field, separator, value = pair.partition('=')
+            if not separator:
+                raise CommandError(f"Expected FIELD=VALUE, got '{pair}'.")
+            defaults[field] = value
+
+        images = ImageFetcher(options['image_cache'], workers=options['image_workers']) if options['images'] else None
+        report = import_items(
+            iter_rows(options['path'], file_format, row_errors=True), defaults=defaults, batch_size=options['batch_size'],
+            images=images, image_base_url=options['image_base_url'], refresh_neighbors=not options['skip_neighbors'],
+        )
+
+        if options['report']:
+            with open(options['report'], 'w') as output:
+                json.dump(report, output, indent=2, default=str)
+        for error in report['errors'][:20]:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'], default=str)}")
+        message = (
+            f"{report['rows']} rows: {report['created']} created, {report['updated']} updated, "
+            f"{report['unchanged']} unchanged, {report['images']} images, "
+            f"{len(report['errors'])} rejected in {report['elapsed_ms']} ms."
+        )
+        if not report['complete']:
+            raise CommandError(f"{message} The import stopped part way: rows up to {report['committed_through']} were written.")
+        self.stdout.write(self.style.SUCCESS(message))
+        if options['skip_neighbors']:
+            self.stdout.write("Item neighbors were not refreshed: run rebuild_item_neighbors.")
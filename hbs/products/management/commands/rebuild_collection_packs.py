@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from products.packs import rebuild_collection_packs
+
+
+class Command(BaseCommand):
+    help = "Recompute the Economy, Value and Premium packs of every collection."
+
+    def handle(self, *args, **options):
+        report = rebuild_collection_packs()
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored the packs of {report['collections']} collections in {report['elapsed_ms']} ms."
+        ))
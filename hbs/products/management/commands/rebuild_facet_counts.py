@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from products.facets import rebuild_facet_counts
+
+
+class Command(BaseCommand):
+    help = "Recompute the catalog facet-count cache from the Item table."
+
+    def handle(self, *args, **options):
+        keys = rebuild_facet_counts()
+        self.stdout.write(self.style.SUCCESS(f"Stored counts for {keys} facet combinations."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from products.neighbors import rebuild_item_neighbors, SUBSTITUTE, SUGGESTION
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed substitutes and suggestions of every item."
+
+    def handle(self, *args, **options):
+        report = rebuild_item_neighbors()
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {report[SUBSTITUTE]['rows']} substitutes and {report[SUGGESTION]['rows']} suggestions "
+            f"for {report[SUBSTITUTE]['items']} items in {report['elapsed_ms']} ms."
+        ))
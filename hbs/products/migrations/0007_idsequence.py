@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_alter_item_options_alter_item_tag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdSequence',
+            fields=[
+                ('namespace', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'ID Sequence',
+                'verbose_name_plural': 'ID Sequences',
+            },
+        ),
+    ]
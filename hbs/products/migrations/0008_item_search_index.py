@@ -0,0 +1,59 @@
+from django.db import migrations
+
+INDEX_NAME = 'products_item_search'
+INDEX_COLUMNS = ('name', 'ISBN', 'subject', 'publisher', 'description')
+
+# SQLite has no FULLTEXT indexes: an external-content FTS5 table over the item
+# rows is used instead, kept in sync by triggers
+SQLITE_INDEX = [
+    f"CREATE VIRTUAL TABLE {INDEX_NAME} USING fts5({', '.join(INDEX_COLUMNS)}, content='products_item', content_rowid='rowid')",
+    f"""CREATE TRIGGER {INDEX_NAME}_insert AFTER INSERT ON products_item BEGIN
+        INSERT INTO {INDEX_NAME}(rowid, {', '.join(INDEX_COLUMNS)})
+        VALUES (new.rowid, {', '.join('new.' + column for column in INDEX_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER {INDEX_NAME}_delete AFTER DELETE ON products_item BEGIN
+        INSERT INTO {INDEX_NAME}({INDEX_NAME}, rowid, {', '.join(INDEX_COLUMNS)})
+        VALUES ('delete', old.rowid, {', '.join('old.' + column for column in INDEX_COLUMNS)});
+    END""",
+    f"""CREATE TRIGGER {INDEX_NAME}_update AFTER UPDATE OF {', '.join(INDEX_COLUMNS)} ON products_item BEGIN
+        INSERT INTO {INDEX_NAME}({INDEX_NAME}, rowid, {', '.join(INDEX_COLUMNS)})
+        VALUES ('delete', old.rowid, {', '.join('old.' + column for column in INDEX_COLUMNS)});
+        INSERT INTO {INDEX_NAME}(rowid, {', '.join(INDEX_COLUMNS)})
+        VALUES (new.rowid, {', '.join('new.' + column for column in INDEX_COLUMNS)});
+    END""",
+    f"INSERT INTO {INDEX_NAME}({INDEX_NAME}) VALUES ('rebuild')",
+]
+
+
+def create_search_index(apps, schema_editor):
+    """Add the full-text index used by catalog search (MySQL and SQLite)."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        quote = schema_editor.quote_name
+        columns = ', '.join(quote(column) for column in INDEX_COLUMNS)
+        schema_editor.execute(f"CREATE FULLTEXT INDEX {quote(INDEX_NAME)} ON {quote('products_item')} ({columns})")
+    elif vendor == 'sqlite':
+        for statement in SQLITE_INDEX:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        quote = schema_editor.quote_name
+        schema_editor.execute(f"DROP INDEX {quote(INDEX_NAME)} ON {quote('products_item')}")
+    elif vendor == 'sqlite':
+        for suffix in ('insert', 'delete', 'update'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {INDEX_NAME}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_idsequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:46
+
+from django.db import migrations, models
+from django.db.models import Count
+
+FACET_FIELDS = ('category', 'grade', 'study_level', 'curriculum', 'subject', 'cluster')
+
+
+def fill_facet_counts(apps, schema_editor):
+    """Seed the facet-count cache from the existing items."""
+    Item = apps.get_model('products', 'Item')
+    FacetCount = apps.get_model('products', 'FacetCount')
+    rows = Item.objects.order_by().values(*FACET_FIELDS).annotate(total=Count('sku'))
+    FacetCount.objects.bulk_create([FacetCount(count=row.pop('total'), **row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_item_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=20)),
+                ('grade', models.CharField(max_length=20)),
+                ('study_level', models.CharField(max_length=20)),
+                ('curriculum', models.CharField(max_length=20)),
+                ('subject', models.CharField(max_length=100)),
+                ('cluster', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Facet Count',
+                'verbose_name_plural': 'Facet Counts',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', 'grade', 'subject'], name='item_category_grade_subject'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['grade', 'subject', 'curriculum'], name='item_grade_subject_curric'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['curriculum', 'study_level', 'grade'], name='item_curric_level_grade'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['cluster', 'category'], name='item_cluster_category'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='facetcount',
+            unique_together={('category', 'grade', 'study_level', 'curriculum', 'subject', 'cluster')},
+        ),
+        migrations.RunPython(fill_facet_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-18 14:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0009_facetcount'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceVersion',
+            fields=[
+                ('resource', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Resource Version',
+                'verbose_name_plural': 'Resource Versions',
+            },
+        ),
+    ]
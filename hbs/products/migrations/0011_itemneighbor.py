@@ -0,0 +1,91 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:04
+
+import django.db.models.deletion
+from itertools import groupby
+from django.db import migrations, models
+
+# Copies of products.neighbors as of this migration, so later changes to the
+# app's ranking do not change what the migration does
+NEIGHBOR_GROUPS = {
+    'substitute': ('category', 'tag', 'cluster'),
+    'suggestion': ('category', 'subject', 'grade', 'curriculum'),
+}
+NEIGHBOR_LIMITS = {
+    'substitute': 10,
+    'suggestion': 5,
+}
+
+
+def rank_window(window, limit):
+    """Sku -> skus of the ``limit`` items closest in price, for a price-sorted window of (sku, price) pairs."""
+    ranked = {}
+    for index, (sku, price) in enumerate(window):
+        lower, upper, neighbors = index - 1, index + 1, []
+        while len(neighbors) < limit and (lower >= 0 or upper < len(window)):
+            if upper >= len(window) or (lower >= 0 and price - window[lower][1] <= window[upper][1] - price):
+                neighbors.append(window[lower][0])
+                lower -= 1
+            else:
+                neighbors.append(window[upper][0])
+                upper += 1
+        ranked[sku] = neighbors
+    return ranked
+
+
+def fill_item_neighbors(apps, schema_editor):
+    """Rank the substitutes and suggestions of the existing items."""
+    Item = apps.get_model('products', 'Item')
+    ItemNeighbor = apps.get_model('products', 'ItemNeighbor')
+    for kind, fields in NEIGHBOR_GROUPS.items():
+        rows = Item.objects.order_by(*fields, 'price', 'sku').values_list(*fields, 'sku', 'price')
+        for _, group in groupby(rows.iterator(chunk_size=5000), key=lambda row: row[:len(fields)]):
+            ItemNeighbor.objects.bulk_create([
+                ItemNeighbor(item_id=sku, neighbor_id=neighbor, kind=kind, rank=rank)
+                for sku, neighbors in rank_window([row[-2:] for row in group], NEIGHBOR_LIMITS[kind]).items()
+                for rank, neighbor in enumerate(neighbors)
+            ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0010_resourceversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemNeighbor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('substitute', 'Substitute'), ('suggestion', 'Suggestion')], max_length=10)),
+                ('rank', models.PositiveSmallIntegerField()),
+            ],
+            options={
+                'verbose_name': 'Item Neighbor',
+                'verbose_name_plural': 'Item Neighbors',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', 'tag', 'cluster', 'price'], name='item_substitute_price'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', 'subject', 'grade', 'curriculum', 'price'], name='item_suggestion_price'),
+        ),
+        migrations.AddField(
+            model_name='itemneighbor',
+            name='item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbors', to='products.item'),
+        ),
+        migrations.AddField(
+            model_name='itemneighbor',
+            name='neighbor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='neighbor_of', to='products.item'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='itemneighbor',
+            unique_together={('item', 'kind', 'rank')},
+        ),
+        migrations.RunPython(fill_item_neighbors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:27
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_itemneighbor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionPack',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('label', models.CharField(choices=[('Economy Pack', 'Economy Pack'), ('Value Pack', 'Value Pack'), ('Premium Pack', 'Premium Pack')], max_length=20)),
+                ('lines', models.JSONField(default=list)),
+                ('total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('discounted_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12)),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='packs', to='products.collection')),
+            ],
+            options={
+                'verbose_name': 'Collection Pack',
+                'verbose_name_plural': 'Collection Packs',
+                'unique_together': {('collection', 'label')},
+            },
+        ),
+    ]
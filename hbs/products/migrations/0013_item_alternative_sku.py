@@ -0,0 +1,17 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_collectionpack'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['category', 'subject', 'tag', 'sku'], name='item_alternative_sku'),
+        ),
+    ]
@@ -3,13 +3,16 @@ from django.db import models
 import uuid
 import os
 from PIL import Image
-import random
-import string
 from userManager.models import Organization
 from django.core.exceptions import ValidationError
-from sklearn.cluster import KMeans
-import numpy as np
 from decimal import Decimal, InvalidOperation
+from .clustering import GROUP_FIELDS, PACK_LABELS
+from .facets import FACET_FIELDS, facet_key
+from .neighbors import NEIGHBOR_FIELDS, SUBSTITUTE, SUGGESTION
+from .short_ids import next_code
+
+# Compact item representation used when items are nested in other resources
+ITEM_SUMMARY_FIELDS = ('sku', 'name', 'price', 'discounted_price', 'image', 'cluster')
 
 def item_image_path(instance, filename):
     """
@@ -27,9 +30,99 @@ def item_image_path(instance, filename):
     return os.path.join('Shop/Items/', filename)
 
 
-def generate_unique_code():
-    """Generate a unique 6-character alphanumeric code."""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+def discounted_price_for(price, discount):
+    """
+    Apply a percentage discount to a price.
+
+    Args:
+        price: Price of the item. Invalid values count as 0.
+        discount: Discount in %. Invalid values count as no discount.
+
+    Returns:
+        Decimal: The discounted price.
+    """
+    try:
+        discount_value = Decimal(discount)
+    except (InvalidOperation, TypeError):
+        discount_value = Decimal('0.00')  # Default to 0 if invalid
+
+    try:
+        price_value = Decimal(price)
+    except (InvalidOperation, TypeError):
+        price_value = Decimal('0.00')  # Default to 0 if invalid
+
+    if discount_value > 0:
+        return price_value - price_value * (discount_value / Decimal('100'))
+    return price_value
+
+
+class IdSequence(models.Model):
+    """
+    Counter behind the short 6-character codes used as primary keys.
+
+    Attributes:
+        namespace (str): Model the codes are issued for (app_label.model_name).
+        next_value (int): First counter value that has not been leased yet.
+    """
+    namespace = models.CharField(max_length=100, primary_key=True)
+    next_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.namespace} @ {self.next_value}"
+
+    class Meta:
+        verbose_name = "ID Sequence"
+        verbose_name_plural = "ID Sequences"
+
+
+class ResourceVersion(models.Model):
+    """
+    Change counter of a public API resource.
+
+    Bumped once per transaction that writes the resource, so read endpoints
+    can build ETags from it without querying the resource's own tables.
+
+    Attributes:
+        resource (str): Resource name, one of versions.RESOURCES.
+        version (int): Number of committed changes so far.
+    """
+    resource = models.CharField(max_length=30, primary_key=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.resource} v{self.version}"
+
+    class Meta:
+        verbose_name = "Resource Version"
+        verbose_name_plural = "Resource Versions"
+
+
+class FacetCount(models.Model):
+    """
+    Number of items sharing one combination of facet values.
+
+    Kept up to date incrementally by item saves and deletes, so catalog facet
+    counts are read from this small table instead of grouping the Item table.
+
+    Attributes:
+        category, grade, study_level, curriculum, subject, cluster (str): The facet values.
+        count (int): Number of items with exactly these values.
+    """
+    category = models.CharField(max_length=20)
+    grade = models.CharField(max_length=20)
+    study_level = models.CharField(max_length=20)
+    curriculum = models.CharField(max_length=20)
+    subject = models.CharField(max_length=100)
+    cluster = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{' / '.join(getattr(self, field) for field in FACET_FIELDS)}: {self.count}"
+
+    class Meta:
+        verbose_name = "Facet Count"
+        verbose_name_plural = "Facet Counts"
+        unique_together = FACET_FIELDS
 
 
 class Item(models.Model):
@@ -115,97 +208,147 @@ class Item(models.Model):
     cluster = models.CharField(max_length=20, default='Economy Pack')  
     tag = models.CharField(max_length=40, default='N/A')
     discount = models.DecimalField(max_digits=4, decimal_places=2, default=Decimal('0.00'))
-    _cluster_assigned = False
     discounted_price = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    _loaded_cluster_inputs = None  # (price, cluster group) as last read from the database
+    _loaded_facet_key = None  # Facet values as last read from the database
+    _stored_facet_key = None  # Facet values read before writing an item loaded without them
+    _loaded_neighbor_values = None  # Values placing the item in the neighbor table, as last read
+    _loaded_pack_inputs = None  # (price, discounted price, cluster group) as last read from the database
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the price, cluster group, facet, neighbor and pack values the
+        item was loaded with, so saves can tell whether the price clusters,
+        facet counts, neighbor table and collection packs need to be updated.
+        """
+        instance = super().from_db(db, field_names, values)
+        if all(field in field_names for field in ('price', *GROUP_FIELDS)):
+            instance._loaded_cluster_inputs = (instance.price, instance.cluster_group)
+        if all(field in field_names for field in FACET_FIELDS):
+            instance._loaded_facet_key = facet_key(instance)
+        if all(field in field_names for field in NEIGHBOR_FIELDS):
+            instance._loaded_neighbor_values = instance.neighbor_values
+        if all(field in field_names for field in ('price', 'discounted_price', *GROUP_FIELDS)):
+            instance._loaded_pack_inputs = instance.pack_inputs
+        return instance
+
+    @property
+    def neighbor_values(self):
+        """The sku and NEIGHBOR_FIELDS values that place the item in the neighbor table."""
+        return {'sku': self.sku, **{field: getattr(self, field) for field in NEIGHBOR_FIELDS}}
+
+    @property
+    def pack_inputs(self):
+        """The prices and cluster group that the stored collection packs depend on."""
+        return (self.price, self.discounted_price, self.cluster_group)
+
+    @property
+    def cluster_group(self):
+        """The (tag, category, subject, grade, curriculum) key the item is clustered in."""
+        return tuple(getattr(self, field) for field in GROUP_FIELDS)
+
     def save(self, *args, **kwargs):
         """
         Overrides the save method to generate unique 6-character codes for both id and sku
         """
         # Generate unique SKU if not already set
         if not self.sku:
-            self.sku = self.generate_unique_field('sku')
+            self.sku = self.generate_unique_field()
+            kwargs.setdefault('force_insert', True)  # Never overwrite a row on a code clash
         # Call super save method to save the instance
         super(Item, self).save(*args, **kwargs)
     def reassign_clusters(self):
         """
         Reassigns the price cluster for all items in the database with the same 
         tag, category, subject, grade, and curriculum.
+
+        Returns:
+            dict: The report of the underlying batch recluster run.
         """
-        # Get all items that are similar based on tag, category, subject, grade, and curriculum
-        all_items = Item.objects.filter(
-            tag=self.tag,
-            category=self.category,
-            subject=self.subject,
-            grade=self.grade,
-            curriculum=self.curriculum
-        )
-        
-        if all_items.count() >= 3:
-            # Extract the prices for clustering
-            prices = np.array([float(item.price) for item in all_items]).reshape(-1, 1)
-            
-            # Perform KMeans clustering
-            kmeans = KMeans(n_clusters=3)
-            kmeans.fit(prices)
-            clusters = kmeans.predict(prices)
-            
-            # Sort clusters based on ascending price order
-            sorted_clusters = np.argsort(kmeans.cluster_centers_.flatten())
-            cluster_labels = {
-                sorted_clusters[0]: 'Economy Pack',
-                sorted_clusters[1]: 'Value Pack',
-                sorted_clusters[2]: 'Premium Pack'
-            }
-
-            # Assign the new cluster to each item
-            for item, cluster in zip(all_items, clusters):
-                item.cluster = cluster_labels[cluster]
-                item.save()  # Save the item with the updated cluster
-                
-        else:
-            # If not enough items, assign default cluster
-            for item in all_items:
-                item.cluster = 'Economy Pack'
-                item.save()
-
-    def generate_unique_field(self, field_name):
-        """Generate a unique 6-character alphanumeric code for a field."""
-        code = generate_unique_code()
-        while Item.objects.filter(**{field_name: code}).exists():
-            code = generate_unique_code()
-        return code
+        from .clustering import recluster_items
+
+        return recluster_items(Item.objects.filter(**dict(zip(GROUP_FIELDS, self.cluster_group))))
+
+    def generate_unique_field(self):
+        """Generate a unique 6-character alphanumeric code for the primary key field."""
+        return next_code(type(self))
 
     def __str__(self):
         return self.name
     def get_substitute_or_suggestion(self,substitutable):
         """
-        Returns a substitute item if the item is substitutable, otherwise provides recommendations.
+        Returns substitute items if the item is substitutable, otherwise provides recommendations.
         
-        Recommendations are based on similar items with the same category, tag, or subject.
+        Substitutes share the item's category, tag and price cluster; recommendations
+        share its category, subject, grade and curriculum. Both are read from the
+        precomputed neighbor table, closest in price first, so at most
+        neighbors.NEIGHBOR_LIMITS of each are returned. neighbors.line_alternatives
+        resolves many items at once.
         """
         if substitutable:
             # Find substitute items in the same price cluster
             substitutes = Item.objects.filter(
-                category=self.category,
-                tag=self.tag,
-                cluster=self.cluster  # Same price cluster
-            ).exclude(id=self.sku)  # Exclude the current item
+                neighbor_of__item=self, neighbor_of__kind=SUBSTITUTE
+            ).order_by('neighbor_of__rank')
             if substitutes.exists():
                 return substitutes
 
         # If not substitutable, suggest similar items (recommendations)
         suggestions = Item.objects.filter(
-            category=self.category,
-            subject=self.subject,
-            grade=self.grade,
-            curriculum=self.curriculum
-        ).exclude(id=self.sku)[:5]  # Limit suggestions to 5 items
+            neighbor_of__item=self, neighbor_of__kind=SUGGESTION
+        ).order_by('neighbor_of__rank')
 
         return suggestions if suggestions.exists() else None
     class Meta:
         verbose_name = "Item"
         verbose_name_plural = "Items"
         ordering = ['sku']
+        indexes = [
+            # Composite indexes behind the catalog facet filters
+            models.Index(fields=['category', 'grade', 'subject'], name='item_category_grade_subject'),
+            models.Index(fields=['grade', 'subject', 'curriculum'], name='item_grade_subject_curric'),
+            models.Index(fields=['curriculum', 'study_level', 'grade'], name='item_curric_level_grade'),
+            models.Index(fields=['cluster', 'category'], name='item_cluster_category'),
+            # Price-ordered neighbor groups (see neighbors.NEIGHBOR_GROUPS)
+            models.Index(fields=['category', 'tag', 'cluster', 'price'], name='item_substitute_price'),
+            models.Index(fields=['category', 'subject', 'grade', 'curriculum', 'price'], name='item_suggestion_price'),
+            # First-by-sku pack alternatives (see packs.with_alternatives)
+            models.Index(fields=['category', 'subject', 'tag', 'sku'], name='item_alternative_sku'),
+        ]
+
+
+class ItemNeighbor(models.Model):
+    """
+    Precomputed substitute or suggestion of an item.
+
+    Substitutes are the items of the same category, tag and price cluster,
+    suggestions those of the same category, subject, grade and curriculum;
+    the closest in price are kept (NEIGHBOR_LIMITS per kind), ranked from 0. Refreshed
+    incrementally when items are saved, reclustered or deleted.
+
+    Attributes:
+        item (ForeignKey): The item the neighbor is stored for.
+        neighbor (ForeignKey): The substitute or suggested item.
+        kind (str): 'substitute' or 'suggestion'.
+        rank (int): Position in the item's list, closest first.
+    """
+    KIND_CHOICES = [
+        (SUBSTITUTE, 'Substitute'),
+        (SUGGESTION, 'Suggestion'),
+    ]
+    item = models.ForeignKey(Item, related_name='neighbors', on_delete=models.CASCADE)
+    neighbor = models.ForeignKey(Item, related_name='neighbor_of', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    rank = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return f"{self.kind} {self.rank} of {self.item_id}: {self.neighbor_id}"
+
+    class Meta:
+        verbose_name = "Item Neighbor"
+        verbose_name_plural = "Item Neighbors"
+        unique_together = ('item', 'kind', 'rank')
 
 class Collection(models.Model):
     """
@@ -248,15 +391,13 @@ class Collection(models.Model):
     def save(self, *args, **kwargs):
         # Ensure unique ID is generated before saving
         if not self.id:
-            self.id = self.generate_unique_field('id')
+            self.id = self.generate_unique_field()
+            kwargs.setdefault('force_insert', True)  # Never overwrite a row on a code clash
         super(Collection, self).save(*args, **kwargs)
     
-    def generate_unique_field(self, field_name):
-        """Generate a unique 6-character alphanumeric code for a field."""
-        code = generate_unique_code()
-        while Collection.objects.filter(**{field_name: code}).exists():
-            code = generate_unique_code()
-        return code
+    def generate_unique_field(self):
+        """Generate a unique 6-character alphanumeric code for the primary key field."""
+        return next_code(type(self))
 
     def clean(self):
         # Check if another collection with the same school and grade already exists
@@ -289,3 +430,43 @@ class CollectionItem(models.Model):
         verbose_name = "Collection Item"
         verbose_name_plural = "Collection Items"
 
+    @classmethod
+    def with_item_summaries(cls):
+        """
+        Collection items joined to their item, loading only the item columns of
+        the compact representation (ITEM_SUMMARY_FIELDS) nested in collections.
+        """
+        return cls.objects.select_related('item').only(
+            'id', 'collection', 'quantity', 'substitutable', 'item', *(f'item__{field}' for field in ITEM_SUMMARY_FIELDS)
+        )
+
+
+class CollectionPack(models.Model):
+    """
+    Precomputed Economy, Value or Premium variant of a collection.
+
+    Built on the first read after the collection's lines, or an item that
+    one of its lines could be or be replaced by, changed (see packs.py).
+
+    Attributes:
+        collection (ForeignKey): The collection the pack is a variant of.
+        label (str): The pack label (Economy Pack, Value Pack, Premium Pack).
+        lines (list): Item sku, quantity and the sku of the replaced item
+            (None if the collection's item is kept) of each line.
+        total (Decimal): Sum of the line prices times their quantities.
+        discounted_total (Decimal): Sum of the line discounted prices times their quantities.
+    """
+    LABEL_CHOICES = [(label, label) for label in PACK_LABELS]
+    collection = models.ForeignKey(Collection, related_name='packs', on_delete=models.CASCADE)
+    label = models.CharField(max_length=20, choices=LABEL_CHOICES)
+    lines = models.JSONField(default=list)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    discounted_total = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    def __str__(self):
+        return f"{self.label} of {self.collection_id}"
+
+    class Meta:
+        verbose_name = "Collection Pack"
+        verbose_name_plural = "Collection Packs"
+        unique_together = ('collection', 'label')
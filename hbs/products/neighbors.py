@@ -0,0 +1,305 @@
+import time
+from collections import defaultdict
+from itertools import groupby
+from django.db import connection, transaction
+from .deferred import defer
+from .versions import bump_versions
+
+SUBSTITUTE = 'substitute'
+SUGGESTION = 'suggestion'
+
+# Item fields that group the candidates of each kind of neighbor
+NEIGHBOR_GROUPS = {
+    SUBSTITUTE: ('category', 'tag', 'cluster'),
+    SUGGESTION: ('category', 'subject', 'grade', 'curriculum'),
+}
+
+# Neighbors stored per item, per kind, closest in price first. Substitute
+# groups (a price cluster of a category and tag) run to thousands of items,
+# too many to store every pair, so substitutes are capped as well, with a
+# longer list than the top 5 suggestions
+NEIGHBOR_LIMITS = {
+    SUBSTITUTE: 10,
+    SUGGESTION: 5,
+}
+
+# Item fields whose change can move an item in the neighbor table
+NEIGHBOR_FIELDS = ('price', 'category', 'tag', 'cluster', 'subject', 'grade', 'curriculum')
+
+# Groups with at least this many changed items are re-ranked as a whole
+GROUP_REFRESH_THRESHOLD = 25
+
+
+def nearest(window, index, limit):
+    """
+    Positions of the items closest in price to one item of a price-sorted window.
+
+    Neighbors are taken outward from the item, the smaller price gap first
+    (the cheaper item on a tie), so they always lie within ``limit``
+    positions of it.
+
+    Args:
+        window (list): (sku, price) pairs sorted by price, then sku.
+        index (int): Position of the item in the window.
+        limit (int): Number of neighbors to take.
+
+    Returns:
+        list: Positions of at most ``limit`` neighbors, closest first.
+    """
+    price = window[index][1]
+    lower, upper, positions = index - 1, index + 1, []
+    while len(positions) < limit and (lower >= 0 or upper < len(window)):
+        if upper >= len(window) or (lower >= 0 and price - window[lower][1] <= window[upper][1] - price):
+            positions.append(lower)
+            lower -= 1
+        else:
+            positions.append(upper)
+            upper += 1
+    return positions
+
+
+def rank_window(window, limit, start=0, end=None):
+    """
+    Rank the ``limit`` nearest neighbors of the items ``window[start:end]``.
+
+    Returns:
+        dict: Sku -> list of neighbor skus, closest first.
+    """
+    end = len(window) if end is None else end
+    return {
+        window[index][0]: [window[position][0] for position in nearest(window, index, limit)]
+        for index in range(start, end)
+    }
+
+
+def neighbor_points(values):
+    """
+    Places an item occupies in the neighbor table.
+
+    Args:
+        values (dict): The item's sku and NEIGHBOR_FIELDS.
+
+    Returns:
+        set: (kind, group key, price, sku) tuples, one per kind of neighbor.
+    """
+    return {
+        (kind, tuple(values[field] for field in fields), values['price'], values['sku'])
+        for kind, fields in NEIGHBOR_GROUPS.items()
+    }
+
+
+def defer_neighbor_refresh(points):
+    """
+    Queue neighbor table points for a refresh once the current transaction
+    commits (see deferred.defer).
+
+    Args:
+        points (iterable): Points from neighbor_points, for the items' old and new values.
+    """
+    defer(flush_neighbor_refresh, points=points)
+
+
+def flush_neighbor_refresh(points):
+    """
+    Refresh the neighbors around the queued points.
+    """
+    if points:
+        refresh_neighbors(points)
+
+
+def refresh_neighbors(points):
+    """
+    Bring the neighbor table up to date around changed items.
+
+    An item only appears among the neighbors of the items within ``limit``
+    (NEIGHBOR_LIMITS of the kind) positions of it in its group's price
+    order. So for each point, the items that close to it are re-ranked from
+    a window of 2 x ``limit`` + 1 items on either side, read with two indexed
+    queries. Groups with many points are re-ranked as a whole instead. Only
+    items whose neighbor list actually changed are rewritten.
+
+    Args:
+        points (iterable): (kind, group key, price, sku) tuples, for both the
+            old and the new values of the changed items.
+
+    Returns:
+        int: Number of items whose neighbors were rewritten.
+    """
+    from .models import Item
+
+    by_group = defaultdict(set)
+    for kind, key, price, sku in points:
+        by_group[kind, key].add((price, sku))
+
+    rewritten = 0
+    for (kind, key), group_points in by_group.items():
+        group = Item.objects.filter(**dict(zip(NEIGHBOR_GROUPS[kind], key))).order_by()
+        limit = NEIGHBOR_LIMITS[kind]
+        if len(group_points) >= GROUP_REFRESH_THRESHOLD:
+            ranked = rank_window(list(group.order_by('price', 'sku').values_list('sku', 'price')), limit)
+        else:
+            ranked = {}
+            for price, sku in group_points:
+                ranked.update(_rank_around(group, price, sku, limit))
+        rewritten += store_neighbors(kind, ranked)
+    return rewritten
+
+
+def _rank_around(group, price, sku, limit):
+    """Re-rank the items within ``limit`` positions of a (price, sku) point of a group."""
+    span = 2 * limit + 1
+    # Price ranges with the ties excluded, rather than an OR of the two cases,
+    # so the window is read with a range scan of the group's price index
+    lower = list(
+        group.filter(price__lte=price).exclude(price=price, sku__gte=sku).order_by('-price', '-sku').values_list('sku', 'price')[:span]
+    )[::-1]
+    rest = list(
+        group.filter(price__gte=price).exclude(price=price, sku__lt=sku).order_by('price', 'sku').values_list('sku', 'price')[:span + 1]
+    )
+    present = 1 if rest and rest[0][0] == sku else 0  # The item itself, if it is still at this point
+    window = lower + rest
+    return rank_window(window, limit, max(len(lower) - limit, 0), min(len(lower) + present + limit, len(window)))
+
+
+def store_neighbors(kind, ranked):
+    """
+    Write the neighbor lists that differ from the stored ones.
+
+    The lists are replaced (deleted and inserted again) while their items'
+    rows are locked, so concurrent refreshes never violate the unique
+    (item, kind, rank) constraint.
+
+    Args:
+        kind (str): SUBSTITUTE or SUGGESTION.
+        ranked (dict): Sku -> list of neighbor skus, closest first.
+
+    Returns:
+        int: Number of items whose neighbors were rewritten.
+    """
+    from .models import Item, ItemNeighbor
+
+    stored = defaultdict(list)
+    skus = list(ranked)
+    for start in range(0, len(skus), 1000):
+        rows = ItemNeighbor.objects.filter(kind=kind, item__in=skus[start:start + 1000]).order_by('item', 'rank')
+        for item, neighbor, rank in rows.values_list('item', 'neighbor', 'rank'):
+            # A gap left by a deleted neighbor makes the list differ, so it is rewritten
+            stored[item].append(neighbor if rank == len(stored[item]) else None)
+
+    changed = sorted(sku for sku, neighbors in ranked.items() if stored.get(sku, []) != neighbors)
+    if changed:
+        with transaction.atomic():
+            for start in range(0, len(changed), 1000):
+                # Refreshes of overlapping neighborhoods rewrite the same lists;
+                # locking the items (in sku order) makes them take turns instead
+                # of inserting the same (item, kind, rank) rows at once
+                list(Item.objects.select_for_update().filter(sku__in=changed[start:start + 1000]).order_by('sku').values_list('sku'))
+                ItemNeighbor.objects.filter(kind=kind, item__in=changed[start:start + 1000]).delete()
+            insert_neighbors(
+                (sku, neighbor, kind, rank) for sku in changed for rank, neighbor in enumerate(ranked[sku])
+            )
+            # Item alternatives are served from cached responses
+            bump_versions('items')
+    return len(changed)
+
+
+def insert_neighbors(rows):
+    """
+    Insert neighbor rows with a single prepared statement.
+
+    The table is written millions of rows at a time, where building a model
+    instance per row for ``bulk_create`` costs several times the INSERT itself.
+
+    Args:
+        rows (iterable): (item sku, neighbor sku, kind, rank) tuples.
+
+    Returns:
+        int: Number of rows inserted.
+    """
+    from .models import ItemNeighbor
+
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(ItemNeighbor._meta.get_field(name).column) for name in ('item', 'neighbor', 'kind', 'rank'))
+    sql = f"INSERT INTO {quote(ItemNeighbor._meta.db_table)} ({columns}) VALUES (%s, %s, %s, %s)"
+    rows = list(rows)
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+    return len(rows)
+
+
+def rebuild_item_neighbors():
+    """
+    Recompute the whole neighbor table, one sorted pass over the catalog per kind.
+
+    Returns:
+        dict: Items and neighbor rows written per kind, and elapsed_ms.
+    """
+    from .models import Item, ItemNeighbor
+
+    started = time.perf_counter()
+    report = {}
+    with transaction.atomic():
+        ItemNeighbor.objects.all().delete()
+        for kind, fields in NEIGHBOR_GROUPS.items():
+            rows = Item.objects.order_by(*fields, 'price', 'sku').values_list(*fields, 'sku', 'price')
+            items = written = 0
+            # The whole sorted list is read first, so no cursor stays open during the inserts
+            for _, group in groupby(list(rows.iterator(chunk_size=5000)), key=lambda row: row[:len(fields)]):
+                window = [row[-2:] for row in group]
+                items += len(window)
+                written += insert_neighbors(
+                    (sku, neighbor, kind, rank)
+                    for sku, neighbors in rank_window(window, NEIGHBOR_LIMITS[kind]).items()
+                    for rank, neighbor in enumerate(neighbors)
+                )
+            report[kind] = {'items': items, 'rows': written}
+    report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return report
+
+
+def neighbors_for(skus, kind):
+    """
+    Stored neighbors of many items, with one indexed query.
+
+    The neighbors are loaded with only the columns of the compact item
+    representation (ITEM_SUMMARY_FIELDS) nested in responses.
+
+    Args:
+        skus (iterable): Skus of the items.
+        kind (str): SUBSTITUTE or SUGGESTION.
+
+    Returns:
+        dict: Sku -> list of neighbor Items, closest first (only items that have neighbors).
+    """
+    from .models import ItemNeighbor, ITEM_SUMMARY_FIELDS
+
+    neighbors = defaultdict(list)
+    rows = ItemNeighbor.objects.filter(kind=kind, item__in=list(skus)).select_related('neighbor').only(
+        'item', 'rank', 'neighbor', *(f'neighbor__{field}' for field in ITEM_SUMMARY_FIELDS)
+    ).order_by('item', 'rank')
+    for row in rows:
+        neighbors[row.item_id].append(row.neighbor)
+    return dict(neighbors)
+
+
+def line_alternatives(lines):
+    """
+    Alternatives of many collection lines, with two queries.
+
+    As in Item.get_substitute_or_suggestion, a substitutable line is offered
+    its item's substitutes, if it has any, and every other line its
+    suggestions.
+
+    Args:
+        lines (iterable): (sku, substitutable) pairs.
+
+    Returns:
+        list: (sku, kind, list of Items closest first) per line, in order.
+    """
+    lines = list(lines)
+    substitutes = neighbors_for({sku for sku, substitutable in lines if substitutable}, SUBSTITUTE)
+    suggestions = neighbors_for({sku for sku, _ in lines if sku not in substitutes}, SUGGESTION)
+    return [
+        (sku, SUBSTITUTE, substitutes[sku]) if sku in substitutes else (sku, SUGGESTION, suggestions.get(sku, []))
+        for sku, _ in lines
+    ]
@@ -0,0 +1,202 @@
+import time
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import Case, OuterRef, Q, Subquery, When
+from .clustering import GROUP_FIELDS, PACK_LABELS, pack_indices
+from .deferred import defer
+
+# Item fields an alternative must share with the collection item it replaces
+ALTERNATIVE_FIELDS = ('category', 'subject', 'tag')
+
+
+def alternative_key(cluster_group):
+    """
+    Alternative group of an item, from its cluster group.
+
+    Args:
+        cluster_group (tuple): Values of GROUP_FIELDS, as in Item.cluster_group.
+
+    Returns:
+        tuple: Values of ALTERNATIVE_FIELDS.
+    """
+    values = dict(zip(GROUP_FIELDS, cluster_group))
+    return tuple(values[field] for field in ALTERNATIVE_FIELDS)
+
+
+def with_alternatives(lines):
+    """
+    Annotate collection lines with the alternative of their item.
+
+    The alternative of a substitutable line is the first item (by sku) of
+    the same category, subject and tag priced at most as much as the line's
+    item, other than the item itself. All of them are resolved by the
+    database in the query that reads the lines.
+
+    Args:
+        lines (QuerySet): CollectionItems.
+
+    Returns:
+        QuerySet: The lines with their item loaded and the ``alternative_sku``
+        of each substitutable line (None if there is no alternative).
+    """
+    from .models import Item
+
+    candidates = Item.objects.filter(
+        **{field: OuterRef(f'item__{field}') for field in ALTERNATIVE_FIELDS},
+        price__lte=OuterRef('item__price'),
+    ).exclude(pk=OuterRef('item')).order_by('sku')
+    return lines.select_related('item').annotate(
+        alternative_sku=Case(When(substitutable=True, then=Subquery(candidates.values('sku')[:1])), default=None)
+    )
+
+
+def build_packs(lines):
+    """
+    Compute the Economy, Value and Premium variants of a collection.
+
+    The line prices are split into PACK_LABELS clusters once; in the pack of
+    its own cluster, a substitutable line is replaced by its alternative,
+    and every other line is kept as it is. The alternatives of all lines are
+    loaded with one query.
+
+    Args:
+        lines (iterable): CollectionItems from with_alternatives.
+
+    Returns:
+        dict: Pack label -> dict with the pack's ``lines`` (item sku,
+        quantity and the sku of the replaced item, if any), ``total`` and
+        ``discounted_total``.
+    """
+    from .models import Item
+
+    lines = list(lines)
+    alternatives = Item.objects.in_bulk({line.alternative_sku for line in lines if line.alternative_sku})
+    ranks = pack_indices([line.item.price for line in lines], len(PACK_LABELS))
+    packs = {label: {'lines': [], 'total': Decimal('0.00'), 'discounted_total': Decimal('0.00')} for label in PACK_LABELS}
+    for line, rank in zip(lines, ranks):
+        alternative = alternatives.get(line.alternative_sku)
+        for index, label in enumerate(PACK_LABELS):
+            item = alternative if alternative is not None and index == rank else line.item
+            pack = packs[label]
+            pack['lines'].append({
+                'item': item.pk,
+                'quantity': line.quantity,
+                'replaces': line.item.pk if item is not line.item else None,
+            })
+            pack['total'] += item.price * line.quantity
+            pack['discounted_total'] += item.discounted_price * line.quantity
+    return packs
+
+
+def collection_packs(collection):
+    """
+    Stored packs of a collection, computing and storing them first if they
+    were invalidated.
+
+    Args:
+        collection (Collection): The collection.
+
+    Returns:
+        dict: Pack label -> CollectionPack, in PACK_LABELS order.
+    """
+    from .models import CollectionItem, CollectionPack
+
+    packs = {pack.label: pack for pack in CollectionPack.objects.filter(collection=collection)}
+    if len(packs) < len(PACK_LABELS):
+        lines = with_alternatives(CollectionItem.objects.filter(collection=collection).order_by('id'))
+        packs = {
+            label: CollectionPack(collection=collection, label=label, **pack)
+            for label, pack in build_packs(lines).items()
+        }
+        # A concurrent read may have stored the same packs in the meantime
+        CollectionPack.objects.bulk_create(packs.values(), ignore_conflicts=True)
+    return {label: packs[label] for label in PACK_LABELS}
+
+
+def invalidate_packs(collections=(), groups=()):
+    """
+    Drop the stored packs that a change may have affected.
+
+    Packs are built again on their next read.
+
+    Args:
+        collections (iterable): Ids of collections whose lines changed.
+        groups (iterable): ALTERNATIVE_FIELDS tuples of changed items. Packs
+            of collections with a line in one of these groups are dropped,
+            since the line's price or its alternative may have changed.
+
+    Returns:
+        int: Number of packs dropped.
+    """
+    from .models import CollectionItem, CollectionPack
+
+    collections, groups = list(collections), set(groups)
+    conditions = []
+    if collections:
+        conditions.append(Q(collection__in=collections))
+    if groups:
+        lines = reduce(or_, (
+            Q(**{f'item__{field}': value for field, value in zip(ALTERNATIVE_FIELDS, group)}) for group in groups
+        ))
+        conditions.append(Q(collection__in=CollectionItem.objects.filter(lines).values('collection')))
+    if not conditions:
+        return 0
+    deleted, _ = CollectionPack.objects.filter(reduce(or_, conditions)).delete()
+    return deleted
+
+
+def defer_pack_invalidation(collections=(), groups=()):
+    """
+    Queue packs to be dropped once the current transaction commits (see
+    deferred.defer).
+
+    However many lines or items a transaction writes, its packs are dropped
+    with one statement.
+
+    Args:
+        collections (iterable): Ids of collections whose lines changed.
+        groups (iterable): ALTERNATIVE_FIELDS tuples of changed items.
+    """
+    defer(flush_pack_invalidation, collections=collections, groups=groups)
+
+
+def flush_pack_invalidation(collections, groups):
+    """
+    Drop the packs of the queued collections and groups.
+    """
+    if collections or groups:
+        invalidate_packs(set(collections), groups)
+
+
+def pack_items(packs):
+    """
+    Items referenced by some packs, with one query.
+
+    Returns:
+        dict: Sku -> Item, with only ITEM_SUMMARY_FIELDS loaded.
+    """
+    from .models import Item, ITEM_SUMMARY_FIELDS
+
+    skus = {line['item'] for pack in packs for line in pack.lines}
+    return Item.objects.only(*ITEM_SUMMARY_FIELDS).in_bulk(skus)
+
+
+def rebuild_collection_packs():
+    """
+    Recompute the packs of every collection.
+
+    Returns:
+        dict: Number of collections and elapsed_ms.
+    """
+    from .models import Collection, CollectionPack
+
+    started = time.perf_counter()
+    with transaction.atomic():
+        CollectionPack.objects.all().delete()
+        collections = 0
+        for collection in Collection.objects.order_by('pk'):
+            collection_packs(collection)
+            collections += 1
+    return {'collections': collections, 'elapsed_ms': round((time.perf_counter() - started) * 1000, 2)}
@@ -0,0 +1,87 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.response import Response
+from .versions import VersionedReadMixin
+
+# Seconds a request may hold the rebuild lock of a cache entry
+LOCK_TIMEOUT = 30
+
+# Other requests poll the cache for the lock holder's entry at doubling
+# intervals, from FIRST_POLL up to MAX_POLL seconds
+FIRST_POLL = 0.01
+MAX_POLL = 0.25
+
+
+class CachedResponse(Exception):
+    """Raised to answer a read from a cached rendering."""
+
+    def __init__(self, entry):
+        super().__init__()
+        self.entry = entry
+
+
+class CachedReadMixin(VersionedReadMixin):
+    """
+    Cache of the rendered bodies of anonymous catalog reads.
+
+    Entries are keyed by the response's ETag, which covers the resource
+    versions, the absolute URL with its query parameters and the media type. A write
+    bumps a version, so the next read misses and the stale entries simply age
+    out after `CATALOG_CACHE_TIMEOUT` seconds.
+
+    On a miss, only the request that wins the entry's lock (an atomic
+    ``cache.add``) renders it; concurrent requests for the same entry poll the
+    cache instead of running the same queries, for as long as the lock may be
+    held (LOCK_TIMEOUT). If the holder releases the lock without storing the
+    entry (an error response), the next waiter to take the lock renders it.
+    """
+
+    def get_cache_key(self):
+        tag = self.etag.strip('"')
+        return f"catalog:{type(self).__name__}:{tag}"
+
+    def initial(self, request, *args, **kwargs):
+        self.cache_lock = None
+        super().initial(request, *args, **kwargs)
+        if self.etag is None:
+            return
+
+        key = self.get_cache_key()
+        entry = cache.get(key)
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        interval = FIRST_POLL
+        while entry is None:
+            if cache.add(f"{key}:lock", 1, LOCK_TIMEOUT):
+                self.cache_lock = f"{key}:lock"
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return  # The holder is stuck, render without the lock
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, MAX_POLL)
+            entry = cache.get(key)
+        raise CachedResponse(entry)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, CachedResponse):
+            response = HttpResponse(exc.entry['content'], content_type=exc.entry['content_type'])
+            response['X-Cache'] = 'HIT'
+            return response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        try:
+            if getattr(self, 'etag', None) is not None and isinstance(response, Response) and response.status_code == 200:
+                response.render()
+                cache.set(self.get_cache_key(), {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                }, settings.CATALOG_CACHE_TIMEOUT)
+                response['X-Cache'] = 'MISS'
+        finally:
+            if getattr(self, 'cache_lock', None):
+                cache.delete(self.cache_lock)
+        return response
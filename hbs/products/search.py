@@ -0,0 +1,89 @@
+import re
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+# Searchable Item fields and the weight a match in each of them carries. The
+# order is the column order of the full-text index (see migration 0008).
+SEARCH_FIELDS = {'name': 3.0, 'ISBN': 5.0, 'subject': 2.0, 'publisher': 2.0, 'description': 1.0}
+
+# Name of the FULLTEXT index (MySQL) or FTS5 table (SQLite) over SEARCH_FIELDS
+SEARCH_INDEX = 'products_item_search'
+
+# Keyset ordering of search results: best first, ties broken by sku
+SEARCH_ORDERING = ('-relevance', 'sku')
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(query):
+    """Split a free-text query into lowercase word tokens."""
+    return TOKEN_RE.findall(query.lower())
+
+
+def _mysql_search(queryset, query):
+    columns = ', '.join(connection.ops.quote_name(field) for field in SEARCH_FIELDS)
+    relevance = RawSQL(f"MATCH ({columns}) AGAINST (%s IN NATURAL LANGUAGE MODE)", [query], output_field=FloatField())
+    return queryset.annotate(relevance=relevance).filter(relevance__gt=0).order_by(*SEARCH_ORDERING)
+
+
+def _fts_search(queryset, match):
+    """The items of the queryset matching an FTS5 match expression, annotated with their relevance."""
+    # bm25() is lower for better matches; it is negated so that, as on MySQL,
+    # a higher relevance is better
+    weights = ', '.join(str(weight) for weight in SEARCH_FIELDS.values())
+    relevance = RawSQL(f"-bm25({SEARCH_INDEX}, {weights})", [], output_field=FloatField())
+    # The FTS5 table is not a model, so it is joined with extra()
+    return queryset.extra(
+        tables=[SEARCH_INDEX],
+        where=[f"{SEARCH_INDEX}.rowid = {queryset.model._meta.db_table}.rowid", f"{SEARCH_INDEX} MATCH %s"],
+        params=[match],
+    ).annotate(relevance=relevance).order_by(*SEARCH_ORDERING)
+
+
+def _sqlite_search(queryset, query):
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset.none()
+    # Quote every token so FTS5 query syntax in user input is matched literally.
+    # Items matching every token are returned; if there are none, items
+    # matching any token (as in MySQL natural language mode).
+    quoted = [f'"{token}"' for token in tokens]
+    results = _fts_search(queryset, ' '.join(quoted))
+    if len(tokens) > 1 and not results.exists():
+        results = _fts_search(queryset, ' OR '.join(quoted))
+    return results
+
+
+def search_items(queryset, query):
+    """
+    Full-text search the items of a queryset, best matches first.
+
+    On MySQL the query runs against the FULLTEXT index in natural language
+    mode and relevance is computed by the database. On SQLite (tests and
+    development) an FTS5 table kept in sync by triggers ranks the catalog with
+    BM25, preferring items that match every query word. Other databases fall
+    back to an unranked substring match.
+
+    The results are annotated with a ``relevance`` (higher is better) and
+    ordered by SEARCH_ORDERING, so they can be paged with keyset pagination.
+
+    Args:
+        queryset (QuerySet): Items to search.
+        query (str): Free-text query.
+
+    Returns:
+        QuerySet: The matching items, best first.
+    """
+    if connection.vendor == 'mysql':
+        return _mysql_search(queryset, query)
+    if connection.vendor == 'sqlite':
+        return _sqlite_search(queryset, query)
+
+    match = Q()
+    for token in tokenize(query):
+        for field in SEARCH_FIELDS:
+            match |= Q(**{f'{field}__icontains': token})
+    if not match:
+        return queryset.none()
+    return queryset.filter(match).annotate(relevance=Value(0.0, output_field=FloatField())).order_by(*SEARCH_ORDERING)
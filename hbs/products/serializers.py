@@ -1,12 +1,19 @@
+from collections import Counter
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import Item, Collection, CollectionItem
+from .models import Item, Collection, CollectionItem, CollectionPack, ITEM_SUMMARY_FIELDS
+from .packs import defer_pack_invalidation
+from .versions import bump_versions
 from userManager.serializers import OrganizationSummarySerializer
+from hbs.serializers import SparseFieldsMixin
 
 
-class ItemSerializer(serializers.ModelSerializer):
+class ItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the Item model.
     Converts Item instances to JSON and vice versa.
+    Responses can be narrowed with `?fields=` / `?exclude=`.
     
     Meta:
         model: The model being serialized (Item).
@@ -17,22 +24,38 @@ class ItemSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class ItemSummarySerializer(serializers.ModelSerializer):
+    """
+    Compact, read-only serializer for items nested in collections and orders.
+
+    Meta:
+        model: The model being serialized (Item).
+        fields: ITEM_SUMMARY_FIELDS.
+    """
+    class Meta:
+        model = Item
+        fields = ITEM_SUMMARY_FIELDS
+        read_only_fields = ITEM_SUMMARY_FIELDS
+
+
 class CollectionItemSerializer(serializers.ModelSerializer):
     """
     Serializer for the CollectionItem model. It connects the items and their quantities
     within a collection.
     
-    item: A nested serializer for the item field, providing detailed item information.
+    item: A nested serializer for the item field, providing the compact item representation.
+    item_id: The item's sku, on writes.
     
     Meta:
         model: The model being serialized (CollectionItem).
         fields: Specifies the fields to include in the serialization.
     """
-    item = ItemSerializer(read_only=True)  # Expecting the item's primary key (id)
+    item = ItemSummarySerializer(read_only=True)
+    item_id = serializers.CharField(write_only=True)  # Checked for all lines at once by CollectionSerializer
 
     class Meta:
         model = CollectionItem
-        fields = ['item', 'quantity', 'substitutable']  # Added substitutable field
+        fields = ['item', 'item_id', 'quantity', 'substitutable']  # Added substitutable field
 class CollectionItemSerializerEditable(serializers.ModelSerializer):
     """
     Serializer for the CollectionItem model. It connects the items and their quantities
@@ -49,7 +72,7 @@ class CollectionItemSerializerEditable(serializers.ModelSerializer):
     class Meta:
         model = CollectionItem
         fields = ['item', 'quantity', 'substitutable']  # Added substitutable field
-class CollectionSerializer(serializers.ModelSerializer):
+class CollectionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for the Collection model. Includes related CollectionItem objects using
     the CollectionItemSerializer.
@@ -66,32 +89,92 @@ class CollectionSerializer(serializers.ModelSerializer):
         model = Collection
         fields = '__all__'
 
+    def validate_items(self, items):
+        """
+        Check that every line names an existing item, with one query, and
+        that no item is listed twice.
+        """
+        skus = Counter(line['item_id'] for line in items)
+        duplicates = sorted(sku for sku, count in skus.items() if count > 1)
+        if duplicates:
+            raise serializers.ValidationError(f"Items listed more than once: {', '.join(duplicates)}.")
+        missing = sorted(set(skus) - set(Item.objects.filter(pk__in=list(skus)).values_list('pk', flat=True)))
+        if missing:
+            raise serializers.ValidationError(f"Items not found: {', '.join(missing)}.")
+        return items
+
     def create(self, validated_data):
         # Extract items data
         items_data = validated_data.pop('items', [])
         
-        # Create the collection
-        collection = Collection.objects.create(**validated_data)
-        
-        # Create collection items
-        for item_data in items_data:
-            CollectionItem.objects.create(collection=collection, **item_data)
+        # Create the collection and its items in one insert
+        with transaction.atomic():
+            collection = Collection.objects.create(**validated_data)
+            CollectionItem.objects.bulk_create(
+                [CollectionItem(collection=collection, **item_data) for item_data in items_data]
+            )
         
-        return collection
+        return self._with_items(collection)
 
     def update(self, instance, validated_data):
-        # Extract items data
-        items_data = validated_data.pop('items', [])
+        # Extract items data (absent from partial updates that leave the items alone)
+        items_data = validated_data.pop('items', None)
         
-        # Update the collection
-        instance = super().update(instance, validated_data)
+        # Update the collection and write only the items that changed
+        with transaction.atomic():
+            instance = super().update(instance, validated_data)
+            if items_data is not None:
+                self._sync_items(instance, items_data)
         
-        # Clear existing items and add new ones
-        instance.items.all().delete()
+        return self._with_items(instance)
+
+    def _sync_items(self, collection, items_data):
+        """
+        Bring the items of a collection to the given lines.
+
+        Lines are matched by item: new items are inserted with one
+        ``bulk_create``, changed quantities and substitutability written
+        with one ``bulk_update`` and the lines of removed items deleted with
+        one statement, so unchanged lines keep their rows.
+
+        Returns:
+            bool: Whether any line changed.
+        """
+        existing, removed = {}, []
+        for line in CollectionItem.objects.filter(collection=collection).order_by('id'):
+            if line.item_id in existing:
+                removed.append(line.pk)  # A second line for the same item
+            else:
+                existing[line.item_id] = line
+
+        created, updated = [], []
         for item_data in items_data:
-            CollectionItem.objects.create(collection=instance, **item_data)
-        
-        return instance
+            wanted = CollectionItem(collection=collection, **item_data)
+            line = existing.pop(wanted.item_id, None)
+            if line is None:
+                created.append(wanted)
+            elif (line.quantity, line.substitutable) != (wanted.quantity, wanted.substitutable):
+                line.quantity, line.substitutable = wanted.quantity, wanted.substitutable
+                updated.append(line)
+        removed += [line.pk for line in existing.values()]
+
+        if removed:
+            CollectionItem.objects.filter(pk__in=removed).delete()
+        CollectionItem.objects.bulk_create(created)
+        CollectionItem.objects.bulk_update(updated, ['quantity', 'substitutable'])
+        if created or updated:
+            # Bulk writes skip the signals that invalidate packs and ETags
+            defer_pack_invalidation(collections=[collection.pk])
+            bump_versions('collections')
+        return bool(removed or created or updated)
+
+    def _with_items(self, collection):
+        """
+        Read a saved collection back with its items, so the response is
+        rendered with two queries.
+        """
+        items = CollectionItem.with_item_summaries().order_by('id')
+        return Collection.objects.prefetch_related(Prefetch('items', queryset=items)).get(pk=collection.pk)
 
 class CollectionSummarySerializer(serializers.ModelSerializer):
     """
@@ -125,3 +208,51 @@ class DynamicCollectionSerializer(serializers.Serializer):
     
     class Meta:
         fields = ['cluster_name', 'items']
+
+
+class PackLineSerializer(serializers.Serializer):
+    """
+    Serializer for one line of a collection pack.
+
+    item: The compact representation of the line's item.
+    replaces: Sku of the collection's item the line substitutes, or None.
+    """
+    item = ItemSummarySerializer(read_only=True)
+    quantity = serializers.IntegerField(read_only=True)
+    replaces = serializers.CharField(read_only=True, allow_null=True)
+
+
+class CollectionPackSerializer(serializers.ModelSerializer):
+    """
+    Serializer for the precomputed packs of a collection.
+
+    The line items are looked up in the ``items`` context (sku -> Item), so
+    the items of all packs are loaded with one query.
+
+    Meta:
+        model: The model being serialized (CollectionPack).
+        fields: The pack label, totals and lines.
+    """
+    items = serializers.SerializerMethodField()
+
+    class Meta:
+        model = CollectionPack
+        fields = ['label', 'total', 'discounted_total', 'items']
+
+    def get_items(self, pack):
+        items = self.context['items']
+        lines = [{**line, 'item': items[line['item']]} for line in pack.lines]
+        return PackLineSerializer(lines, many=True, context=self.context).data
+
+
+class LineAlternativesSerializer(serializers.Serializer):
+    """
+    Serializer for the alternatives of one collection line.
+
+    item: Sku of the line's item.
+    kind: 'substitute' or 'suggestion'.
+    alternatives: The compact representation of the alternative items, closest in price first.
+    """
+    item = serializers.CharField(read_only=True)
+    kind = serializers.CharField(read_only=True)
+    alternatives = ItemSummarySerializer(many=True, read_only=True)
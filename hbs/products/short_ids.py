@@ -0,0 +1,193 @@
+import hashlib
+import string
+import threading
+from functools import lru_cache
+from collections import defaultdict, deque
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connections, transaction
+
+# Codes use the same alphabet and length as the historical random codes
+ALPHABET = string.ascii_uppercase + string.digits
+CODE_LENGTH = 6
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH
+
+# Number of codes a process leases at once for single inserts
+LEASE_SIZE = 20
+
+FEISTEL_ROUNDS = 4
+HALF_BITS = 16
+HALF_MASK = (1 << HALF_BITS) - 1
+
+_leases = defaultdict(deque)
+_lease_lock = threading.Lock()
+
+
+def _namespace(model):
+    return model._meta.label_lower
+
+
+@lru_cache(maxsize=None)
+def _round_key(namespace):
+    return hashlib.sha256(f"{settings.SECRET_KEY}:{namespace}".encode()).digest()[:32]
+
+
+def permute(namespace, counter):
+    """
+    Map a counter onto a pseudo-random position of the code space.
+
+    A keyed 4-round Feistel network permutes 32-bit integers and cycle-walks
+    until the result falls inside the 36^6 code space, so distinct counters
+    always give distinct positions while consecutive counters look unrelated.
+
+    Args:
+        namespace (str): Sequence name, mixed into the key.
+        counter (int): Value in [0, CODE_SPACE).
+
+    Returns:
+        int: Position in [0, CODE_SPACE).
+    """
+    key = _round_key(namespace)
+    value = counter
+    while True:
+        left, right = value >> HALF_BITS, value & HALF_MASK
+        for round_number in range(FEISTEL_ROUNDS):
+            digest = hashlib.blake2b(
+                right.to_bytes(2, 'big') + bytes([round_number]), key=key, digest_size=2
+            ).digest()
+            left, right = right, left ^ int.from_bytes(digest, 'big')
+        value = (left << HALF_BITS) | right
+        if value < CODE_SPACE:
+            return value
+
+
+def encode(position):
+    """Encode a code space position as a 6-character alphanumeric code."""
+    chars = []
+    for _ in range(CODE_LENGTH):
+        position, digit = divmod(position, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return ''.join(reversed(chars))
+
+
+def leases_commit_separately():
+    """
+    Whether counters are leased on a connection of their own, committed at
+    once instead of with the caller's transaction.
+
+    SQLite allows a single writer at a time, so a second connection would
+    wait on the caller's own transaction; there counters are leased in the
+    caller's transaction instead.
+    """
+    return connections[DEFAULT_DB_ALIAS].vendor != 'sqlite'
+
+
+def _lease_counters(namespace, count):
+    """
+    Reserve ``count`` consecutive counter values for the namespace.
+
+    The sequence row is only locked for the lease itself: where possible
+    (see leases_commit_separately) the lease is committed on a separate
+    connection, so it is not held until the caller's transaction commits.
+
+    Returns:
+        range: The reserved counter values.
+    """
+    from .models import IdSequence
+
+    if leases_commit_separately():
+        end = _lease_separately(IdSequence._meta, namespace, count)
+    else:
+        with transaction.atomic():
+            end = _advance(transaction.get_connection(), IdSequence._meta, namespace, count)
+    if end > CODE_SPACE:
+        raise OverflowError(f"Short ID space exhausted for {namespace}.")
+    return range(end - count, end)
+
+
+def _lease_separately(meta, namespace, count):
+    """
+    Advance the counter on a connection of its own and commit at once.
+
+    The connection is opened for the lease and closed after it, so no
+    connection outlives the lease (or the database's idle timeout) in
+    threaded servers.
+    """
+    connection = connections.create_connection(DEFAULT_DB_ALIAS)
+    try:
+        connection.set_autocommit(False)
+        while True:
+            try:
+                end = _advance(connection, meta, namespace, count)
+                connection.commit()
+                return end
+            except IntegrityError:
+                # The row was created by a concurrent lease, so it can be updated now
+                connection.rollback()
+    finally:
+        # Closing discards anything not committed
+        connection.close()
+
+
+def _advance(connection, meta, namespace, count):
+    """
+    Advance the namespace's counter by ``count``, creating its row if needed.
+
+    Returns:
+        int: The counter's new value (the end of the leased range).
+    """
+    quote = connection.ops.quote_name
+    table, key = quote(meta.db_table), quote(meta.get_field('namespace').column)
+    column = quote(meta.get_field('next_value').column)
+    with connection.cursor() as cursor:
+        cursor.execute(f"UPDATE {table} SET {column} = {column} + %s WHERE {key} = %s", [count, namespace])
+        if not cursor.rowcount:
+            cursor.execute(f"INSERT INTO {table} ({key}, {column}) VALUES (%s, %s)", [namespace, count])
+        cursor.execute(f"SELECT {column} FROM {table} WHERE {key} = %s", [namespace])
+        return cursor.fetchone()[0]
+
+
+def allocate_codes(model, count):
+    """
+    Allocate unique short codes for new rows of a model.
+
+    The counter block is leased with a single UPDATE, so thousands of codes
+    can be allocated for a ``bulk_create`` at once. Codes that collide with
+    rows created before the allocator existed (random codes) are dropped with
+    one lookup per 1000 codes and replaced from the next block.
+
+    Args:
+        model (Model): Model whose primary key is a 6-character code.
+        count (int): Number of codes to allocate.
+
+    Returns:
+        list: ``count`` unused codes.
+    """
+    namespace = _namespace(model)
+    codes = []
+    while len(codes) < count:
+        block = [encode(permute(namespace, counter)) for counter in _lease_counters(namespace, count - len(codes))]
+        for start in range(0, len(block), 1000):
+            chunk = block[start:start + 1000]
+            taken = set(model._default_manager.filter(pk__in=chunk).values_list('pk', flat=True))
+            codes.extend(code for code in chunk if code not in taken)
+    return codes
+
+
+def next_code(model):
+    """
+    Return the next unique short code for a single new row of a model.
+
+    Codes are taken from a per-process lease of ``LEASE_SIZE`` codes, so most
+    inserts do not query the sequence table at all. Where leases commit with
+    the caller's transaction (SQLite) a rollback would release the block
+    again, so inside a transaction only the code that is needed is reserved.
+    """
+    if not leases_commit_separately() and transaction.get_connection().in_atomic_block:
+        return allocate_codes(model, 1)[0]
+
+    namespace = _namespace(model)
+    with _lease_lock:
+        lease = _leases[namespace]
+        if not lease:
+            lease.extend(allocate_codes(model, LEASE_SIZE))
+        return lease.popleft()
@@ -1,92 +1,218 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
 from django.dispatch import receiver
-from .models import Item, Collection, CollectionItem
+from .models import Item, Collection, CollectionItem, discounted_price_for
 from PIL import Image
 from decimal import Decimal, InvalidOperation
-import numpy as np
-from sklearn.cluster import KMeans
+from .clustering import recluster_items, cluster_group_filter
+from .facets import FACET_FIELDS, facet_key, item_moved, rebuild_facet_counts, recount_facet_keys
+from .versions import bump_versions
+from .neighbors import neighbor_points, defer_neighbor_refresh
+from .packs import alternative_key, defer_pack_invalidation
+from .deferred import defer
 from userManager.models import Organization
 from django.db import transaction
 import logging
 
 # Setup logging
 logger = logging.getLogger(__name__)
+
+# Receivers of the same signal run in the order they are connected (the order
+# below). The facet-count and neighbor receivers come before the cluster
+# receivers, so they see the row as it was written, before a recluster moves
+# it again (the recluster updates the counts and queues its own refresh).
+
 @receiver(pre_save, sender=Item)
 def calculate_discounted_price(sender, instance, **kwargs):
     """
     Calculate the discounted price before saving the Item.
     """
-    try:
-        discount_value = Decimal(instance.discount)
-    except InvalidOperation:
-        discount_value = Decimal('0.00')  # Default to 0 if invalid
+    instance.discounted_price = discounted_price_for(instance.price, instance.discount)
 
-    try:
-        price_value = Decimal(instance.price)
-    except InvalidOperation:
-        price_value = Decimal('0.00')  # Default to 0 if invalid
 
-    # Calculate discounted price
-    if discount_value > 0:
-        discount_amount = price_value * (discount_value / Decimal('100'))
-        instance.discounted_price = price_value - discount_amount
-    else:
-        instance.discounted_price = price_value
+@receiver(pre_save, sender=Item)
+@receiver(pre_delete, sender=Item)
+def read_stored_facet_key(sender, instance, signal, raw=False, **kwargs):
+    """
+    Read the stored facet values of an Item that was loaded without them
+    (e.g. with ``only()``), so its old facet key can be recounted.
+    """
+    if instance._loaded_facet_key is None and not raw and (signal is pre_delete or not instance._state.adding):
+        stored = Item.objects.filter(pk=instance.pk).values(*FACET_FIELDS).first()
+        instance._stored_facet_key = stored and facet_key(stored)
 
 
 @receiver(post_save, sender=Item)
-def assign_cluster(sender, instance, **kwargs):
-    """
-     assign a price cluster after saving the Item.
-    """
-
-    # Assign price cluster if not already assigned
-    if not instance._cluster_assigned:
-        assign_price_cluster(instance)
-
-
-def assign_price_cluster(item):
-    """
-    Dynamically assign the price cluster based on the item's price,
-    but only for items with the same tag, category, and subject.
-    """
-    # Filter items by same tag, category, and subject
-    similar_items = Item.objects.filter(
-        tag=item.tag,
-        category=item.category,
-        subject=item.subject,
-        grade=item.grade,
-        curriculum=item.curriculum
-    )
-    if similar_items.count() >= 3:
-        prices = np.array([float(item.price) for item in similar_items]).reshape(-1, 1)
-
-        # Perform KMeans clustering
-        kmeans = KMeans(n_clusters=3)
-        kmeans.fit(prices)
-        clusters = kmeans.predict(prices)
-
-        sorted_clusters = np.argsort(kmeans.cluster_centers_.flatten())
-        cluster_labels = {
-            sorted_clusters[0]: 'Economy Pack',
-            sorted_clusters[1]: 'Value Pack',
-            sorted_clusters[2]: 'Premium Pack'
-        }
-
-        # Assign cluster to similar items
-        for similar_item, cluster in zip(similar_items, clusters):
-            if not similar_item._cluster_assigned:
-                similar_item.cluster = cluster_labels[cluster]
-                similar_item._cluster_assigned = True
-                similar_item.save()
-
-        # Assign cluster to the current item
-        item_cluster = kmeans.predict(np.array([[float(item.price)]]))[0]
-        item.cluster = cluster_labels[item_cluster]
+def update_facet_counts(sender, instance, created, **kwargs):
+    """
+    Move the saved Item between facet counts if its facet values changed.
+    """
+    loaded, current = instance._loaded_facet_key, facet_key(instance)
+    if created:
+        item_moved(None, current)
+    elif loaded is not None:
+        item_moved(loaded, current)
+    elif instance._stored_facet_key is not None:
+        # Saved without being loaded with its facet values: the old values were
+        # read by read_stored_facet_key, and both keys are recounted
+        recount_facet_keys({instance._stored_facet_key, current})
+        instance._stored_facet_key = None
     else:
-        # If less than 3 similar items, assign default cluster
-        item.cluster = 'Economy Pack'
+        # A new instance overwrote an existing row, whose values are unknown
+        rebuild_facet_counts()
+    instance._loaded_facet_key = current
+
+
+@receiver(post_delete, sender=Item)
+def release_facet_counts(sender, instance, **kwargs):
+    """
+    Remove a deleted Item from the facet counts.
+    """
+    if instance._loaded_facet_key is not None:
+        item_moved(instance._loaded_facet_key, None)
+    elif instance._stored_facet_key is not None:
+        recount_facet_keys([instance._stored_facet_key])
+
+
+@receiver(post_save, sender=Item)
+def refresh_item_neighbors(sender, instance, created, **kwargs):
+    """
+    Queue a neighbor table refresh around the item's old and new place.
+    """
+    loaded, current = instance._loaded_neighbor_values, instance.neighbor_values
+    instance._loaded_neighbor_values = current
+    if not created and loaded == current:
+        return
+    defer_neighbor_refresh(neighbor_points(current) | (neighbor_points(loaded) if loaded else set()))
+
+
+@receiver(pre_delete, sender=Item)
+def load_deferred_fields(sender, instance, **kwargs):
+    """
+    Load the fields a deleted Item was fetched without (e.g. with ``only()``):
+    the post_delete receivers place the item by them once its row is gone.
+    """
+    deferred = instance.get_deferred_fields()
+    if deferred:
+        instance.refresh_from_db(fields=deferred)
+
+
+@receiver(post_delete, sender=Item)
+def release_item_neighbors(sender, instance, **kwargs):
+    """
+    Queue a neighbor table refresh around the place of a deleted Item.
+    """
+    defer_neighbor_refresh(neighbor_points(instance._loaded_neighbor_values or instance.neighbor_values))
+
+
+@receiver(post_save, sender=Item)
+def invalidate_item_packs(sender, instance, created, **kwargs):
+    """
+    Queue the stored packs that list the item or could substitute it to be
+    dropped, if its price, discounted price or classification changed.
+    """
+    loaded, current = instance._loaded_pack_inputs, instance.pack_inputs
+    instance._loaded_pack_inputs = current
+    if not created and loaded == current:
+        return
+    groups = {alternative_key(current[2])}
+    if loaded is not None:
+        groups.add(alternative_key(loaded[2]))
+    defer_pack_invalidation(groups=groups)
+
+
+@receiver(post_delete, sender=Item)
+def release_item_packs(sender, instance, **kwargs):
+    """
+    Queue the stored packs a deleted Item may have been an alternative in to be dropped.
+    """
+    defer_pack_invalidation(groups={alternative_key(instance.cluster_group)})
 
-    # Set the flag to avoid recursion
-    item._cluster_assigned = True
-    item.save()
+
+@receiver(post_save, sender=CollectionItem)
+@receiver(post_delete, sender=CollectionItem)
+def invalidate_collection_packs(sender, instance, **kwargs):
+    """
+    Queue the stored packs of a collection whose lines changed to be dropped.
+    """
+    defer_pack_invalidation(collections=[instance.collection_id])
+
+
+@receiver(post_save, sender=Item)
+def assign_cluster(sender, instance, created, **kwargs):
+    """
+    Mark the item's cluster group dirty after saving the Item.
+
+    Nothing is clustered here: the group (and the group the item left, if its
+    classification changed) is recomputed once after the transaction commits,
+    so editing many items of a group costs a single recompute.
+    """
+    loaded = instance._loaded_cluster_inputs
+    current = (instance.price, instance.cluster_group)
+    instance._loaded_cluster_inputs = current
+    if not created and loaded == current:
+        return  # Neither the price nor the group changed
+
+    groups = {current[1]}
+    if loaded is not None:
+        groups.add(loaded[1])
+    defer_price_clusters(groups, instance)
+
+
+@receiver(post_delete, sender=Item)
+def release_cluster(sender, instance, **kwargs):
+    """
+    Recompute the price clusters of the group a deleted Item belonged to.
+    """
+    defer_price_clusters({instance.cluster_group})
+
+
+def defer_price_clusters(groups, item=None):
+    """
+    Queue cluster groups for a recompute once the current transaction commits
+    (see deferred.defer).
+
+    Args:
+        groups (set): (tag, category, subject, grade, curriculum) tuples.
+        item (Item): Saved instance whose ``cluster`` should be refreshed in memory.
+    """
+    defer(flush_price_clusters, groups=groups, items=[] if item is None else [item])
+
+
+def flush_price_clusters(groups, items):
+    """
+    Recompute the queued cluster groups in one batch run.
+    """
+    if not groups:
+        return
+
+    changes = {}
+    report = recluster_items(Item.objects.filter(cluster_group_filter(set(groups))), changes=changes)
+    for item in items:
+        if item.pk in changes:
+            item.cluster = changes[item.pk]
+            # The recluster already moved the stored row between facet counts
+            # and in the neighbor table
+            item._loaded_facet_key = facet_key(item)
+            item._loaded_neighbor_values = item.neighbor_values
+    logger.debug(f"Reclustered {report['groups']} groups, {report['updated']} items updated")
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def bump_item_version(sender, **kwargs):
+    """
+    Invalidate the ETags of item and collection reads (collections nest their items).
+    """
+    bump_versions('items')
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+@receiver(post_save, sender=CollectionItem)
+@receiver(post_delete, sender=CollectionItem)
+@receiver(post_save, sender=Organization)
+def bump_collection_version(sender, **kwargs):
+    """
+    Invalidate the ETags of collection reads, which also show the school's name.
+    """
+    bump_versions('collections')
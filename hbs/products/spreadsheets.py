@@ -0,0 +1,148 @@
+import csv
+import json
+import zipfile
+from itertools import islice
+
+SUPPORTED_FORMATS = ('csv', 'xlsx', 'ndjson')
+
+# Errors of the csv, json and openpyxl readers on malformed or badly encoded files
+READ_ERRORS = (UnicodeDecodeError, csv.Error, zipfile.BadZipFile, KeyError, OSError, ValueError)
+
+
+class SpreadsheetError(ValueError):
+    """A spreadsheet, or one of its rows (``row_error``), that cannot be read."""
+
+    def __init__(self, message, row_error=False):
+        super().__init__(message)
+        self.row_error = row_error
+
+
+def detect_format(filename):
+    """Guess the spreadsheet format from a file name extension."""
+    extension = str(filename).rsplit('.', 1)[-1].lower()
+    return {'jsonl': 'ndjson', 'json': 'ndjson'}.get(extension, extension)
+
+
+def unsupported_format_message(file_format):
+    """Explain why a format cannot be imported."""
+    if file_format == 'xls':
+        return "Legacy .xls workbooks are not supported. Save the sheet as .xlsx or .csv."
+    return f"Unsupported format '{file_format}'. Use one of: {', '.join(SUPPORTED_FORMATS)}."
+
+
+def _normalize(headers, values):
+    """Build a row dict, dropping blank cells and trimming text."""
+    row = {}
+    for header, value in zip(headers, values):
+        if isinstance(value, str):
+            value = value.strip()
+        if header and value is not None and value != '':
+            row[header] = value
+    return row
+
+
+def _text_lines(source, encoding):
+    """
+    Decode a file line by line, so an encoding error stops the file at the
+    line it is on rather than at the end of a larger decoded block.
+    """
+    if isinstance(source, (str, bytes)) or hasattr(source, '__fspath__'):
+        with open(source, 'rb') as binary:
+            yield from _decoded(binary, encoding)
+    else:
+        yield from _decoded(source, encoding)
+
+
+def _decoded(binary, encoding):
+    for number, line in enumerate(binary, start=1):
+        # Only the first line may start with a byte order mark
+        yield line.decode(encoding if number == 1 else encoding.replace('-sig', ''))
+
+
+def iter_rows(source, file_format=None, row_errors=False):
+    """
+    Stream the data rows of a spreadsheet as dictionaries.
+
+    Rows are read one at a time (openpyxl read-only mode for XLSX, the csv
+    module for CSV), so memory use does not grow with the size of the sheet.
+    Headers and text cells are trimmed and blank cells are left out of the
+    row, so ``row.get(column, default)`` falls back to the default for them.
+
+    Args:
+        source: File path or binary file object.
+        file_format (str): One of SUPPORTED_FORMATS. Defaults to the format
+            detected from the file name.
+        row_errors (bool): Yield a SpreadsheetError in place of each NDJSON
+            line that is not valid JSON, instead of raising it, so the
+            caller can report the row and carry on.
+
+    Yields:
+        dict: One dictionary per non-empty data row, keyed by column header.
+
+    Raises:
+        SpreadsheetError: If the format is not supported, or the file is
+            corrupt or badly encoded. Rows before the error have already
+            been yielded.
+    """
+    file_format = file_format or detect_format(getattr(source, 'name', source))
+    if file_format not in SUPPORTED_FORMATS:
+        raise SpreadsheetError(unsupported_format_message(file_format))
+    try:
+        yield from _read_rows(source, file_format, row_errors)
+    except SpreadsheetError:
+        raise
+    except READ_ERRORS as exc:
+        raise SpreadsheetError(f"The {file_format} file cannot be read: {exc}") from exc
+
+
+def _read_rows(source, file_format, row_errors):
+    if file_format == 'csv':
+        reader = csv.reader(_text_lines(source, 'utf-8-sig'))
+        headers = [header.strip() for header in next(reader, [])]
+        for values in reader:
+            row = _normalize(headers, values)
+            if row:
+                yield row
+    elif file_format == 'ndjson':
+        for number, line in enumerate(_text_lines(source, 'utf-8'), start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                row = SpreadsheetError(f"Line {number} is not valid JSON: {exc}", row_error=True)
+                if not row_errors:
+                    raise row from exc
+            yield row
+    else:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+
+        try:
+            workbook = load_workbook(source, read_only=True, data_only=True)
+        except InvalidFileException as exc:
+            raise SpreadsheetError(f"The xlsx file cannot be read: {exc}") from exc
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            headers = [str(header).strip() if header is not None else '' for header in next(rows, ())]
+            for values in rows:
+                row = _normalize(headers, values)
+                if row:
+                    yield row
+        finally:
+            workbook.close()
+
+
+def iter_chunks(rows, size=500):
+    """
+    Group an iterable of rows into lists of at most ``size`` rows.
+
+    Yields:
+        list: The next chunk of rows.
+    """
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
@@ -1,3 +1,901 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+from fractions import Fraction
+from itertools import product
+import random
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.test import Client, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+from userManager.models import Individual, Organization
+from . import clustering
+from .clustering import PACK_LABELS, label_groups, label_prices, optimal_breaks, recluster_items
+from .deferred import defer
+from .facets import facet_counts, rebuild_facet_counts
+from .neighbors import NEIGHBOR_LIMITS, SUBSTITUTE, SUGGESTION, rebuild_item_neighbors, store_neighbors
+from .image_fetcher import ImageFetcher
+from .importer import import_items
+from .models import Collection, CollectionItem, CollectionPack, FacetCount, IdSequence, Item, ItemNeighbor, ResourceVersion
+from .packs import collection_packs
+from . import short_ids
+from .spreadsheets import iter_rows
+from .views import ItemViewSet
 
-# Create your tests here.
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+
+
+class ImageServer:
+    """
+    Local stand-in for the catalog image host.
+
+    Serves ``/images/<name>.png`` and counts every request. Paths under
+    ``/flaky/`` fail with HTTP 503 on the first attempt, ``/missing/`` always
+    returns 404.
+    """
+
+    def __init__(self):
+        self.hits = Counter()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.hits[self.path] += 1
+                if self.path.startswith('/missing/') or (self.path.startswith('/flaky/') and server.hits[self.path] == 1):
+                    self.send_response(404 if self.path.startswith('/missing/') else 503)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = PNG + self.path.rsplit('/', 1)[-1].split('-')[0].encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'image/png')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def clustering_cost(clusters):
+    """Exact within-cluster sum of squared distances to the mean."""
+    cost = Fraction(0)
+    for values in clusters:
+        if values:
+            mean = Fraction(sum(values), len(values))
+            cost += sum((value - mean) ** 2 for value in values)
+    return cost
+
+
+class OptimalBreaksTests(SimpleTestCase):
+    """
+    optimal_breaks solves 1-D k-means exactly and deterministically, and
+    label_prices labels groups of any shape.
+    """
+
+    def breaks_cost(self, values, n_clusters):
+        distinct, breaks = optimal_breaks(values, n_clusters)
+        bounds = [0, *breaks, len(distinct)]
+        clusters = [set(distinct[start:end]) for start, end in zip(bounds, bounds[1:])]
+        return clustering_cost([[value for value in values if value in cluster] for cluster in clusters])
+
+    def brute_force_cost(self, values, n_clusters):
+        """Cheapest assignment of every value to any of the clusters, contiguous or not."""
+        return min(
+            clustering_cost([[value for value, label in zip(values, labels) if label == cluster] for cluster in range(n_clusters)])
+            for labels in product(range(n_clusters), repeat=len(values))
+        )
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        for _ in range(100):
+            values = [rng.randint(1, 12) * 50 for _ in range(rng.randint(1, 6))]
+            for n_clusters in (1, 2, 3):
+                self.assertEqual(self.breaks_cost(values, n_clusters), self.brute_force_cost(values, n_clusters), (values, n_clusters))
+
+    def test_deterministic(self):
+        rng = random.Random(11)
+        for _ in range(100):
+            values = [rng.randint(1, 8) * 25 for _ in range(rng.randint(3, 30))]
+            expected = optimal_breaks(values)
+            for _ in range(3):
+                rng.shuffle(values)
+                self.assertEqual(optimal_breaks(values), expected)
+
+    def test_small_groups(self):
+        self.assertEqual(label_prices([]), [])
+        self.assertEqual(label_prices([300]), [PACK_LABELS[0]])
+        self.assertEqual(label_prices([900, 100]), [PACK_LABELS[0]] * 2)
+        self.assertEqual(label_prices([100, 900, 500]), [PACK_LABELS[0], PACK_LABELS[2], PACK_LABELS[1]])
+
+    def test_equal_and_duplicate_prices(self):
+        self.assertEqual(optimal_breaks([250] * 6), ([250.0], []))
+        self.assertEqual(label_prices([250] * 6), [PACK_LABELS[0]] * 6)
+        # Two distinct prices make two clusters, whatever their multiplicity
+        self.assertEqual(label_prices([400, 100, 100, 400, 100]), [PACK_LABELS[1], PACK_LABELS[0], PACK_LABELS[0], PACK_LABELS[1], PACK_LABELS[0]])
+        # Duplicates weigh in: the lone 100 is split off, not the heavy 700s
+        self.assertEqual(label_prices([100, 600, 650, 700, 700, 700, 1000]), [PACK_LABELS[0], *[PACK_LABELS[1]] * 5, PACK_LABELS[2]])
+
+
+class LabelGroupsTests(SimpleTestCase):
+    """
+    The vectorized label_groups labels every group as label_prices does,
+    whichever other groups it is labelled with.
+    """
+
+    def random_groups(self, rng):
+        groups = []
+        for _ in range(rng.randint(1, 12)):
+            size = rng.choice([1, 2, 3, 4, 5, 8, 15, 40])
+            shape = rng.choice(['equal', 'duplicates', 'cents'])
+            if shape == 'equal':
+                groups.append([rng.randint(1, 9) * 10] * size)
+            elif shape == 'duplicates':
+                groups.append([rng.randint(1, 8) * 50 for _ in range(size)])
+            else:
+                groups.append([rng.randint(5000, 300000) / 100 for _ in range(size)])
+        return groups
+
+    def assertMatchesLabelPrices(self, groups, rng):
+        rows = [(price, group) for group, prices in enumerate(groups) for price in prices]
+        rng.shuffle(rows)
+        labels = label_groups([price for price, _ in rows], [group for _, group in rows])
+        for group, prices in enumerate(groups):
+            in_group = [index for index, (_, row_group) in enumerate(rows) if row_group == group]
+            self.assertEqual(
+                [labels[index] for index in in_group],
+                label_prices([rows[index][0] for index in in_group]),
+                groups[group],
+            )
+
+    def test_matches_label_prices(self):
+        rng = random.Random(3)
+        for _ in range(300):
+            self.assertMatchesLabelPrices(self.random_groups(rng), rng)
+
+    def test_fallback_matches_label_prices(self):
+        # Groups with more distinct prices than this use optimal_breaks
+        rng = random.Random(5)
+        with mock.patch.object(clustering, 'VECTORIZED_MAX_DISTINCT', 4):
+            for _ in range(300):
+                self.assertMatchesLabelPrices(self.random_groups(rng), rng)
+
+    def test_tied_splits_ignore_other_groups(self):
+        # {50}, {250}, {300, 300, 350} and {50}, {250, 300, 300}, {350} cost
+        # the same, so floating point rounding decides between them
+        tied = [350, 50, 250, 300, 300]
+        expected = list(label_groups(tied, [0] * len(tied)))
+        for others in ([1011.53], [243.58, 2328.82, 350]):
+            # Labelled after the other group (group ids are sorted)
+            labels = label_groups(others + tied, [0] * len(others) + [1] * len(tied))
+            self.assertEqual(list(labels[len(others):]), expected)
+        self.assertEqual(expected, label_prices(tied))
+
+    def test_empty(self):
+        self.assertEqual(len(label_groups([], [])), 0)
+
+
+class ReclusterTests(TestCase):
+    """
+    A recluster writes only the items whose label changed, with bulk
+    updates, and moves their facet counts by deltas.
+    """
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.readers = [
+                Item.objects.create(name=f"Reader {price}", price=price, category='Textbooks', tag='Readers')
+                for price in (100, 110, 120, 500, 520, 900)
+            ]
+            for price in (50, 60, 1000):
+                Item.objects.create(name=f"Atlas {price}", price=price, category='Atlases', tag='Maps')
+        self.moved = [self.readers[0].sku, self.readers[4].sku]
+        Item.objects.filter(pk__in=self.moved).update(cluster=PACK_LABELS[2])  # Skips the signals
+        rebuild_facet_counts()
+
+    def facet_table(self):
+        return sorted(FacetCount.objects.filter(count__gt=0).values_list('category', 'cluster', 'count'))
+
+    def items_version(self):
+        return ResourceVersion.objects.filter(resource='items').values_list('version', flat=True).first() or 0
+
+    def test_writes_changed_rows_only(self):
+        version = self.items_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            # Read rows, savepoint, one UPDATE, one increment per changed facet key (3), release
+            with self.assertNumQueries(7) as queries:
+                report = recluster_items(refresh_neighbors=False)
+        self.assertEqual((report['groups'], report['items'], report['updated']), (2, 9, 2))
+        update = next(query['sql'] for query in queries.captured_queries if query['sql'].startswith('UPDATE "products_item"'))
+        self.assertEqual({item.sku for item in Item.objects.all() if item.sku in update}, set(self.moved))
+        self.assertEqual(
+            dict(Item.objects.filter(pk__in=self.moved).values_list('sku', 'cluster')),
+            {self.readers[0].sku: PACK_LABELS[0], self.readers[4].sku: PACK_LABELS[1]},
+        )
+        self.assertEqual(self.items_version(), version + 1)
+
+        counts = self.facet_table()
+        rebuild_facet_counts()
+        self.assertEqual(counts, self.facet_table())
+
+    def test_unchanged_catalog_writes_nothing(self):
+        recluster_items(refresh_neighbors=False)
+        version = self.items_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(3):
+                report = recluster_items()
+        self.assertEqual(report['updated'], 0)
+        self.assertEqual(self.items_version(), version)
+
+
+class DeferTests(TestCase):
+    """
+    Work queued for after the commit belongs to the transaction that queued it.
+    """
+
+    def setUp(self):
+        self.flushed = []
+
+    def flush(self, values):
+        self.flushed.append(sorted(values))
+
+    def test_one_flush_per_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            defer(self.flush, values=[1])
+            defer(self.flush, values=[2, 3])
+        self.assertEqual(self.flushed, [[1, 2, 3]])
+
+    def test_rollback_is_not_flushed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                defer(self.flush, values=[1])
+                raise ValueError
+            defer(self.flush, values=[2])
+        self.assertEqual(self.flushed, [[2]])
+
+
+class ShortIdTests(TestCase):
+    """
+    Short codes are unique, skip the random codes of rows created before
+    the allocator, and survive rolled back transactions.
+    """
+
+    def setUp(self):
+        short_ids._leases.clear()
+        self.addCleanup(short_ids._leases.clear)
+
+    def upcoming_codes(self, count):
+        """The next ``count`` codes of the Item sequence."""
+        namespace = short_ids._namespace(Item)
+        start = IdSequence.objects.filter(namespace=namespace).values_list('next_value', flat=True).first() or 0
+        return [short_ids.encode(short_ids.permute(namespace, counter)) for counter in range(start, start + count)]
+
+    def test_codes_are_unique_across_leases(self):
+        codes = short_ids.allocate_codes(Item, 50) + short_ids.allocate_codes(Item, 50)
+        codes += [short_ids.next_code(Item) for _ in range(3 * short_ids.LEASE_SIZE)]
+        self.assertEqual(len(set(codes)), len(codes))
+        self.assertTrue(all(len(code) == short_ids.CODE_LENGTH for code in codes))
+
+    def test_legacy_codes_are_skipped(self):
+        legacy = self.upcoming_codes(10)[::3]
+        for code in legacy:
+            Item.objects.create(sku=code, name=f"Legacy {code}", price=10)
+        codes = short_ids.allocate_codes(Item, 10)
+        self.assertEqual(len(set(codes)), 10)
+        self.assertFalse(set(codes) & set(legacy))
+        self.assertFalse(Item.objects.filter(pk__in=codes).exists())
+
+
+class ShortIdLeaseTests(TransactionTestCase):
+    """
+    Leases committed apart from the caller's transaction stay reserved when
+    it rolls back, and codes keep being issued afterwards.
+    """
+
+    def setUp(self):
+        short_ids._leases.clear()
+        self.addCleanup(short_ids._leases.clear)
+
+    def test_rollback_keeps_the_lease(self):
+        namespace = short_ids._namespace(Item)
+        with mock.patch.object(short_ids, 'leases_commit_separately', return_value=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                Item.objects.create(name="Rolled back", price=10)
+                raise ValueError
+            leased = IdSequence.objects.get(namespace=namespace).next_value
+            items = [Item.objects.create(name=f"Book {index}", price=10) for index in range(short_ids.LEASE_SIZE + 1)]
+        self.assertEqual(leased, short_ids.LEASE_SIZE)
+        self.assertEqual(len({item.sku for item in items}), len(items))
+        self.assertEqual(IdSequence.objects.get(namespace=namespace).next_value, 2 * short_ids.LEASE_SIZE)
+
+    def test_rollback_in_the_callers_transaction(self):
+        # Leased in the caller's transaction (SQLite), the code is released with it
+        with self.assertRaises(ValueError), transaction.atomic():
+            rolled_back = Item.objects.create(name="Rolled back", price=10).sku
+            raise ValueError
+        with transaction.atomic():
+            item = Item.objects.create(name="Kept", price=10)
+        self.assertEqual(item.sku, rolled_back)
+        self.assertEqual(list(Item.objects.values_list('sku', flat=True)), [rolled_back])
+
+
+class ImageFetcherTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def test_fetches_concurrently_into_content_addressed_cache(self):
+        with ImageServer() as server:
+            urls = [f"{server.base_url}/images/{index % 5}-{index}.png" for index in range(20)]
+            paths = ImageFetcher(self.cache_dir, workers=4).fetch_all(urls)
+
+        self.assertEqual(len(server.hits), 20)
+        self.assertTrue(all(path and path.exists() for path in paths.values()))
+        # Identical content is stored once
+        self.assertEqual(len({path for path in paths.values()}), 5)
+
+    def test_rerun_and_resume_skip_cached_images(self):
+        with ImageServer() as server:
+            urls = [f"{server.base_url}/images/{index}.png" for index in range(6)]
+            ImageFetcher(self.cache_dir).fetch_all(urls[:3])
+            # A new fetcher (i.e. a new run) resumes from the manifest
+            paths = ImageFetcher(self.cache_dir).fetch_all(urls)
+
+        self.assertEqual(set(server.hits.values()), {1})
+        self.assertEqual(len(paths), 6)
+
+    def test_retries_server_errors_and_reports_failures(self):
+        with ImageServer() as server:
+            flaky, missing = f"{server.base_url}/flaky/a.png", f"{server.base_url}/missing/b.png"
+            paths = ImageFetcher(self.cache_dir, retries=2).fetch_all([flaky, missing])
+
+        self.assertEqual(server.hits['/flaky/a.png'], 2)
+        self.assertIsNotNone(paths[flaky])
+        self.assertIsNone(paths[missing])
+        # Failed downloads are not checkpointed, so a rerun tries them again
+        self.assertNotIn(missing, ImageFetcher(self.cache_dir).manifest)
+
+
+class ImportImagesTests(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.addCleanup(shutil.rmtree, self.media_root)
+
+    def test_import_attaches_fetched_images(self):
+        rows = [
+            {'name': f"Book {index}", 'ISBN': f"97800000000{index}", 'price': '500', 'image-src': f"/images/{index}.png"}
+            for index in range(3)
+        ]
+        with override_settings(MEDIA_ROOT=self.media_root), ImageServer() as server:
+            with self.captureOnCommitCallbacks(execute=True):
+                report = import_items(rows, images=ImageFetcher(self.cache_dir), image_base_url=server.base_url)
+            rerun = import_items(rows, images=ImageFetcher(self.cache_dir), image_base_url=server.base_url)
+
+            self.assertEqual((report['created'], report['images']), (3, 3))
+            self.assertEqual((rerun['unchanged'], rerun['images']), (3, 0))
+            self.assertEqual(len(server.hits), 3)
+            for item in Item.objects.all():
+                self.assertTrue(item.image.name.startswith('Shop/Items/'))
+                self.assertTrue(item.image.storage.exists(item.image.name))
+
+    def test_failed_batch_writes_no_images(self):
+        rows = [{'name': "Book", 'ISBN': '9780000000001', 'price': '500', 'image-src': '/images/0.png'}]
+        with override_settings(MEDIA_ROOT=self.media_root), ImageServer() as server:
+            with mock.patch.object(Item.objects, 'bulk_create', side_effect=DatabaseError("Lost connection")):
+                with self.captureOnCommitCallbacks(execute=True):
+                    report = import_items(rows, images=ImageFetcher(self.cache_dir), image_base_url=server.base_url)
+
+        self.assertFalse(report['complete'])
+        self.assertEqual([files for _, _, files in os.walk(self.media_root) if files], [])
+
+
+class ImportItemsTests(TestCase):
+    """
+    Malformed catalog input is reported row by row instead of failing the import.
+    """
+
+    def upload(self, name, content):
+        file = io.BytesIO(content)
+        file.name = name
+        return file
+
+    def test_rows_must_be_objects(self):
+        client = APIClient()
+        client.force_authenticate(Individual.objects.create_user(username='admin', email='admin@example.com', password='x', is_staff=True))
+        response = client.post('/items/bulk/', {'rows': [1, 2]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['row'] for error in response.json()['errors']], [1, 2])
+
+    def test_invalid_ndjson_lines_are_reported(self):
+        content = b'{"name": "Book 1", "price": "100"}\n{"name": \n{"name": "Book 2", "price": "120"}\n'
+        report = import_items(iter_rows(self.upload('items.ndjson', content), row_errors=True))
+        self.assertEqual((report['rows'], report['created'], report['complete']), (3, 2, True))
+        self.assertEqual(report['errors'][0]['row'], 2)
+        self.assertIn('not valid JSON', report['errors'][0]['errors']['file'][0])
+
+    def test_unreadable_files_are_reported(self):
+        report = import_items(iter_rows(self.upload('items.xlsx', b'not a workbook')))
+        self.assertEqual((report['rows'], report['created'], report['complete']), (1, 0, False))
+        self.assertEqual(list(report['errors'][0]['errors']), ['file'])
+
+        # Batches read before a badly encoded line are committed, and the report says so
+        rows = b''.join(b'Book %d,100\n' % index for index in range(5))
+        report = import_items(iter_rows(self.upload('items.csv', b'name,price\n' + rows + b'Book \xff,120\nBook 9,90\n')), batch_size=2)
+        self.assertEqual((report['created'], report['errors'][0]['row']), (5, 6))
+        self.assertEqual((report['complete'], report['committed_through']), (False, 5))
+
+    def test_reimport_updates_rows_without_isbn(self):
+        rows = [
+            {'name': "Atlas", 'publisher': "Longhorn", 'price': '300'},
+            {'name': "Atlas", 'publisher': "Oxford", 'price': '320'},
+            {'name': "Reader", 'ISBN': '9780000000001', 'price': '150'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(import_items(rows)['created'], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            report = import_items([{**rows[0], 'price': '350'}, *rows[1:]])
+
+        self.assertEqual((report['created'], report['updated'], report['unchanged']), (0, 1, 2))
+        self.assertEqual(Item.objects.count(), 3)
+        self.assertEqual(Item.objects.get(name="Atlas", publisher="Longhorn").price, Decimal('350'))
+
+        # The same name and publisher twice in one file is reported like a repeated ISBN
+        report = import_items([rows[0], rows[0]])
+        self.assertEqual(report['errors'], [{'row': 2, 'errors': {'name': ["Duplicate of row 1."]}}])
+        self.assertEqual(Item.objects.count(), 3)
+
+    def test_legacy_xls_is_rejected(self):
+        client = APIClient()
+        client.force_authenticate(Individual.objects.create_user(username='admin', email='admin@example.com', password='x', is_staff=True))
+        response = client.post('/items/bulk/', {'file': self.upload('items.xls', b'\xd0\xcf\x11\xe0')}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('.xls', response.json()['detail'])
+        self.assertFalse(Item.objects.exists())
+
+
+class CatalogCacheTests(TestCase):
+    """
+    Cached catalog reads are shared only by requests that would render the
+    same body, absolute pagination links included.
+    """
+
+    def setUp(self):
+        cache.clear()
+        for name in ("First", "Second"):
+            Item.objects.create(name=name, price=10)
+
+    def test_hosts_do_not_share_entries(self):
+        first = self.client.get('/items/?page_size=1', HTTP_HOST='shop.example.com')
+        second = self.client.get('/items/?page_size=1', HTTP_HOST='api.example.com')
+        self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'MISS'))
+        self.assertTrue(second.json()['next'].startswith('http://api.example.com/items/'))
+        self.assertEqual(self.client.get('/items/?page_size=1', HTTP_HOST='api.example.com')['X-Cache'], 'HIT')
+
+
+@override_settings(CATALOG_CACHE_MAX_AGE=120)
+class VersionedReadTests(TestCase):
+    """
+    Anonymous catalog reads carry an ETag that changes with every write, and
+    are answered with 304 from the versions alone when it still matches.
+    """
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            Item.objects.create(name="First", price=10)
+
+    def test_headers(self):
+        response = self.client.get('/items/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['ETag'], r'^"[0-9a-f]{20}"$')
+        self.assertEqual(set(response['Cache-Control'].split(', ')), {'public', 'max-age=120'})
+        self.assertLessEqual({'Accept', 'Authorization'}, set(response['Vary'].split(', ')))
+
+    def test_not_modified(self):
+        etag = self.client.get('/items/')['ETag']
+        for header in (etag, f'W/{etag}', f'"other", {etag}'):
+            # Only the resource versions are read
+            with self.assertNumQueries(1):
+                response = self.client.get('/items/', HTTP_IF_NONE_MATCH=header)
+            self.assertEqual((response.status_code, response.content, response['ETag']), (304, b'', etag))
+        self.assertEqual(self.client.get('/items/', HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_write_changes_the_etag(self):
+        etag = self.client.get('/items/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Item.objects.create(name="Second", price=20)
+        response = self.client.get('/items/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_urls_have_their_own_etags(self):
+        self.assertNotEqual(self.client.get('/items/')['ETag'], self.client.get('/items/?page_size=1')['ETag'])
+
+    def test_authenticated_reads_are_not_versioned(self):
+        client = APIClient()
+        client.force_authenticate(Individual.objects.create_user(username='customer', email='customer@example.com', password='x'))
+        response = client.get('/items/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Cache-Control') and 'public' in response['Cache-Control'])
+
+
+class SparseFieldsTests(TestCase):
+    """
+    `?fields=` and `?exclude=` narrow item reads, down to the columns queried.
+    """
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.item = Item.objects.create(name="Atlas", price=10, description="World maps")
+
+    def read(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        select = next(query['sql'] for query in queries.captured_queries if 'FROM "products_item"' in query['sql'])
+        return response.json(), select.split(' FROM ')[0]
+
+    def test_fields(self):
+        data, columns = self.read('/items/?fields=sku,name&fields=price')
+        self.assertEqual(set(data['results'][0]), {'sku', 'name', 'price'})
+        self.assertIn('"products_item"."price"', columns)
+        self.assertNotIn('"products_item"."description"', columns)
+
+    def test_exclude(self):
+        data, columns = self.read('/items/?exclude=description,image')
+        self.assertEqual(set(data['results'][0]), {field.name for field in Item._meta.concrete_fields} - {'description', 'image'})
+        self.assertNotIn('"products_item"."description"', columns)
+        self.assertIn('"products_item"."price"', columns)
+
+    def test_retrieve(self):
+        data, columns = self.read(f'/items/{self.item.sku}/?fields=price')
+        self.assertEqual(data, {'price': '10.00'})
+        self.assertNotIn('"products_item"."name"', columns)
+
+    def test_unknown_names_are_ignored(self):
+        data, _ = self.read('/items/?fields=name,bogus')
+        self.assertEqual(data['results'], [{'name': "Atlas"}])
+        data, _ = self.read('/items/?exclude=bogus')
+        self.assertEqual(data['results'], self.read('/items/')[0]['results'])
+
+    def test_writes_and_nested_items_are_not_narrowed(self):
+        response = self.client.post('/items/?fields=name', {'name': "Globe", 'price': '25.00'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('sku', response.json())
+        school = Organization.objects.create(username='school', email='school@example.com', organization_name='School', address='Nairobi')
+        collection = Collection.objects.create(name="Maps", school=school, grade='Grade 4')
+        CollectionItem.objects.create(collection=collection, item=self.item)
+        data = self.client.get(f'/collections/{collection.pk}/?fields=items').json()
+        self.assertEqual(set(data), {'items'})
+        self.assertEqual(set(data['items'][0]), {'item', 'quantity', 'substitutable'})
+
+
+class CatalogCacheStampedeTests(TransactionTestCase):
+    """
+    Concurrent misses of one entry render it once, however long the
+    rendering takes.
+    """
+
+    def setUp(self):
+        cache.clear()
+        Item.objects.create(name="First", price=10)
+
+    def test_concurrent_misses_render_once(self):
+        renders, results = [], []
+        barrier = threading.Barrier(6)
+        original = ItemViewSet.list
+
+        def slow_list(view, request, *args, **kwargs):
+            renders.append(request.path)
+            time.sleep(0.5)
+            return original(view, request, *args, **kwargs)
+
+        def read():
+            try:
+                barrier.wait()
+                results.append(Client().get('/items/')['X-Cache'])
+            finally:
+                connection.close()
+
+        with mock.patch.object(ItemViewSet, 'list', slow_list):
+            threads = [threading.Thread(target=read) for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(renders, ['/items/'])
+        self.assertEqual(sorted(results), ['HIT'] * 5 + ['MISS'])
+
+
+class SearchTests(TestCase):
+    """
+    Search results are paged with cursors on (relevance, sku), like every
+    other list.
+    """
+
+    def setUp(self):
+        cache.clear()
+        # Equal names tie on relevance
+        for name in ("Oxford English 4", "Oxford English 4", "Oxford English 4", "English Revision", "Oxford Atlas"):
+            Item.objects.create(name=name, price=10)
+
+    def pages(self, url):
+        names = []
+        while url:
+            data = self.client.get(url).json()
+            names.extend(item['name'] for item in data['results'])
+            url = data['next']
+        return names
+
+    def test_cursor_pages(self):
+        names = self.pages('/items/?q=oxford+english&page_size=1')
+        self.assertEqual(names, self.pages('/items/?q=oxford+english&page_size=100'))
+        self.assertEqual(sorted(names), ["Oxford English 4"] * 3)
+
+    def test_any_word_fallback(self):
+        self.assertEqual(sorted(self.pages('/items/?q=english+dictionary&page_size=2')), ["English Revision"] + ["Oxford English 4"] * 3)
+
+
+class FacetCountTests(TestCase):
+    """
+    The facet-count cache stays exact however items are written, and search
+    facets count the search results only.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.english = Item.objects.create(name="Oxford English", price=10, category='Textbooks')
+        Item.objects.create(name="Oxford English Workbook", price=10, category='Workbooks')
+        Item.objects.create(name="Mathematics Workbook", price=10, category='Workbooks')
+
+    def assertCountsExact(self):
+        counts = facet_counts()
+        rebuild_facet_counts()
+        self.assertEqual(counts, facet_counts())
+
+    def test_search_facets(self):
+        data = self.client.get('/items/?q=english&facets=true').json()
+        self.assertEqual(data['facets']['category'], {'Textbooks': 1, 'Workbooks': 1})
+        data = self.client.get('/items/?q=english&category=Workbooks&facets=true').json()
+        self.assertEqual(data['facets']['category'], {'Textbooks': 1, 'Workbooks': 1})
+        self.assertEqual(data['facets']['grade'], {'All': 1})
+
+    def test_save_without_facet_values(self):
+        item = Item.objects.only('name').get(pk=self.english.pk)
+        item.category = 'Reference'
+        item.save()
+        self.assertEqual(facet_counts()['category'], {'Workbooks': 2, 'Reference': 1})
+        self.assertCountsExact()
+
+    def test_delete_without_facet_values(self):
+        Item.objects.only('name').get(pk=self.english.pk).delete()
+        self.assertEqual(facet_counts()['category'], {'Workbooks': 2})
+        self.assertCountsExact()
+
+    def test_overwrite_with_new_instance(self):
+        Item(sku=self.english.sku, name="Oxford English", price=10, category='Reference').save()
+        self.assertEqual(facet_counts()['category'], {'Workbooks': 2, 'Reference': 1})
+        self.assertCountsExact()
+
+
+class ItemNeighborTests(TestCase):
+    """
+    The neighbor table is kept equal to a full re-rank as items change.
+    """
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.items = [
+                Item.objects.create(name=f"Reader {index}", price=100 + 10 * index, category='Textbooks', tag='Readers')
+                for index in range(12)
+            ]
+
+    def table(self):
+        return list(ItemNeighbor.objects.order_by('item', 'kind', 'rank').values_list('item', 'kind', 'rank', 'neighbor'))
+
+    def assertTableExact(self):
+        table = self.table()
+        rebuild_item_neighbors()
+        self.assertEqual(table, self.table())
+
+    def test_edits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.items[3].price = 1000
+            self.items[3].save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Item.objects.only('name').get(pk=self.items[7].pk).delete()
+        self.assertTableExact()
+
+    def test_rewrite_replaces_lists(self):
+        # A second refresh of the same lists (e.g. a concurrent one) replaces them
+        sku, others = self.items[0].sku, [item.sku for item in self.items[9:]]
+        self.assertEqual(store_neighbors(SUBSTITUTE, {sku: others}), 1)
+        self.assertEqual(store_neighbors(SUBSTITUTE, {sku: others[::-1]}), 1)
+        self.assertEqual(
+            list(ItemNeighbor.objects.filter(item=sku, kind=SUBSTITUTE).order_by('rank').values_list('neighbor', flat=True)),
+            others[::-1],
+        )
+
+    def test_substitutes_have_their_own_limit(self):
+        # Alone in their clustering groups, so all in one substitute group of 15
+        with self.captureOnCommitCallbacks(execute=True):
+            for index in range(15):
+                Item.objects.create(name=f"Atlas {index}", price=300 + index, category='Atlases', tag='Maps', subject=f"Subject {index}")
+        atlas = Item.objects.get(name="Atlas 0")
+        self.assertEqual(len(atlas.get_substitute_or_suggestion(True)), NEIGHBOR_LIMITS[SUBSTITUTE])
+        self.assertEqual(len(self.items[0].get_substitute_or_suggestion(False)), NEIGHBOR_LIMITS[SUGGESTION])
+
+    def test_collection_alternatives(self):
+        school = Organization.objects.create(username='school', email='school@example.com', organization_name='School', address='Nairobi')
+        collection = Collection.objects.create(name="Readers", school=school, grade='Grade 4')
+        CollectionItem.objects.bulk_create([
+            CollectionItem(collection=collection, item=item, substitutable=index % 2 == 0)
+            for index, item in enumerate(self.items)
+        ])
+        # Resource versions, the collection, its lines, their substitutes, their suggestions
+        with self.assertNumQueries(5):
+            response = self.client.get(f"/collections/{collection.pk}/alternatives/")
+        lines = response.json()['items']
+        self.assertEqual([line['item'] for line in lines], [item.sku for item in self.items])
+        self.assertEqual({line['kind'] for line in lines}, {SUBSTITUTE, SUGGESTION})
+        for index, (line, item) in enumerate(zip(lines, self.items)):
+            substitutes = item.get_substitute_or_suggestion(True) if index % 2 == 0 else None
+            kind, expected = (SUBSTITUTE, substitutes) if substitutes else (SUGGESTION, item.get_substitute_or_suggestion(False))
+            self.assertEqual(
+                (line['kind'], [alternative['sku'] for alternative in line['alternatives']]),
+                (kind, [other.sku for other in expected]),
+            )
+
+    def test_import_can_skip_neighbors(self):
+        before = self.table()
+        report = import_items([{'name': "Reader extra", 'ISBN': '9780000000999', 'price': '155', 'category': 'Textbooks', 'tag': 'Readers'}], refresh_neighbors=False)
+        self.assertEqual((report['created'], self.table()), (1, before))
+
+
+class CollectionPackTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        school = Organization.objects.create(username='school', email='school@example.com', organization_name='School', address='Nairobi')
+        cls.items = [
+            Item.objects.create(name=f"Book {index}", price=100 + 10 * index, category='Textbooks', subject=f"Subject {index % 4}", tag='Book')
+            for index in range(40)
+        ]
+        cls.booklist = Collection.objects.create(name='Booklist', school=school, grade='Grade 4')
+        cls.short_list = Collection.objects.create(name='Short list', school=school, grade='Grade 5')
+        CollectionItem.objects.bulk_create(
+            [CollectionItem(collection=cls.booklist, item=item, substitutable=True) for item in cls.items]
+            + [CollectionItem(collection=cls.short_list, item=item, substitutable=True) for item in cls.items[:10]]
+        )
+
+    def expected_alternative(self, item):
+        candidates = [
+            other.sku for other in self.items
+            if other.subject == item.subject and other.price <= item.price and other.sku != item.sku
+        ]
+        return min(candidates, default=None)
+
+    def test_alternatives_are_resolved_with_constant_queries(self):
+        # Stored packs, lines with their alternatives, the alternative items, the insert
+        with self.assertNumQueries(4):
+            packs = collection_packs(self.booklist)
+        with self.assertNumQueries(4):
+            collection_packs(self.short_list)
+
+        replaced = {
+            line['replaces']: line['item'] for pack in packs.values() for line in pack.lines if line['replaces']
+        }
+        expected = {item.sku: self.expected_alternative(item) for item in self.items}
+        self.assertTrue(replaced)
+        for sku, alternative in replaced.items():
+            self.assertEqual(alternative, expected[sku])
+        # Every line with an alternative is replaced in exactly one pack
+        self.assertEqual(set(replaced), {sku for sku, alternative in expected.items() if alternative})
+
+    def test_apply_cluster_uses_constant_queries(self):
+        # The collection, the pack build and the pack's items
+        with self.assertNumQueries(6):
+            response = self.client.post(f"/collections/{self.booklist.pk}/apply-cluster/", {'cluster_name': PACK_LABELS[1]}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['items']), 40)
+        # Later requests read the stored pack
+        with self.assertNumQueries(3):
+            self.client.post(f"/collections/{self.booklist.pk}/apply-cluster/", {'cluster_name': PACK_LABELS[2]}, content_type='application/json')
+
+    def test_price_change_drops_affected_packs(self):
+        collection_packs(self.booklist)
+        item = self.items[5]
+        item.price = 1
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        self.assertFalse(CollectionPack.objects.filter(collection=self.booklist).exists())
+
+        packs = collection_packs(self.booklist)
+        self.assertEqual(packs[PACK_LABELS[0]].lines[5]['item'], item.sku)
+
+    def test_discount_change_drops_affected_packs(self):
+        before = collection_packs(self.short_list)[PACK_LABELS[0]].discounted_total
+        item = Item.objects.get(pk=self.items[9].pk)
+        item.discount = 50
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        self.assertFalse(CollectionPack.objects.filter(collection=self.short_list).exists())
+        # The most expensive line is only replaced in the Premium pack, so the Economy pack keeps it
+        after = collection_packs(self.short_list)[PACK_LABELS[0]].discounted_total
+        self.assertEqual(after, before - item.price / 2)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+class CollectionQueryBudgetTests(TestCase):
+    """
+    Collection reads cost a fixed number of queries, however many
+    collections, schools and items they list (responses are not cached here,
+    so every request renders).
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.items = [Item.objects.create(name=f"Book {index}", price=100 + index) for index in range(6)]
+        cls.schools = [
+            Organization.objects.create(username=f"school{index}", email=f"school{index}@example.com", organization_name=f"School {index}", address='Nairobi')
+            for index in range(3)
+        ]
+
+    def add_collections(self, count):
+        grades = [grade for grade, _ in Collection.GRADE_CHOICES]
+        for school in self.schools:
+            start = Collection.objects.filter(school=school).count()
+            for grade in grades[start:start + count]:
+                collection = Collection.objects.create(name=f"{grade} list", school=school, grade=grade)
+                CollectionItem.objects.bulk_create([CollectionItem(collection=collection, item=item) for item in self.items])
+
+    def assertQueryBudget(self, url, budget):
+        """Check the budget with few and with many collections."""
+        for count in (1, 4):
+            self.add_collections(count)
+            path = url()
+            with self.assertNumQueries(budget):
+                response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+
+    def test_list(self):
+        # Resource versions, the page of collections, their items
+        self.assertQueryBudget(lambda: '/collections/?page_size=100', 3)
+
+    def test_retrieve(self):
+        self.assertQueryBudget(lambda: f"/collections/{Collection.objects.latest('pk').pk}/", 3)
+
+    def test_summary(self):
+        # Resource versions, the collections with their schools, the schools' collections
+        self.assertQueryBudget(lambda: '/collections/summary/?page_size=100', 3)
+
+    def test_school_collections(self):
+        # Resource versions, the school, its collections, their items
+        self.assertQueryBudget(lambda: f"/collections/{self.schools[0].pk}/school/", 4)
@@ -0,0 +1,103 @@
+import hashlib
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework.response import Response
+from .deferred import defer
+
+# Public resources whose changes are counted
+RESOURCES = ('items', 'collections', 'adverts')
+
+
+def bump_versions(*resources):
+    """
+    Queue a version bump of the given resources for when the current
+    transaction commits (see deferred.defer).
+
+    However many rows a transaction writes, each resource is bumped once.
+    Bumping after the commit means an ETag never names data that is not
+    visible yet.
+    """
+    defer(flush_versions, resources=resources)
+
+
+def flush_versions(resources):
+    """Increment the counters of the queued resources."""
+    from .models import ResourceVersion
+
+    for resource in sorted(set(resources)):
+        if ResourceVersion.objects.filter(resource=resource).update(version=F('version') + 1):
+            continue
+        try:
+            with transaction.atomic():
+                ResourceVersion.objects.create(resource=resource, version=1)
+        except IntegrityError:
+            # Created concurrently in the meantime
+            ResourceVersion.objects.filter(resource=resource).update(version=F('version') + 1)
+
+
+def resource_versions(resources):
+    """
+    Read the current versions of some resources with one query.
+
+    Returns:
+        tuple: The version of each resource, in the given order (0 if never bumped).
+    """
+    from .models import ResourceVersion
+
+    versions = dict(ResourceVersion.objects.filter(resource__in=resources).values_list('resource', 'version'))
+    return tuple(versions.get(resource, 0) for resource in resources)
+
+
+class NotModified(Exception):
+    """Raised to short-circuit a read whose cached copy is still current."""
+
+
+class VersionedReadMixin:
+    """
+    ETag and `If-None-Match` support for public read endpoints.
+
+    Anonymous GET responses of `versioned_actions` carry a strong ETag built
+    from the versions of `version_resources`, the absolute URL (scheme and
+    host included, as pagination links are absolute) and the media type,
+    and a public `Cache-Control` header (`CATALOG_CACHE_MAX_AGE` seconds).
+    A request whose `If-None-Match` matches the current ETag is answered
+    with 304 before any query on the resource's tables runs.
+    """
+    version_resources = ()
+    versioned_actions = ('list', 'retrieve')
+
+    def get_etag(self, request):
+        """The ETag of the response to an anonymous read, or None if it is not versioned."""
+        if request.method not in ('GET', 'HEAD') or self.action not in self.versioned_actions:
+            return None
+        if request.user and request.user.is_authenticated:
+            return None
+        versions = '.'.join(str(version) for version in resource_versions(self.version_resources))
+        key = f"{versions}|{request.build_absolute_uri()}|{request.accepted_media_type}"
+        return f'"{hashlib.sha1(key.encode()).hexdigest()[:20]}"'
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = self.get_etag(request)
+        if self.etag is not None:
+            # Proxies that compress responses weaken the ETag; compare weakly
+            tags = {tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))}
+            if self.etag in tags or '*' in tags:
+                raise NotModified()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            return Response(status=304)
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        etag = getattr(self, 'etag', None)
+        if etag is not None and response.status_code in (200, 304):
+            response['ETag'] = etag
+            patch_cache_control(response, public=True, max_age=settings.CATALOG_CACHE_MAX_AGE)
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
@@ -1,28 +1,100 @@
 from rest_framework import viewsets, status
 from .models import Item, Collection, CollectionItem
-from .serializers import ItemSerializer, CollectionSerializer, CollectionSummarySerializer, DynamicCollectionSerializer
+from .serializers import ItemSerializer, CollectionSerializer, CollectionSummarySerializer, CollectionPackSerializer, DynamicCollectionSerializer, LineAlternativesSerializer
+from .clustering import recluster_items, PACK_LABELS
+from .importer import import_items
+from .spreadsheets import iter_rows, detect_format, unsupported_format_message, SUPPORTED_FORMATS
+from .search import SEARCH_ORDERING, search_items
+from .facets import FACET_FIELDS, facet_counts
+from .packs import collection_packs, pack_items
+from .neighbors import line_alternatives
+from .response_cache import CachedReadMixin
+from hbs.serializers import requested_fields
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import serializers
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from userManager.permissions import CustomUserPermission
 from userManager.models import Organization
 from rest_framework.exceptions import NotFound
-from sklearn.cluster import KMeans
-import numpy as np
 from rest_framework.exceptions import ValidationError
 from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import status
 from rest_framework.response import Response
 
-class ItemViewSet(viewsets.ModelViewSet):
+class ItemViewSet(CachedReadMixin, viewsets.ModelViewSet):
     """
     ViewSet for managing Item objects.
     Supports all CRUD operations for items in the collection.
+    Anonymous reads carry ETags and are served from the response cache.
     """
     queryset = Item.objects.all()
     serializer_class = ItemSerializer
     permission_classes = [AllowAny]
+    version_resources = ('items',)
+
+    def facet_filters(self):
+        """
+        Read the facet filters of the request.
+
+        Each of category, grade, study_level, curriculum, subject and cluster
+        may be given several values, repeated or comma-separated.
+
+        Returns:
+            dict: Field -> list of selected values, for the filtered fields only.
+        """
+        filters = {}
+        for field in FACET_FIELDS:
+            values = [value.strip() for raw in self.request.query_params.getlist(field) for value in raw.split(',')]
+            if any(values):
+                filters[field] = [value for value in values if value]
+        return filters
+
+    def search_query(self):
+        """The free-text search of the request (`?q=`), or an empty string."""
+        return self.request.query_params.get('q', '').strip() if self.action == 'list' else ''
+
+    @property
+    def keyset_ordering(self):
+        """Search results are paged by relevance, other lists by the model's ordering."""
+        return SEARCH_ORDERING if self.search_query() else None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            for field, values in self.facet_filters().items():
+                queryset = queryset.filter(**{f'{field}__in': values})
+        if self.action in ('list', 'retrieve') and requested_fields(self.request) != (None, set()):
+            # Only fetch the columns of the requested sparse fieldset
+            columns = {field.name for field in Item._meta.concrete_fields}
+            queryset = queryset.only(*(name for name in self.get_serializer().fields if name in columns))
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        """
+        List items in cursor pages, or search them with `?q=`.
+
+        Items can be filtered by category, grade, study_level, curriculum,
+        subject and cluster. Searches match the name, description, subject,
+        publisher and ISBN and return relevance-ranked results, in cursor
+        pages like every other list. With `?facets=true` the response also
+        carries the item count of every facet value under the current filters
+        and search.
+        """
+        query = self.search_query()
+        if query:
+            page = self.paginate_queryset(search_items(self.filter_queryset(self.get_queryset()), query))
+            response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        else:
+            response = super().list(request, *args, **kwargs)
+
+        if request.query_params.get('facets', '').lower() in ('1', 'true', 'yes'):
+            data = response.data if isinstance(response.data, dict) else {'results': response.data}
+            # Searches are counted within their results
+            items = search_items(Item.objects.all(), query) if query else None
+            response.data = {**data, 'facets': facet_counts(self.facet_filters(), items)}
+        return response
 
     @action(detail=False, methods=['post'], url_path='reassign-clusters')
     def reassign_clusters(self, request):
@@ -31,28 +103,69 @@ class ItemViewSet(viewsets.ModelViewSet):
         on their tag, category, subject, grade, and curriculum.
         """
         try:
-            # Retrieve all items to reassign clusters
-            items = Item.objects.all()
-
             # Ensure there are items in the database
-            if not items.exists():
+            if not Item.objects.exists():
                 return Response({'detail': 'No items available to reassign clusters.'}, status=status.HTTP_404_NOT_FOUND)
-            
-            # Reassign clusters for each item
-            for item in items:
-                item.reassign_clusters()  # type: ignore # Call the method to reassign clusters
 
-            return Response({'detail': 'Clusters reassigned successfully for all items.'}, status=status.HTTP_200_OK)
+            # Recluster every (tag, category, subject, grade, curriculum) group once
+            report = recluster_items()
+
+            return Response({'detail': 'Clusters reassigned successfully for all items.', **report}, status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response({'detail': f'An error occurred: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['post'], url_path='bulk', permission_classes=[IsAdminUser])
+    def bulk(self, request):
+        """
+        Bulk import catalog rows, upserting items by ISBN (or by name and
+        publisher for rows without one).
+
+        Accepts either an uploaded `file` (CSV, XLSX or NDJSON, detected from the
+        file name or given as `format`) or a JSON list of `rows`. Any other form
+        field is used as a default for rows that leave it blank. The import
+        report lists the rejected rows, and is returned with a 400 if no row
+        could be imported or the import stopped part way.
+        """
+        upload = request.FILES.get('file')
+        if upload is not None:
+            file_format = request.data.get('format') or detect_format(upload.name)
+            if file_format not in SUPPORTED_FORMATS:
+                return Response({'detail': unsupported_format_message(file_format)}, status=status.HTTP_400_BAD_REQUEST)
+            rows = iter_rows(upload.file, file_format, row_errors=True)
+        else:
+            rows = request.data.get('rows')
+            if not isinstance(rows, list):
+                return Response({'detail': 'Provide a file or a list of rows.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        defaults = {key: value for key, value in request.data.items() if key not in ('file', 'format', 'rows')}
+        report = import_items(rows, defaults=defaults)
+        # Nothing usable was sent, or the import stopped part way (see committed_through)
+        rejected = report['errors'] and not (report['created'] or report['updated'] or report['unchanged'])
+        failed = rejected or not report['complete']
+        return Response(report, status=status.HTTP_400_BAD_REQUEST if failed else status.HTTP_200_OK)
 
 
-class CollectionViewSet(viewsets.ModelViewSet):
+class CollectionViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
     permission_classes = [AllowAny]
+    version_resources = ('collections', 'items')  # Collections nest their items
+    versioned_actions = ('list', 'retrieve', 'summary', 'get_school_collections', 'packs', 'alternatives')
+
+    def get_queryset(self):
+        """
+        Plan the queries of each read, so a response costs a fixed number of
+        queries however many collections it lists.
+        """
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'get_school_collections'):
+            # Items are nested in their compact form, so only those columns are loaded
+            queryset = queryset.prefetch_related(Prefetch('items', queryset=CollectionItem.with_item_summaries()))
+        elif self.action == 'summary':
+            # Each collection nests its school, which nests all of the school's collections
+            queryset = queryset.select_related('school').prefetch_related('school__organizations')
+        return queryset
 
 
     @action(detail=False, methods=['get'], url_path='summary')
@@ -60,9 +173,9 @@ class CollectionViewSet(viewsets.ModelViewSet):
         """
         Return collections without related items.
         """
-        collections = self.queryset
-        serializer = CollectionSummarySerializer(collections, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = CollectionSummarySerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['get'], url_path='school')
     def get_school_collections(self, request, pk=None):
@@ -70,7 +183,7 @@ class CollectionViewSet(viewsets.ModelViewSet):
         Retrieve collections for the specified school.
         """
         school = self._get_school(pk)
-        collections = Collection.objects.filter(school=school)
+        collections = self.get_queryset().filter(school=school)
         serializer = CollectionSerializer(collections, many=True)
         return Response({
             'school_id': school.id,
@@ -87,6 +200,30 @@ class CollectionViewSet(viewsets.ModelViewSet):
         except Organization.DoesNotExist:
             raise NotFound(detail="School not found.")
 
+    @action(detail=True, methods=['get'], url_path='packs')
+    def packs(self, request, pk=None):
+        """
+        Return the Economy, Value and Premium packs of a collection with their totals.
+        """
+        collection = self.get_object()
+        packs = collection_packs(collection).values()
+        context = {**self.get_serializer_context(), 'items': pack_items(packs)}
+        serializer = CollectionPackSerializer(packs, many=True, context=context)
+        return Response({'collection_id': collection.id, 'packs': serializer.data})
+
+    @action(detail=True, methods=['get'], url_path='alternatives')
+    def alternatives(self, request, pk=None):
+        """
+        Return the substitutes (substitutable lines) or suggestions of each item of a collection.
+        """
+        collection = self.get_object()
+        lines = collection.items.order_by('id').values_list('item', 'substitutable')
+        alternatives = [
+            {'item': sku, 'kind': kind, 'alternatives': items} for sku, kind, items in line_alternatives(lines)
+        ]
+        serializer = LineAlternativesSerializer(alternatives, many=True)
+        return Response({'collection_id': collection.id, 'items': serializer.data})
+
     @action(detail=True, methods=['post'], url_path='apply-cluster')
     def apply_cluster(self, request, pk=None):
         """
@@ -103,56 +240,19 @@ class CollectionViewSet(viewsets.ModelViewSet):
     def _apply_price_cluster(self, collection, cluster_name):
         """
         Apply a price cluster (Economy, Value, Premium) to the items in a collection.
-        Items that are substitutable will be replaced according to the cluster logic.
-        """
-        items = collection.items.all()
-        prices = np.array([item.item.price for item in items]).reshape(-1, 1)
-
-        # Clustering using KMeans (dynamically adjust clusters if less than 3)
-        num_clusters = min(3, len(items))
-        kmeans = KMeans(n_clusters=num_clusters)
-        kmeans.fit(prices)
-        clusters = kmeans.predict(prices)
-
-        cluster_map = {0: 'Economy Pack', 1: 'Value Pack', 2: 'Premium Pack'}
-        selected_cluster = next(key for key, value in cluster_map.items() if value == cluster_name)
-
-        modified_items = []
-        for item, cluster in zip(items, clusters):
-            if cluster == selected_cluster and item.substitutable:
-                # If item is substitutable, replace with another item from the cluster
-                alternative_item = self._get_alternative_item(item.item, cluster_name)
-                if alternative_item:
-                    modified_items.append({
-                        'item': alternative_item,
-                        'quantity': item.quantity
-                    })
-                else:
-                    modified_items.append({
-                        'item': item.item,
-                        'quantity': item.quantity
-                    })
-            else:
-                modified_items.append({
-                    'item': item.item,
-                    'quantity': item.quantity
-                })
-
-        # Serialize the items using the ItemSerializer
+        Items that are substitutable are replaced as in the collection's precomputed pack.
+        """
+        if cluster_name not in PACK_LABELS:
+            raise ValidationError({"cluster_name": f"Must be one of: {', '.join(PACK_LABELS)}."})
+
+        pack = collection_packs(collection)[cluster_name]
+        items = Item.objects.filter(pk__in={line['item'] for line in pack.lines})
+
+        # Serialize the items using the ItemSerializer, building its fields once
+        serialized = {data['sku']: data for data in ItemSerializer(items, many=True).data}
         serialized_items = [
-            {"item": ItemSerializer(modified_item['item']).data, "quantity": modified_item['quantity']}
-            for modified_item in modified_items
+            {"item": serialized[line['item']], "quantity": line['quantity']}
+            for line in pack.lines
         ]
-        
-        return serialized_items
 
-    def _get_alternative_item(self, item, cluster_name):
-        """
-        Retrieve an alternative item for substitution within the same category, subject, and tag.
-        """
-        return Item.objects.filter(
-            category=item.category,
-            subject=item.subject,
-            tag=item.tag,
-            price__lte=item.price
-        ).exclude(pk=item.pk).first()
+        return serialized_items
@@ -145,11 +145,11 @@ class CustomUserSerializer(serializers.ModelSerializer):
         except EmailAddress.DoesNotExist:
             return False
 from order.models import OrderItem,Order
-from products.models import Item
+from products.models import Item, ITEM_SUMMARY_FIELDS
 class ItemSerializer(serializers.ModelSerializer):
     """
     Serializer for the Item model.
-    Converts Item instances to JSON and vice versa.
+    Converts Item instances to the compact representation used in payment histories.
     
     Meta:
         model: The model being serialized (Item).
@@ -157,9 +157,9 @@ class ItemSerializer(serializers.ModelSerializer):
     """
     class Meta:
         model = Item
-        fields = '__all__'
+        fields = ITEM_SUMMARY_FIELDS
 class OrderItemSerializer(serializers.ModelSerializer):
-    item = ItemSerializer()  # This will serialize the entire item object, not just the ID.
+    item = ItemSerializer()  # Compact item details rather than just the ID.
 
     class Meta:
         model = OrderItem
@@ -168,17 +168,10 @@ class OrderItemSerializer(serializers.ModelSerializer):
 
 class OrderSerializer(serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
-    order_status = serializers.SerializerMethodField()
 
     class Meta:
         model = Order
-        fields = '__all__'
-    def get_order_status(self, obj):
-        # Get the latest completed step, or return None if no steps are completed
-        latest_step = obj.steps.filter(completed=False).order_by('-timestamp').first()
-        if latest_step:
-            return latest_step.step_name
-        return None  # Or return a default value like 'Pending' if no steps are completed
+        fields = '__all__'  # order_status is the stored current step, read-only
 class PaymentSerializer(serializers.ModelSerializer):
     """
     Serializer for the Payment model.
@@ -1,3 +1,47 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
+from order.models import Order, OrderItem
+from order_tracking.models import OrderStep
+from paymentsApp.models import Payment
+from products.models import Collection, Item
+from .models import Individual, Organization
 
-# Create your tests here.
+
+class OrganizationSummaryQueryBudgetTests(TestCase):
+
+    def test_summary_uses_constant_queries(self):
+        grades = [grade for grade, _ in Collection.GRADE_CHOICES]
+        for count in (1, 4):
+            for index in range(count):
+                school = Organization.objects.create(username=f"school{count}-{index}", email=f"school{count}-{index}@example.com", organization_name=f"School {index}", address='Nairobi')
+                Collection.objects.bulk_create([Collection(id=f"C{count}{index}{number:03d}", name=grade, school=school, grade=grade) for number, grade in enumerate(grades[:count])])
+            # The page of organizations and their collections
+            with self.assertNumQueries(2):
+                response = self.client.get('/organizations/summary/?page_size=100')
+            self.assertEqual(response.status_code, 200)
+
+
+class PaymentHistoryQueryBudgetTests(TestCase):
+    """
+    The payment history nests each payment's order with its status and
+    lines, with a fixed number of queries.
+    """
+
+    def test_payments_use_constant_queries(self):
+        individual = Individual.objects.create_user(username='customer', email='customer@example.com', password='x')
+        client = APIClient()
+        client.force_authenticate(individual)
+        item = Item.objects.create(name="Book", price=10)
+        for count in (1, 4):
+            for index in range(count):
+                order = Order.objects.create(receipient_name="Customer", receipt_email='customer@example.com')
+                OrderItem.objects.create(order=order, item=item)
+                OrderStep.objects.create(order=order, step_name='shipped')
+                Payment.objects.create(user=individual, order=order, payment_method='mpesa', amount=10)
+            # The individual, their payments with their orders, the orders' lines,
+            # the individual's groups and permissions
+            with self.assertNumQueries(5):
+                response = client.get('/individuals/')
+            self.assertEqual(response.status_code, 200)
+            payments = response.json()['results'][0]['payments']
+            self.assertEqual({payment['order']['order_status'] for payment in payments}, {'shipped'})
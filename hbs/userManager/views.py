@@ -15,6 +15,9 @@ from rest_framework.permissions import IsAuthenticated
 from .permissions import CustomUserPermission
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from django.db.models import Prefetch
+from order.models import OrderItem
+from paymentsApp.models import Payment
 
 def confirm_email(request, key):
     """
@@ -75,14 +78,18 @@ class IndividualViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """
         Filters the Individual queryset to the currently authenticated user.
+        The payment history is prefetched with compact item details.
         """
-        return Individual.objects.filter(id=self.request.user.id)
+        payments = Payment.objects.select_related('order').prefetch_related(
+            Prefetch('order__items', queryset=OrderItem.with_item_summaries())
+        )
+        return Individual.objects.filter(id=self.request.user.id).prefetch_related(Prefetch('Customer', queryset=payments))
 
     def get_object(self):
         """
         Returns the Individual object of the currently authenticated user.
         """
-        return Individual.objects.get(id=self.request.user.id)
+        return self.get_queryset().get()
 
     def update(self, request, *args, **kwargs):
         """
@@ -110,8 +117,9 @@ class IndividualViewSet(viewsets.ModelViewSet):
         Custom endpoint to return individuals without the related items.
         """
         individuals = Individual.objects.all()
-        serializer = IndividualSummarySerializer(individuals, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(individuals)
+        serializer = IndividualSummarySerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 class OrganizationViewSet(viewsets.ModelViewSet):
     """
@@ -162,9 +170,11 @@ class OrganizationViewSet(viewsets.ModelViewSet):
         """
         Custom endpoint to return organizations without the related items.
         """
-        organizations = Organization.objects.all()
-        serializer = OrganizationSummarySerializer(organizations, many=True)
-        return Response(serializer.data)
+        # Each organization nests the summaries of its collections
+        organizations = Organization.objects.prefetch_related('organizations')
+        page = self.paginate_queryset(organizations)
+        serializer = OrganizationSummarySerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 class AdminViewSet(viewsets.ModelViewSet):
     """
     API viewset for viewing and editing Admin instances.
@@ -215,5 +225,6 @@ class AdminViewSet(viewsets.ModelViewSet):
         Custom endpoint to return admins without the related items.
         """
         admins = Admin.objects.all()
-        serializer = AdminSummarySerializer(admins, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(admins)
+        serializer = AdminSummarySerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)